@@ -0,0 +1,98 @@
+"""
+Wall-clock benchmark of the tiled Mapbox matrix fetcher against a local fake
+matrix server.
+
+    python -m benchmarks.bench_matrix_fetch --sizes 25 50 100 200 500 --latency 0.05
+
+The fake server answers the same URL format as the directions-matrix API
+(coordinates in the path, `sources`/`destinations` in the query string) with
+straight-line distances, after sleeping `--latency` seconds per request to
+stand in for the network round trip.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from management.matrix_fetcher import MapboxMatrixFetcher
+
+
+def _meters(a, b):
+    lon1, lat1 = a
+    lon2, lat2 = b
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlmb = phi2 - phi1, math.radians(lon2 - lon1)
+    h = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+
+class FakeMatrixHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    max_coordinates = MapboxMatrixFetcher.MAX_COORDINATES
+
+    def do_GET(self):
+        parsed = urlsplit(self.path)
+        coords = [tuple(map(float, c.split(","))) for c in unquote(parsed.path.rsplit("/", 1)[-1]).split(";")]
+        query = parse_qs(parsed.query)
+        if len(coords) > self.max_coordinates:
+            return self._reply(422, {"code": "InvalidInput", "message": "Too many coordinates"})
+
+        sources = [int(i) for i in query.get("sources", ["all"])[0].split(";")] \
+            if query.get("sources", ["all"])[0] != "all" else range(len(coords))
+        destinations = [int(i) for i in query.get("destinations", ["all"])[0].split(";")] \
+            if query.get("destinations", ["all"])[0] != "all" else range(len(coords))
+
+        time.sleep(self.latency)
+        distances = [[_meters(coords[s], coords[d]) for d in destinations] for s in sources]
+        self._reply(200, {"code": "Ok", "distances": distances})
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def random_points(n, seed=0):
+    rng = random.Random(seed)
+    return [(rng.uniform(29.6, 33.2), rng.uniform(34.3, 35.8)) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[25, 50, 100, 200, 500])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds of simulated latency per request")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    FakeMatrixHandler.latency = args.latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMatrixHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/directions-matrix/v1/mapbox/driving"
+
+    fetcher = MapboxMatrixFetcher(access_token="bench", base_url=base_url, max_workers=args.workers)
+    print(f"{'stops':>6} {'tiles':>6} {'seconds':>8} {'serial est.':>12}")
+    try:
+        for n in args.sizes:
+            points = random_points(n + 1)  # depot + stops
+            tiles = len(list(fetcher.tiles(list(range(n + 1)), list(range(n + 1)))))
+            start = time.perf_counter()
+            matrix = fetcher.fetch(points)
+            elapsed = time.perf_counter() - start
+            assert matrix is not None and matrix.shape == (n + 1, n + 1)
+            print(f"{n:>6} {tiles:>6} {elapsed:>8.2f} {tiles * args.latency:>12.2f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
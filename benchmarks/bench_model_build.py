@@ -0,0 +1,73 @@
+"""
+Micro-benchmark of building the PyVRP problem: the old Model + add_edge loop
+against building ProblemData directly from arrays.
+
+    python -m benchmarks.bench_model_build --sizes 50 200 500 1000 --repeat 3
+
+Times are the best of `--repeat` runs and cover only model construction,
+not solving.
+"""
+import argparse
+import time
+
+import numpy as np
+from pyvrp import Model
+
+from management.distance_providers import haversine_matrix
+from management.vrp_solver import build_problem_data
+
+
+def random_instance(n, seed=0):
+    rng = np.random.default_rng(seed)
+    points = np.column_stack([rng.uniform(29.6, 33.2, n + 1), rng.uniform(34.3, 35.8, n + 1)])
+    distances = (haversine_matrix(points, points) / 1000).astype(np.int64)
+    deliveries = rng.integers(1, 10, n)
+    return points, deliveries, distances
+
+
+def build_with_model(points, deliveries, capacity, num_vehicles, distances):
+    m = Model()
+    depot = m.add_depot(x=int(points[0, 1] * 100000), y=int(points[0, 0] * 100000))
+    m.add_vehicle_type(num_vehicles, capacity=capacity, start_depot=depot, end_depot=None)
+    clients = [
+        m.add_client(x=int(lon * 100000), y=int(lat * 100000), delivery=int(packages))
+        for (lat, lon), packages in zip(points[1:], deliveries)
+    ]
+    locations = [depot] + clients
+    for frm_idx, frm in enumerate(locations):
+        for to_idx, to in enumerate(locations):
+            if frm_idx != to_idx:
+                m.add_edge(frm, to, distance=int(distances[frm_idx, to_idx]))
+    return m.data()
+
+
+def build_direct(points, deliveries, capacity, num_vehicles, distances):
+    return build_problem_data(points[0], points[1:], deliveries, capacity, num_vehicles, distances)
+
+
+def best_time(build, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'stops':>6} {'add_edge (s)':>13} {'direct (s)':>11} {'speedup':>8}")
+    for n in args.sizes:
+        points, deliveries, distances = random_instance(n)
+        instance = (points, deliveries, 20, max(1, n // 20), distances)
+        old = best_time(build_with_model, *instance, repeat=args.repeat)
+        new = best_time(build_direct, *instance, repeat=args.repeat)
+        print(f"{n:>6} {old:>13.4f} {new:>11.4f} {old / new:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
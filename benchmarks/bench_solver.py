@@ -0,0 +1,207 @@
+"""
+Reproducible VRPSolver benchmark over synthetic and recorded days.
+
+    python -m benchmarks.bench_solver run --sizes 20 100 500 --output results.json
+    python -m benchmarks.bench_solver compare baseline.json results.json
+    python -m benchmarks.bench_solver record --from 2025-04-10 --to 2025-04-20
+
+`run` solves every instance offline (haversine distances, fixed seed and an
+iteration budget instead of a time limit), each in a fresh process, and writes
+matrix / model build / solve times, objective, routes used and peak memory as
+JSON. `compare` flags results that got slower, worse or bigger than a stored
+baseline and exits non-zero if any did. `record` saves real days from the
+database to benchmarks/instances/ so they become part of the suite.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+from types import SimpleNamespace
+
+import django
+
+from benchmarks import instances
+
+# Relative slowdown / degradation tolerated before `compare` flags a result
+DEFAULT_TOLERANCES = {"time": 0.25, "objective": 0.02, "memory": 0.2}
+# Time differences below this many seconds are noise, whatever the ratio
+MIN_TIME_DELTA = 0.05
+TIME_METRICS = ("matrix_s", "build_s", "solve_s")
+
+
+def _setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project_routes.settings")
+    django.setup()
+
+
+def run_instance(instance, max_iterations, seed=0):
+    """Solves one instance and returns its metrics (meant to run in a fresh process)."""
+    _setup_django()
+    from management.distance_providers import HaversineDistanceProvider
+    from management.utils import LocationSplitter
+    from management.vrp_solver import VRPSolver, build_problem_data
+
+    lat, lon = instance["depot"]
+    summary = SimpleNamespace(
+        depot=SimpleNamespace(latitude=lat, longitude=lon, name="depot"),
+        number_of_drivers=instance["drivers"],
+        std_dev_max=instance["capacity"],
+    )
+    locations = LocationSplitter.split([tuple(city) for city in instance["cities"]], instance["capacity"])
+    solver = VRPSolver(
+        summary, locations, distance_provider=HaversineDistanceProvider(), fallback_provider=None,
+        max_runtime=3600, max_iterations=max_iterations, display=False, decompose=False, seed=seed,
+    )
+
+    start = time.perf_counter()
+    solver.distance_matrix = solver._get_distance_matrix()
+    matrix_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_problem_data(
+        instance["depot"], [(la, lo) for _, la, lo, _ in locations], [p for *_, p in locations],
+        instance["capacity"], instance["drivers"], solver.distance_matrix,
+    )
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    solver.solve_vrp()
+    solve_s = time.perf_counter() - start
+
+    return {
+        "instance": instance["name"],
+        "stops": len(instance["cities"]),
+        "locations": len(locations),
+        "matrix_s": round(matrix_s, 4),
+        "build_s": round(build_s, 4),
+        "solve_s": round(solve_s, 4),
+        "objective": solver.total_distance() if solver.routes else None,
+        "routes": len(solver.routes),
+        "iterations": solver.solve_stats.get("iterations"),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run(suite, max_iterations, seed=0):
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for instance in suite:
+        # A fresh process per instance keeps peak memory and warm caches from leaking between them
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_instance, instance, max_iterations, seed).result()
+        print(f"{result['instance']:<36} {result['locations']:>5} locations  "
+              f"matrix {result['matrix_s']:.3f}s  build {result['build_s']:.3f}s  solve {result['solve_s']:.2f}s  "
+              f"objective {result['objective']}  routes {result['routes']}  {result['peak_rss_mb']} MB",
+              file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def compare(baseline, current, tolerances=DEFAULT_TOLERANCES):
+    """Returns a list of human-readable regressions of `current` against `baseline` results."""
+    base = {r["instance"]: r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = base.get(result["instance"])
+        if before is None:
+            continue
+        name = result["instance"]
+        for metric in TIME_METRICS:
+            old, new = before[metric], result[metric]
+            if new - old > MIN_TIME_DELTA and new > old * (1 + tolerances["time"]):
+                regressions.append(f"{name}: {metric} {old} -> {new}")
+        if before["objective"] is not None and (
+                result["objective"] is None or result["objective"] > before["objective"] * (1 + tolerances["objective"])):
+            regressions.append(f"{name}: objective {before['objective']} -> {result['objective']}")
+        if result["routes"] > before["routes"]:
+            regressions.append(f"{name}: routes {before['routes']} -> {result['routes']}")
+        if result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerances["memory"]):
+            regressions.append(f"{name}: peak_rss_mb {before['peak_rss_mb']} -> {result['peak_rss_mb']}")
+    return regressions
+
+
+def _record(args):
+    _setup_django()
+    from management.models import Summary
+
+    args.directory.mkdir(parents=True, exist_ok=True)
+    summaries = Summary.objects.filter(date__range=(args.date_from, args.date_to or args.date_from),
+                                       depot__isnull=False).select_related("depot")
+    for summary in summaries:
+        instance = instances.from_summary(summary)
+        path = args.directory / f"{summary.date}.json"
+        instances.save(instance, path)
+        print(f"Recorded {len(instance['cities'])} stops to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the suite and write the results as JSON")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[20, 50, 100, 200, 500, 1000])
+    run_parser.add_argument("--skews", nargs="+", default=list(instances.SKEWS), choices=instances.SKEWS)
+    run_parser.add_argument("--no-recorded", action="store_true", help="Only run synthetic instances")
+    run_parser.add_argument("--max-iterations", type=int, default=500)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", help="File to write the JSON report to (default: stdout)")
+
+    compare_parser = commands.add_parser("compare", help="Flag regressions against a baseline report")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    for metric, default in DEFAULT_TOLERANCES.items():
+        compare_parser.add_argument(f"--{metric}-tolerance", type=float, default=default)
+
+    record_parser = commands.add_parser("record", help="Save real days from the database as instances")
+    record_parser.add_argument("--from", dest="date_from", required=True)
+    record_parser.add_argument("--to", dest="date_to")
+    record_parser.add_argument("--directory", type=instances.Path, default=instances.RECORDED_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        _record(args)
+    elif args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        tolerances = {metric: getattr(args, f"{metric}_tolerance") for metric in DEFAULT_TOLERANCES}
+        regressions = compare(baseline, current, tolerances)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regression(s) in {len(current['results'])} results.")
+        sys.exit(1 if regressions else 0)
+    else:
+        suite = instances.synthetic_suite(args.sizes, args.skews, seed=args.seed)
+        if not args.no_recorded:
+            suite += instances.recorded()
+        report = {
+            "meta": {
+                "python": platform.python_version(),
+                "numpy": version("numpy"),
+                "pyvrp": version("pyvrp"),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "max_iterations": args.max_iterations,
+                "seed": args.seed,
+            },
+            "results": run(suite, args.max_iterations, args.seed),
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=1)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output)
+        else:
+            print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Solver benchmark instances: synthetic days generated around real depot
+coordinates, and real days recorded from the database as JSON files in
+benchmarks/instances/.
+
+An instance is a dict:
+
+    {"name": ..., "depot": [lat, lon], "capacity": 20, "drivers": 8,
+     "cities": [[name, lat, lon, packages], ...]}
+"""
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+RECORDED_DIR = Path(__file__).resolve().parent / "instances"
+
+# Depots the app has actually been used with
+DEPOTS = {
+    "modiin": (31.907858, 35.007603),
+}
+
+# How packages are spread over stops
+SKEWS = ("uniform", "skewed", "heavy")
+
+
+def _demand(rng, n, skew, capacity):
+    if skew == "uniform":
+        return rng.integers(1, max(2, capacity // 2), n)
+    if skew == "skewed":
+        # Most stops small, a few large (Pareto tail), capped at a truckload
+        return np.minimum(np.ceil(rng.pareto(1.5, n) * 2 + 1), capacity).astype(int)
+    if skew == "heavy":
+        # A tenth of the stops exceed a truckload, so LocationSplitter has work to do
+        demand = rng.integers(1, capacity // 2, n)
+        heavy = rng.random(n) < 0.1
+        demand[heavy] = rng.integers(capacity + 1, capacity * 4, heavy.sum())
+        return demand
+    raise ValueError(f"Unknown demand skew: {skew}")
+
+
+def synthetic(stops, skew="uniform", depot="modiin", capacity=20, radius_km=60, seed=0):
+    """A reproducible synthetic day of `stops` cities scattered around a depot."""
+    rng = np.random.default_rng(seed)
+    lat0, lon0 = DEPOTS[depot]
+    # Uniform over a disc, converted from km to degrees around the depot
+    r = radius_km * np.sqrt(rng.random(stops))
+    theta = rng.uniform(0, 2 * np.pi, stops)
+    lats = lat0 + r * np.sin(theta) / 111.32
+    lons = lon0 + r * np.cos(theta) / (111.32 * math.cos(math.radians(lat0)))
+    demand = _demand(rng, stops, skew, capacity)
+
+    return {
+        "name": f"synthetic-{depot}-{stops}-{skew}",
+        "depot": [lat0, lon0],
+        "capacity": capacity,
+        # Enough drivers for the volume plus some slack, like a planner would give
+        "drivers": max(1, math.ceil(demand.sum() / capacity * 1.2)),
+        "cities": [
+            [f"S{i:04d}", round(float(lat), 6), round(float(lon), 6), int(packages)]
+            for i, (lat, lon, packages) in enumerate(zip(lats, lons, demand))
+        ],
+    }
+
+
+def synthetic_suite(sizes=(20, 50, 100, 200, 500, 1000), skews=SKEWS, seed=0):
+    return [synthetic(n, skew, seed=seed) for n in sizes for skew in skews]
+
+
+def recorded(directory=RECORDED_DIR):
+    """Every recorded day in `directory`, by file name."""
+    return [load(path) for path in sorted(Path(directory).glob("*.json"))]
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(instance, path):
+    """Writes an instance with one city per line, so recorded days diff well."""
+    fields = [f" {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}"
+              for key, value in instance.items() if key != "cities"]
+    cities = ",\n  ".join(json.dumps(city, ensure_ascii=False) for city in instance["cities"])
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{\n" + ",\n".join(fields) + f',\n "cities": [\n  {cities}\n ]\n}}\n')
+
+
+def from_summary(summary):
+    """Records a Summary's day (needs Django) as an instance."""
+    from management.models import DailyDistribution
+
+    distributions = (
+        DailyDistribution.objects
+        .filter(session__date=summary.date, city__latitude__isnull=False)
+        .select_related("city")
+        .order_by("city__name")
+    )
+    return {
+        "name": f"recorded-{summary.date}",
+        "depot": [summary.depot.latitude, summary.depot.longitude],
+        "capacity": int(summary.std_dev_max),
+        "drivers": summary.number_of_drivers,
+        "cities": [
+            [dist.city.name, dist.city.latitude, dist.city.longitude, dist.number_of_packages]
+            for dist in distributions
+        ],
+    }
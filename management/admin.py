@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 
-from .models import City,Polygon,DailyDistribution,DailyWorkForce,Summary,RouteSolution,Depot
+from .timing import percentile
+from .models import City,Polygon,DailyDistribution,DailyWorkForce,Summary,RouteSolution,Depot,RouteJob,RouteStop,GeocodeCache
 
 
 admin.site.register(City)
@@ -10,4 +11,48 @@ admin.site.register(Polygon)
 admin.site.register(DailyDistribution)
 admin.site.register(DailyWorkForce)
 admin.site.register(Summary)
-admin.site.register(RouteSolution)
\ No newline at end of file
+admin.site.register(RouteSolution)
+
+
+class RouteJobAdmin(admin.ModelAdmin):
+    """Route generation runs, slowest first, with per-stage percentiles above the list."""
+    list_display = ("id", "summary", "status", "num_clients", "iterations", "objective", "duration_ms", "created_at")
+    list_filter = ("status",)
+    ordering = ("-duration_ms",)
+    change_list_template = "admin/management/routejob/change_list.html"
+    # Percentiles cover the most recent finished runs
+    percentile_runs = 500
+
+    def stage_percentiles(self):
+        runs = (
+            RouteJob.objects
+            .filter(status=RouteJob.DONE, duration_ms__isnull=False)
+            .order_by("-created_at")
+            .values_list("timings", "duration_ms")[:self.percentile_runs]
+        )
+        stages = {"total": []}
+        for timings, duration_ms in runs:
+            stages["total"].append(duration_ms)
+            for stage, ms in (timings or {}).items():
+                stages.setdefault(stage, []).append(ms)
+
+        return [
+            {
+                "stage": stage,
+                "runs": len(values),
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+            for stage, values in stages.items() if values
+        ]
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), "stage_percentiles": self.stage_percentiles()}
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+admin.site.register(RouteJob, RouteJobAdmin)
+admin.site.register(RouteStop)
+admin.site.register(GeocodeCache)
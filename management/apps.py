@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'management'
+
+    def ready(self):
+        # Keeps Summary rows and the city registry up to date as the data changes
+        from . import signals  # noqa: F401
+        # Tunes every new SQLite connection (WAL etc., see DATABASE_PROFILE)
+        from . import db  # noqa: F401
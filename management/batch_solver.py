@@ -0,0 +1,110 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from types import SimpleNamespace
+
+import django
+from django.db import connections
+
+from .route_generation import RouteGenerationError, build_solver, save_routes, store_route_geometries
+from .vrp_solver import VRPSolver
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # Spawned workers start without Django; forked ones already have it (setup is idempotent).
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project_routes.settings")
+    django.setup()
+
+
+def _snapshot(solver):
+    """Everything a worker needs to solve, as plain picklable data (no DB access in workers)."""
+    summary = solver.summary
+    return {
+        "summary": SimpleNamespace(
+            id=summary.id,
+            date=summary.date,
+            depot=SimpleNamespace(id=summary.depot.id, name=summary.depot.name,
+                                  latitude=summary.depot.latitude, longitude=summary.depot.longitude),
+            number_of_drivers=summary.number_of_drivers,
+            std_dev_max=summary.std_dev_max,
+        ),
+        "locations": solver.LOCATIONS,
+        "city_ids": solver.city_ids,
+        "distance_matrix": solver.distance_matrix,
+        "max_runtime": solver.max_runtime,
+        "max_iterations": solver.max_iterations,
+        "warm_start_routes": solver.warm_start_routes,
+        "regions": solver.regions,
+    }
+
+
+def solve_snapshot(snapshot):
+    """Worker entry point: solves one day and returns its routes (location indices) and stats."""
+    solver = VRPSolver(
+        snapshot["summary"], snapshot["locations"], city_ids=snapshot["city_ids"],
+        display=False,
+        distance_matrix=snapshot["distance_matrix"], max_runtime=snapshot["max_runtime"],
+        max_iterations=snapshot["max_iterations"], warm_start_routes=snapshot["warm_start_routes"],
+        regions=snapshot["regions"], decompose_workers=1,  # the batch already uses every core
+    )
+    solver.solve_vrp()
+    return {"routes": solver.routes, "solve_stats": solver.solve_stats}
+
+
+def solve_summaries(summaries, workers=None, max_runtime=None, max_iterations=None,
+                    warm_start=True, geometry=True):
+    """
+    Solves many Summaries, one solve per worker process.
+
+    The parent reads every day from the DB and fills its distance matrix through
+    the shared distance store (sequentially, so cities shared between days are
+    fetched once and the store has a single writer). Workers only run PyVRP;
+    their routes come back to the parent, which bulk-writes them.
+
+    Yields (summary, routes_count, error) as days finish.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    solvers = {}
+    for summary in summaries:
+        solver = build_solver(summary, max_runtime, max_iterations, warm_start)
+        solver.distance_matrix = solver._get_distance_matrix()
+        if solver.distance_matrix is None:
+            yield summary, 0, "No distance matrix"
+            continue
+        solvers[summary.id] = (summary, solver)
+
+    def finish(summary, solver, result):
+        if not result["routes"]:
+            raise RouteGenerationError(f"No routes found for {summary}")
+        solver.routes, solver.solve_stats = result["routes"], result["solve_stats"]
+        save_routes(summary, solver)
+        if geometry:
+            store_route_geometries(summary)
+        return len(solver.routes)
+
+    if workers <= 1:
+        for summary, solver in solvers.values():
+            try:
+                yield summary, finish(summary, solver, solve_snapshot(_snapshot(solver))), None
+            except Exception as e:
+                logger.exception(f"Solving {summary} failed")
+                yield summary, 0, str(e)
+        return
+
+    # Forked children must not inherit the parent's open DB connections.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=min(workers, len(solvers) or 1), initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(solve_snapshot, _snapshot(solver)): summary_id
+            for summary_id, (_, solver) in solvers.items()
+        }
+        for future in as_completed(futures):
+            summary, solver = solvers[futures[future]]
+            try:
+                yield summary, finish(summary, solver, future.result()), None
+            except Exception as e:
+                logger.exception(f"Solving {summary} failed")
+                yield summary, 0, str(e)
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import EntityVersion
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+# entity -> (version, time.monotonic() it was read at)
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def _entities(entities):
+    return (entities,) if isinstance(entities, str) else tuple(entities)
+
+
+def _initial_version():
+    # Counters start from the clock, so one that was recreated never reuses an old version's keys
+    return time.time_ns() // 1000
+
+
+def _load_versions(entities):
+    versions = dict(EntityVersion.objects.filter(name__in=entities).values_list("name", "version"))
+    for entity in entities:
+        if entity not in versions:
+            EntityVersion.objects.get_or_create(name=entity, defaults={"version": _initial_version()})
+            versions[entity] = EntityVersion.current(entity)
+    return versions
+
+
+def get_versions(entities):
+    """
+    Returns the current version of every entity (e.g. "summaries", "cities"),
+    in order. Versions live in EntityVersion, so every process sees the same
+    ones; each process re-reads them at most every CACHE_VERSION_CHECK_SECONDS.
+    """
+    entities = _entities(entities)
+    now = time.monotonic()
+    with _versions_lock:
+        stale = [
+            entity for entity in entities
+            if entity not in _versions or now - _versions[entity][1] >= settings.CACHE_VERSION_CHECK_SECONDS
+        ]
+    if stale:
+        loaded = _load_versions(stale)
+        with _versions_lock:
+            _versions.update((entity, (loaded[entity], now)) for entity in stale)
+    with _versions_lock:
+        return [_versions[entity][0] for entity in entities]
+
+
+def _forget_versions(entities):
+    with _versions_lock:
+        for entity in entities:
+            _versions.pop(entity, None)
+
+
+def bump_version(*entities):
+    """Makes every cached value that depends on the given entities stale, in every process."""
+    for entity in entities:
+        EntityVersion.bump(entity, initial=_initial_version())
+    _forget_versions(entities)
+
+
+def bump_version_on_commit(*entities):
+    """
+    bump_version for changes made inside a transaction: the stored versions
+    change with the data, so other processes see both at commit; this
+    process re-reads them once the transaction is over.
+    """
+    bump_version(*entities)
+    transaction.on_commit(lambda: _forget_versions(entities))
+
+
+def version_tag(entities):
+    """A short string that changes whenever one of the entities does (for keys and ETags)."""
+    return ".".join(str(version) for version in get_versions(entities))
+
+
+def versioned_key(entities, *parts):
+    """A cache key that includes the current versions of `entities`."""
+    entities = _entities(entities)
+    return ":".join(["/".join(entities), version_tag(entities), *map(str, parts)])
+
+
+def get_or_set(entities, key_parts, compute, timeout=None):
+    """
+    Returns the cached value for `key_parts` under the current versions of
+    `entities`, computing and storing it on a miss. The first key part names
+    what is cached; hits and misses are counted under it (see cache_stats).
+    """
+    key = versioned_key(entities, *key_parts)
+    value = cache.get(key)
+    hit = value is not None
+    with _stats_lock:
+        _stats[(key_parts[0], "hits" if hit else "misses")] += 1
+    if not hit:
+        value = compute()
+        cache.set(key, value, settings.CACHE_TIMEOUT if timeout is None else timeout)
+    return value
+
+
+def cache_stats():
+    """Hits, misses and hit rate of every kind of cached value, for this process."""
+    with _stats_lock:
+        stats = {}
+        for name in sorted({name for name, _ in _stats}):
+            hits, misses = _stats[(name, "hits")], _stats[(name, "misses")]
+            stats[name] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 3)}
+    return stats
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .caching import bump_version_on_commit
+from .gazetteer import normalize
+from .models import City, EntityVersion
+
+logger = logging.getLogger(__name__)
+
+# Shared with the cache layer, so one bump refreshes both (see management/caching.py)
+VERSION_NAME = "cities"
+
+
+class CityRegistry:
+    """
+    In-memory snapshot of every City.
+
+    Ids, names, normalized names (see gazetteer.normalize) and coordinates are
+    kept in parallel arrays, with dict indexes from id, name and normalized
+    name to the row, so lookups never touch the database. `version` is the
+    EntityVersion the snapshot was loaded at.
+    """
+
+    def __init__(self, rows, version=0):
+        rows = list(rows)  # (id, name, latitude, longitude)
+        self.version = version
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.names = [row[1] for row in rows]
+        self.normalized = [normalize(name) for name in self.names]
+        self.latitudes = np.array([np.nan if row[2] is None else row[2] for row in rows], dtype=np.float64)
+        self.longitudes = np.array([np.nan if row[3] is None else row[3] for row in rows], dtype=np.float64)
+
+        self._by_id = {city_id: row for row, city_id in enumerate(self.ids.tolist())}
+        self._by_name = {name: row for row, name in enumerate(self.names)}
+        self._by_normalized = {}
+        for row, key in enumerate(self.normalized):
+            self._by_normalized.setdefault(key, row)  # The first city wins on collisions
+
+    @classmethod
+    def load(cls, version=0):
+        return cls(City.objects.values_list("id", "name", "latitude", "longitude").iterator(), version)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, city_id):
+        return self._row(city_id) is not None
+
+    def _row(self, city_id):
+        try:
+            return self._by_id.get(int(city_id))
+        except (TypeError, ValueError):
+            return None
+
+    def name(self, city_id, default=None):
+        row = self._row(city_id)
+        return default if row is None else self.names[row]
+
+    def coordinates(self, city_id):
+        """Returns (lat, lon) of the city, or None if it is unknown or has no coordinates."""
+        row = self._row(city_id)
+        if row is None or np.isnan(self.latitudes[row]) or np.isnan(self.longitudes[row]):
+            return None
+        return float(self.latitudes[row]), float(self.longitudes[row])
+
+    def find(self, name):
+        """Returns the id of the city called `name` (exact, then normalized match), or None."""
+        if not isinstance(name, str):
+            return None
+        row = self._by_name.get(name.strip())
+        if row is None:
+            row = self._by_normalized.get(normalize(name))
+        return None if row is None else int(self.ids[row])
+
+
+_registry = None
+_checked_at = 0.0
+_registry_lock = threading.Lock()
+
+
+def get_city_registry(check=False):
+    """
+    Returns the process-wide registry. The stored version is re-read at most
+    every CITY_REGISTRY_CHECK_SECONDS (always with `check`, before writes that
+    depend on it), and the registry is reloaded when another process changed it.
+    """
+    global _registry, _checked_at
+    with _registry_lock:
+        now = time.monotonic()
+        if _registry is not None and not check and now - _checked_at < settings.CITY_REGISTRY_CHECK_SECONDS:
+            return _registry
+
+        version = EntityVersion.current(VERSION_NAME)
+        if _registry is None or _registry.version != version:
+            _registry = CityRegistry.load(version)
+            logger.info(f"City registry loaded: {len(_registry)} cities (version {version}).")
+        _checked_at = now
+        return _registry
+
+
+def invalidate_city_registry():
+    """
+    Drops this process's registry and bumps the stored version so other
+    processes drop theirs; cached data built from cities goes stale too.
+    """
+    global _registry
+    bump_version_on_commit(VERSION_NAME)
+    with _registry_lock:
+        _registry = None
@@ -0,0 +1,136 @@
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from pyvrp import solve
+
+from .stopping import StoppingPolicy
+from .warm_start import solve_from
+
+logger = logging.getLogger(__name__)
+
+
+def allocate_vehicles(volumes, capacity, num_vehicles):
+    """
+    Splits `num_vehicles` between regions in proportion to their package volume.
+
+    Every region first gets the vehicles its volume needs at full capacity; the
+    rest go one by one to the region furthest below its proportional share. Returns None when the day
+    needs more vehicles than there are, so the caller can solve it whole.
+    """
+    needed = [max(1, math.ceil(volume / capacity)) for volume in volumes]
+    if sum(needed) > num_vehicles:
+        return None
+
+    total = sum(volumes) or 1
+    shares = [num_vehicles * volume / total for volume in volumes]
+    allocation = list(needed)
+    for _ in range(num_vehicles - sum(needed)):
+        r = max(range(len(allocation)), key=lambda i: shares[i] - allocation[i])
+        allocation[r] += 1
+    return allocation
+
+
+def solve_region(data, budget, seed=0):
+    """Worker entry point: solves one region's ProblemData and returns its routes as client index lists."""
+    result = solve(data, stop=StoppingPolicy.criterion(budget), seed=seed, display=False)
+    return {
+        "routes": [[int(client) for client in route] for route in result.best.routes()],
+        "feasible": result.is_feasible(),
+        "iterations": int(result.num_iterations),
+    }
+
+
+class PolygonDecomposition:
+    """
+    Cluster-first, route-second solve of a large day.
+
+    Clients are grouped by the Polygon of their city, drivers are allocated to
+    polygons by package volume, and every polygon is solved as its own smaller
+    instance (in parallel processes). The stitched routes then seed a short
+    solve of the whole day, which moves stops across polygon boundaries where
+    that shortens the routes.
+    """
+
+    def __init__(self, stopping_policy, workers=1, max_runtime=None, max_iterations=None, seed=0):
+        self.stopping_policy = stopping_policy
+        self.workers = workers
+        self.max_runtime = max_runtime
+        self.max_iterations = max_iterations
+        self.seed = seed
+        self.stats = {}
+
+    @staticmethod
+    def groups(client_regions):
+        """{region: [client indices (1-based)]} in first-seen order; clients without a region form one group."""
+        groups = {}
+        for idx, region in enumerate(client_regions, start=1):
+            groups.setdefault(region, []).append(idx)
+        return groups
+
+    def solve(self, data, build_data, client_regions, capacity, num_vehicles):
+        """
+        Returns the Result of the cross-boundary solve, or None if the day can't
+        be decomposed. `build_data(clients, num_vehicles)` must return the
+        ProblemData of the sub-instance holding the given clients.
+        """
+        groups = self.groups(client_regions)
+        if len(groups) < 2:
+            return None
+
+        deliveries = [sum(client.delivery) for client in data.clients()]
+        volumes = [sum(deliveries[c - 1] for c in clients) for clients in groups.values()]
+        allocation = allocate_vehicles(volumes, capacity, num_vehicles)
+        if allocation is None:
+            logger.warning("Not enough drivers to give every polygon its own; solving the day whole.")
+            return None
+
+        # An explicit runtime limit covers the whole day: the polygons (run side by side)
+        # and the cross-boundary pass split it like a cold solve and a warm re-solve would.
+        polish_share = self.stopping_policy.params["warm_start_factor"]
+        region_runtime = polish_runtime = None
+        if self.max_runtime is not None:
+            region_runtime = self.max_runtime * (1 - polish_share)
+            polish_runtime = self.max_runtime * polish_share
+
+        tasks = []
+        for clients, vehicles in zip(groups.values(), allocation):
+            budget = self.stopping_policy.budget(
+                len(clients), vehicles, max_runtime=region_runtime, max_iterations=self.max_iterations
+            )
+            tasks.append((clients, build_data(clients, vehicles), budget))
+        logger.info(f"Decomposed into {len(tasks)} polygons: "
+                    f"{[(len(clients), vehicles) for (clients, _, _), vehicles in zip(tasks, allocation)]}")
+
+        results = self._solve_regions(tasks)
+        stitched = [
+            [clients[local - 1] for local in route]
+            for (clients, _, _), result in zip(tasks, results)
+            for route in result["routes"]
+        ]
+
+        polish = self.stopping_policy.budget(
+            data.num_clients, num_vehicles, max_runtime=polish_runtime,
+            max_iterations=self.max_iterations, warm_start=True,
+        )
+        logger.info(f"Cross-boundary pass over {len(stitched)} stitched routes with budget {polish}...")
+        result = solve_from(data, StoppingPolicy.criterion(polish), stitched, seed=self.seed)
+
+        self.stats = {
+            **polish,
+            "warm_start": False,
+            "regions": len(tasks),
+            "region_iterations": sum(r["iterations"] for r in results),
+        }
+        return result
+
+    def _solve_regions(self, tasks):
+        if self.workers <= 1 or len(tasks) == 1:
+            return [solve_region(data, budget, self.seed) for _, data, budget in tasks]
+
+        # Spawned (not forked) children: the parent is usually a threaded web or job worker.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks)), mp_context=context) as executor:
+            futures = [executor.submit(solve_region, data, budget, self.seed) for _, data, budget in tasks]
+            return [future.result() for future in futures]
@@ -0,0 +1,154 @@
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .matrix_fetcher import get_matrix_fetcher
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_METERS = 6371008.8
+
+
+class DistanceProvider:
+    """
+    Interface of everything VRPSolver can get road distances from.
+
+    `matrix(points, sources=None, destinations=None)` takes a list of (lat, lon)
+    and returns driving distances in meters between the selected indices (all
+    points by default), or None when the distances are not available.
+    """
+    name = "base"
+    # Whether answers are real road distances worth keeping in the DistanceStore.
+    cacheable = False
+
+    def matrix(self, points, sources=None, destinations=None):
+        raise NotImplementedError
+
+
+class MapboxDistanceProvider(DistanceProvider):
+    """Road distances from the Mapbox matrix API."""
+    name = "mapbox"
+    cacheable = True
+
+    def __init__(self, fetcher=None):
+        self.fetcher = fetcher or get_matrix_fetcher()
+
+    def matrix(self, points, sources=None, destinations=None):
+        return self.fetcher.fetch(points, sources, destinations)
+
+
+def haversine_matrix(origins, destinations):
+    """Great-circle distances in meters between two (n, 2) arrays of (lat, lon) in degrees."""
+    origins = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+    lat1, lon1 = origins[:, 0][:, None], origins[:, 1][:, None]
+    lat2, lon2 = destinations[:, 0][None, :], destinations[:, 1][None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class HaversineDistanceProvider(DistanceProvider):
+    """
+    Offline distances: the great-circle distance times a road circuity factor.
+
+    Each region has its own factor and centroid; a point uses the factor of the
+    nearest centroid and a pair uses the mean of its two endpoints' factors.
+    Factors are calibrated from real Mapbox answers with `calibrate`.
+    """
+    name = "haversine"
+    DEFAULT_ROAD_FACTOR = 1.3
+    # Very short pairs are dominated by geocoding noise, so they don't calibrate anything.
+    MIN_CALIBRATION_METERS = 1000
+
+    def __init__(self, road_factor=DEFAULT_ROAD_FACTOR, regions=None):
+        self.road_factor = float(road_factor)
+        self.regions = dict(regions or {})
+        self._centroids = np.array([[r["lat"], r["lon"]] for r in self.regions.values()], dtype=np.float64)
+        self._factors = np.array([r["factor"] for r in self.regions.values()], dtype=np.float64)
+
+    def point_factors(self, points):
+        """Road factor of every point, taken from its nearest region."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not len(self._factors):
+            return np.full(len(points), self.road_factor)
+        nearest = haversine_matrix(points, self._centroids).argmin(axis=1)
+        return self._factors[nearest]
+
+    def matrix(self, points, sources=None, destinations=None):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        sources = np.arange(len(points)) if sources is None else np.asarray(sources, dtype=np.intp)
+        destinations = np.arange(len(points)) if destinations is None else np.asarray(destinations, dtype=np.intp)
+
+        factors = self.point_factors(points)
+        pair_factors = (factors[sources][:, None] + factors[destinations][None, :]) / 2
+        return haversine_matrix(points[sources], points[destinations]) * pair_factors
+
+    @classmethod
+    def calibrate(cls, samples):
+        """
+        Builds a provider from observed road distances.
+
+        `samples` is an iterable of (region, points, observed) where `observed`
+        is the road distance matrix in meters between `points`, with NaN for
+        pairs that were never observed. A region's factor is the median ratio of
+        road to great-circle distance; the default factor pools every region.
+        """
+        regions = {}
+        pooled = []
+        for region, points, observed in samples:
+            points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+            observed = np.asarray(observed, dtype=np.float64)
+            straight = haversine_matrix(points, points)
+            usable = np.isfinite(observed) & (straight >= cls.MIN_CALIBRATION_METERS)
+            if not usable.any():
+                continue
+
+            ratios = observed[usable] / straight[usable]
+            pooled.append(ratios)
+            regions[str(region)] = {
+                "factor": round(float(np.median(ratios)), 4),
+                "lat": float(points[:, 0].mean()),
+                "lon": float(points[:, 1].mean()),
+                "pairs": int(usable.sum()),
+            }
+
+        road_factor = float(np.median(np.concatenate(pooled))) if pooled else cls.DEFAULT_ROAD_FACTOR
+        return cls(road_factor=round(road_factor, 4), regions=regions)
+
+    def to_dict(self):
+        return {"road_factor": self.road_factor, "regions": self.regions}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def from_file(cls, path):
+        """Loads calibrated factors, or returns an uncalibrated provider if there are none yet."""
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(road_factor=data.get("road_factor", cls.DEFAULT_ROAD_FACTOR), regions=data.get("regions"))
+
+
+def get_distance_provider(name=None):
+    """Builds the provider named by `name` (default settings.DISTANCE_PROVIDER), or None for ''."""
+    name = settings.DISTANCE_PROVIDER if name is None else name
+    if not name:
+        return None
+    if name == MapboxDistanceProvider.name:
+        return MapboxDistanceProvider()
+    if name == HaversineDistanceProvider.name:
+        return HaversineDistanceProvider.from_file(settings.ROAD_FACTORS_FILE)
+    raise ValueError(f"Unknown distance provider: {name}")
+
+
+def get_fallback_provider():
+    """The provider used when the primary one fails (settings.DISTANCE_FALLBACK_PROVIDER)."""
+    return get_distance_provider(settings.DISTANCE_FALLBACK_PROVIDER)
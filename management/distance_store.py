@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, so run a single process there
+    fcntl = None
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Sentinel for pairs that were never fetched.
+MISSING = np.iinfo(np.uint32).max
+# Stored for pairs Mapbox could not route, so they are not re-fetched forever.
+UNREACHABLE = MISSING - 1
+
+
+class DistanceStore:
+    """
+    Persistent all-pairs road distance store indexed by City.id / Depot.id.
+
+    Distances are kept in meters in a square uint32 memmap next to a JSON
+    index that maps each key to its row. Only pairs that were never seen are
+    fetched; everything else is read back by fancy-indexing rows and columns.
+
+    Web workers and `solve_routes` share the files, so every access holds an
+    exclusive flock on LOCK_FILE and re-reads the index another process may
+    have changed (new keys, or a grown matrix file) before touching it.
+    """
+    MATRIX_FILE = "distances.u32"
+    INDEX_FILE = "index.json"
+    LOCK_FILE = "store.lock"
+
+    def __init__(self, directory, initial_capacity=256):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.matrix_path = self.directory / self.MATRIX_FILE
+        self.index_path = self.directory / self.INDEX_FILE
+        self.lock_path = self.directory / self.LOCK_FILE
+        self.initial_capacity = initial_capacity
+        self._lock = threading.Lock()
+        self._index_stamp = None
+        with self._locked():
+            self._load()
+
+    @staticmethod
+    def city_key(city_id):
+        return f"city:{city_id}"
+
+    @staticmethod
+    def depot_key(depot_id):
+        return f"depot:{depot_id}"
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    @contextmanager
+    def _locked(self):
+        """Holds this process's lock and the store-wide file lock."""
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stamp(self):
+        # The index is replaced on every write, so a new inode or mtime means another process wrote it
+        stat = self.index_path.stat()
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        if self.index_path.exists() and self.matrix_path.exists():
+            with open(self.index_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self._keys = list(meta["keys"])
+            self._capacity = int(meta["capacity"])
+            self._matrix = np.memmap(self.matrix_path, dtype=np.uint32, mode="r+",
+                                     shape=(self._capacity, self._capacity))
+            self._index_stamp = self._stamp()
+        else:
+            self._keys = []
+            self._capacity = self.initial_capacity
+            self._matrix = np.memmap(self.matrix_path, dtype=np.uint32, mode="w+",
+                                     shape=(self._capacity, self._capacity))
+            self._matrix[:] = MISSING
+            self._matrix.flush()
+            self._write_index()
+        self._index = {key: row for row, key in enumerate(self._keys)}
+
+    def _reload_if_changed(self):
+        """Picks up keys registered (and a matrix grown) by another process; call it holding _locked()."""
+        try:
+            stamp = self._stamp()
+        except FileNotFoundError:
+            return
+        if stamp != self._index_stamp:
+            self._matrix.flush()
+            self._load()
+
+    def _write_index(self):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"capacity": self._capacity, "keys": self._keys}, f)
+        os.replace(tmp_path, self.index_path)
+        self._index_stamp = self._stamp()
+
+    def _grow(self, needed):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        logger.info(f"Growing distance store from {self._capacity} to {capacity} rows.")
+
+        tmp_path = self.matrix_path.with_suffix(".tmp")
+        grown = np.memmap(tmp_path, dtype=np.uint32, mode="w+", shape=(capacity, capacity))
+        grown[:] = MISSING
+        grown[:self._capacity, :self._capacity] = self._matrix
+        grown.flush()
+        del grown
+        self._matrix.flush()
+        del self._matrix
+        os.replace(tmp_path, self.matrix_path)
+
+        self._capacity = capacity
+        self._matrix = np.memmap(self.matrix_path, dtype=np.uint32, mode="r+",
+                                 shape=(capacity, capacity))
+
+    def _rows_for(self, keys):
+        """Returns the row of every key, registering keys seen for the first time."""
+        new_keys = [key for key in dict.fromkeys(keys) if key not in self._index]
+        if new_keys:
+            if len(self._keys) + len(new_keys) > self._capacity:
+                self._grow(len(self._keys) + len(new_keys))
+            for key in new_keys:
+                row = len(self._keys)
+                self._keys.append(key)
+                self._index[key] = row
+                self._matrix[row, row] = 0
+            self._write_index()
+            logger.info(f"Registered {len(new_keys)} new locations in the distance store.")
+        return np.fromiter((self._index[key] for key in keys), dtype=np.intp, count=len(keys))
+
+    def invalidate(self, keys):
+        """Forgets every stored distance from/to the given keys (e.g. after a city moved)."""
+        with self._locked():
+            self._reload_if_changed()
+            rows = [self._index[key] for key in keys if key in self._index]
+            if not rows:
+                return
+            self._matrix[rows, :] = MISSING
+            self._matrix[:, rows] = MISSING
+            self._matrix[rows, rows] = 0
+            self._matrix.flush()
+
+    def observed(self, keys):
+        """
+        Returns the stored distances between `keys` in meters without fetching
+        anything; pairs that were never fetched (or are unreachable) are NaN.
+        """
+        with self._locked():
+            self._reload_if_changed()
+            rows = np.array([self._index.get(key, -1) for key in keys], dtype=np.intp)
+            known = rows >= 0
+            result = np.full((len(keys), len(keys)), np.nan)
+            block = self._matrix[np.ix_(rows[known], rows[known])].astype(np.float64)
+        block[block >= UNREACHABLE] = np.nan
+        result[np.ix_(known, known)] = block
+        return result
+
+    def submatrix(self, keys, points, fetch):
+        """
+        Returns the len(keys) x len(keys) distance matrix in meters, or None if a fetch failed.
+
+        `points` holds the (lat, lon) of every key. Missing pairs are filled through
+        `fetch(points, sources, destinations)`, which must return meters for the
+        given source/destination indices into `points`.
+        """
+        with self._locked():
+            self._reload_if_changed()
+            rows = self._rows_for(keys)
+            unique_rows, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+            unique_points = [points[i] for i in first]
+
+            block = self._matrix[np.ix_(unique_rows, unique_rows)]
+            missing = block == MISSING
+            if missing.any():
+                block = self._fill_missing(unique_rows, unique_points, block, missing, fetch)
+                if block is None:
+                    return None
+
+        return block[np.ix_(inverse, inverse)]
+
+    def _fill_missing(self, rows, points, block, missing, fetch):
+        n = len(rows)
+        # Keys seen for the first time miss their whole row, so fetch them as full
+        # rows and columns instead of the bounding box of every missing pair.
+        fresh = np.flatnonzero(missing.sum(axis=1) >= n - 1)
+        known = np.setdiff1d(np.arange(n), fresh)
+        leftover = missing.copy()
+        leftover[fresh, :] = False
+        leftover[:, fresh] = False
+
+        requests = []
+        if fresh.size:
+            requests.append((fresh, np.arange(n)))
+            if known.size:
+                requests.append((known, fresh))
+        if leftover.any():
+            requests.append((np.flatnonzero(leftover.any(axis=1)), np.flatnonzero(leftover.any(axis=0))))
+
+        logger.info(f"Distance store: fetching {int(missing.sum())} missing pairs in {len(requests)} request(s).")
+        for sources, destinations in requests:
+            meters = fetch(points, sources, destinations)
+            if meters is None:
+                self._matrix.flush()
+                return None
+            values = np.nan_to_num(np.asarray(meters, dtype=np.float64), nan=UNREACHABLE)
+            values = np.clip(np.rint(values), 0, UNREACHABLE).astype(np.uint32)
+            block[np.ix_(sources, destinations)] = values
+            self._matrix[np.ix_(rows[sources], rows[destinations])] = values
+
+        np.fill_diagonal(block, 0)
+        self._matrix[rows, rows] = 0
+        self._matrix.flush()
+        return block
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_distance_store():
+    """Returns the process-wide store configured by settings.DISTANCE_STORE_DIR."""
+    global _store
+    with _store_lock:
+        if _store is None or _store.directory != Path(settings.DISTANCE_STORE_DIR):
+            _store = DistanceStore(settings.DISTANCE_STORE_DIR)
+        return _store
+
+
+def forget_cities(city_ids):
+    """Drops the stored distances of cities that moved; a store that was never created is left alone."""
+    city_ids = list(city_ids)
+    if not city_ids or not (Path(settings.DISTANCE_STORE_DIR) / DistanceStore.INDEX_FILE).exists():
+        return
+    get_distance_store().invalidate([DistanceStore.city_key(city_id) for city_id in city_ids])
+    logger.info(f"Dropped stored distances of {len(city_ids)} moved cities.")
@@ -0,0 +1,119 @@
+import hashlib
+import logging
+
+from django.db import IntegrityError, transaction
+
+from .city_registry import get_city_registry
+from .db import QUERY_CHUNK_SIZE
+from .importers import DistributionImporter
+from .models import DailyDistribution, DailyWorkForce, DistributionDraft
+
+logger = logging.getLogger(__name__)
+
+
+class DraftConflict(Exception):
+    """The saved distribution changed since the draft was copied from it."""
+
+
+def _saved_rows(workforce):
+    return list(
+        DailyDistribution.objects.filter(session=workforce)
+        .order_by("city_id")
+        .values_list("city_id", "number_of_packages")
+    )
+
+
+def _fingerprint(rows):
+    return hashlib.sha256(repr(sorted(rows)).encode()).hexdigest()
+
+
+def start_draft(workforce):
+    """
+    Copies the saved distribution into a draft on the day's first edit and
+    records what it was copied from; does nothing if a draft is already open.
+    """
+    if workforce.draft_base:
+        return
+    with transaction.atomic():
+        saved = _saved_rows(workforce)
+        base = _fingerprint(saved)
+        # Only one dispatcher gets to seed the draft
+        if DailyWorkForce.objects.filter(id=workforce.id, draft_base="").update(draft_base=base):
+            DistributionDraft.objects.bulk_create(
+                [DistributionDraft(session=workforce, city_id=city_id, number_of_packages=packages)
+                 for city_id, packages in saved],
+                batch_size=QUERY_CHUNK_SIZE,
+            )
+            workforce.draft_base = base
+        else:
+            workforce.refresh_from_db(fields=["draft_base"])
+
+
+def draft_entries(workforce):
+    """The rows the distribution page shows: the open draft, or else the saved distribution."""
+    registry = get_city_registry()
+    rows = (
+        DistributionDraft.objects.filter(session=workforce).values_list("city_id", "number_of_packages")
+        if workforce.draft_base else _saved_rows(workforce)
+    )
+    return [
+        {"city_id": city_id, "city_name": registry.name(city_id), "number_of_packages": packages}
+        for city_id, packages in rows
+    ]
+
+
+def add_to_draft(workforce, city, packages):
+    """Adds a city to the draft; returns False if it is already there."""
+    try:
+        with transaction.atomic():
+            DistributionDraft.objects.create(session=workforce, city=city, number_of_packages=packages)
+    except IntegrityError:
+        return False
+    return True
+
+
+def set_draft_packages(workforce, packages_by_city):
+    """Writes the changed package counts (city id -> packages) in one statement; returns how many changed."""
+    changed = []
+    for draft in DistributionDraft.objects.filter(session=workforce, city_id__in=list(packages_by_city)):
+        if draft.number_of_packages != packages_by_city[draft.city_id]:
+            draft.number_of_packages = packages_by_city[draft.city_id]
+            changed.append(draft)
+    DistributionDraft.objects.bulk_update(changed, ["number_of_packages"], batch_size=QUERY_CHUNK_SIZE)
+    return len(changed)
+
+
+def remove_from_draft(workforce, city_id):
+    """Removes a city from the draft; returns False if it wasn't there."""
+    deleted, _ = DistributionDraft.objects.filter(session=workforce, city_id=city_id).delete()
+    return bool(deleted)
+
+
+def promote_draft(workforce):
+    """
+    Replaces the day's DailyDistribution with the draft in one transaction
+    (cities removed from the draft are removed from the day) and clears the
+    draft. Returns the DistributionImporter report, or None if no draft is open.
+
+    Raises DraftConflict, and drops the draft, if the saved distribution was
+    changed by someone else (e.g. the import API) since the draft was copied.
+    """
+    with transaction.atomic():
+        workforce.refresh_from_db(fields=["draft_base"])
+        if not workforce.draft_base:
+            return None
+        stale = _fingerprint(_saved_rows(workforce)) != workforce.draft_base
+        if not stale:
+            rows = list(
+                DistributionDraft.objects.filter(session=workforce).values_list("city_id", "number_of_packages")
+            )
+            report = DistributionImporter(workforce, replace=True).run(
+                {"city_id": city_id, "packages": packages} for city_id, packages in rows
+            )
+            workforce.discard_draft()
+    if stale:
+        workforce.discard_draft()
+        logger.warning(f"Stale draft for {workforce.date} dropped: the saved distribution changed.")
+        raise DraftConflict(workforce.date)
+    logger.info(f"Draft for {workforce.date} promoted: {report['cities']} cities.")
+    return report
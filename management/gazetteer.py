@@ -0,0 +1,136 @@
+import csv
+import difflib
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Hebrew final letters are matched as their regular forms
+FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+# Hyphens, quotes, geresh/gershayim and other punctuation become spaces
+PUNCTUATION = re.compile(r"[\s\-‐-―־'\"`׳״.,()/]+")
+
+
+def normalize(name):
+    """Matching form of a locality name: no niqqud/accents, final letters folded, case-folded, single spaces."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return PUNCTUATION.sub(" ", stripped.translate(FINAL_LETTERS)).strip().casefold()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Locality(NamedTuple):
+    name_he: str
+    name_en: str
+    latitude: float
+    longitude: float
+
+
+class Gazetteer:
+    """
+    In-memory index of the bundled localities list (management/data/gazetteer.csv).
+
+    Every Hebrew, English and alternate spelling is indexed by its normalized
+    form for exact lookups. Names that don't match exactly can be matched
+    fuzzily: candidates sharing trigrams are scored, and the most similar
+    locality is kept if it scores at least `cutoff` and beats every other
+    locality by `margin`. Fuzzy matches can be wrong ("Kiryat Yearim" is close
+    to Kiryat Yam), so callers only use them as a last resort.
+    """
+    DEFAULT_CUTOFF = 0.82
+    DEFAULT_MARGIN = 0.05
+    MAX_CANDIDATES = 20
+
+    def __init__(self, localities, cutoff=DEFAULT_CUTOFF, margin=DEFAULT_MARGIN):
+        self.cutoff = cutoff
+        self.margin = margin
+        self.localities = list(localities)
+        self._exact = {}
+        self._trigrams = {}
+        for locality, names in self.localities:
+            for name in names:
+                key = normalize(name)
+                if not key or key in self._exact:
+                    continue
+                self._exact[key] = locality
+                for gram in trigrams(key):
+                    self._trigrams.setdefault(gram, []).append(key)
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        localities = []
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                locality = Locality(row["name_he"], row["name_en"], float(row["latitude"]), float(row["longitude"]))
+                alternates = [name for name in (row.get("alternate_names") or "").split("|") if name.strip()]
+                localities.append((locality, [row["name_he"], row["name_en"], *alternates]))
+        logger.info(f"Loaded {len(localities)} localities from {path}")
+        return cls(localities, **kwargs)
+
+    def __len__(self):
+        return len(self.localities)
+
+    def exact(self, name):
+        """Returns the Locality with the same normalized name as `name`, or None."""
+        return self._exact.get(normalize(name))
+
+    def fuzzy(self, name):
+        """Returns (Locality, score) of the clearly most similar locality, or None."""
+        key = normalize(name)
+        if not key:
+            return None
+
+        shared = Counter(candidate for gram in trigrams(key) for candidate in self._trigrams.get(gram, ()))
+        scores = {}  # locality -> score of its most similar name
+        for candidate, _ in shared.most_common(self.MAX_CANDIDATES):
+            locality = self._exact[candidate]
+            scores[locality] = max(scores.get(locality, 0.0), difflib.SequenceMatcher(None, key, candidate).ratio())
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < self.cutoff:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < self.margin:
+            logger.debug(f"Gazetteer fuzzy match for {name!r} is ambiguous: {ranked[0]} vs {ranked[1]}")
+            return None
+        logger.debug(f"Gazetteer fuzzy match: {name!r} -> {ranked[0][0].name_en!r} ({ranked[0][1]:.2f})")
+        return ranked[0]
+
+    def match(self, name, fuzzy=True):
+        """Returns the Locality matching `name` exactly, else (with `fuzzy`) fuzzily, or None."""
+        locality = self.exact(name)
+        if locality is None and fuzzy:
+            found = self.fuzzy(name)
+            locality = found[0] if found else None
+        return locality
+
+    def coordinates(self, name, fuzzy=False):
+        """Returns (lat, lon) of `name`, or (None, None) if it is not in the gazetteer."""
+        locality = self.match(name, fuzzy=fuzzy)
+        if locality is None:
+            return None, None
+        return locality.latitude, locality.longitude
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Returns the process-wide gazetteer loaded from settings.GAZETTEER_FILE, or None if it is disabled."""
+    global _gazetteer
+    if not settings.GAZETTEER_FILE:
+        return None
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            _gazetteer = Gazetteer.from_csv(settings.GAZETTEER_FILE)
+        return _gazetteer
@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .db import QUERY_CHUNK_SIZE
+from .gazetteer import get_gazetteer, normalize
+from .matrix_fetcher import build_session
+from .models import GeocodeCache
+from .utils import Coordinates, GeocodingError
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Spaces calls at least 1 / `per_second` seconds apart across threads (0 disables it)."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Geocoder:
+    """
+    Batch geocoder backed by the local gazetteer and the GeocodeCache table.
+
+    Names the gazetteer knows exactly never leave the process. The rest are
+    looked up in the cache first (found answers expire after `ttl`, "not found"
+    answers after `negative_ttl`); only the remaining distinct names go to the
+    API, through a bounded thread pool and a shared rate limit. API failures
+    are not cached, so they are retried next time. Names nobody found fall
+    back to the gazetteer's fuzzy match, if it has a clear one.
+    """
+
+    def __init__(self, lookup=None, max_workers=None, rate_limit=None, ttl=None, negative_ttl=None,
+                 gazetteer=None):
+        self.lookup = lookup or Coordinates.lookup_city
+        self.gazetteer = gazetteer if gazetteer is not None else get_gazetteer()
+        self.max_workers = max_workers or settings.GEOCODE_WORKERS
+        self.rate_limiter = RateLimiter(settings.GEOCODE_RATE_LIMIT if rate_limit is None else rate_limit)
+        self.ttl = ttl or timedelta(days=settings.GEOCODE_CACHE_TTL_DAYS)
+        self.negative_ttl = negative_ttl or timedelta(days=settings.GEOCODE_NEGATIVE_TTL_DAYS)
+        self.session = build_session(self.max_workers)
+
+    def geocode(self, name):
+        """Returns (lat, lon) of a single city, or (None, None)."""
+        return self.geocode_many([name]).get(name, (None, None))
+
+    def geocode_many(self, names, stats=None):
+        """
+        Returns {name: (lat, lon)} for every name that could be located. If given,
+        `stats` is filled with how many names the gazetteer resolved exactly, how
+        many distinct remaining names came from the cache, were fetched from the
+        API, or failed to fetch, and the fuzzy matches used as a fallback
+        ({"name", "match", "score"} each).
+        """
+        stats = {} if stats is None else stats
+        located = {}
+        if self.gazetteer is not None:
+            for name in names:
+                latitude, longitude = self.gazetteer.coordinates(name)
+                if latitude is not None:
+                    located[name] = (latitude, longitude)
+        stats["gazetteer"] = len(located)
+
+        keys = {name: normalize(name) for name in names if name not in located}
+        answers = self._cached(set(keys.values()))
+        stats["cached"] = len(answers)
+
+        missing = sorted(set(keys.values()) - set(answers))
+        fetched = self._fetch(missing) if missing else {}
+        answers.update(fetched)
+        stats["fetched"] = len(fetched)
+        stats["failed"] = len(missing) - len(fetched)
+
+        located.update(
+            (name, answers[key])
+            for name, key in keys.items()
+            if answers.get(key, (None, None))[0] is not None
+        )
+
+        stats["fuzzy"] = []
+        if self.gazetteer is not None:
+            for name in keys:
+                found = None if name in located else self.gazetteer.fuzzy(name)
+                if found:
+                    locality, score = found
+                    located[name] = (locality.latitude, locality.longitude)
+                    stats["fuzzy"].append({"name": name, "match": locality.name_he, "score": round(score, 2)})
+                    logger.warning(f"{name!r} located by fuzzy match to {locality.name_he!r} ({score:.2f})")
+        return located
+
+    def _cached(self, keys):
+        now = timezone.now()
+        keys = list(keys)
+        answers = {}
+        for i in range(0, len(keys), QUERY_CHUNK_SIZE):
+            for entry in GeocodeCache.objects.filter(name__in=keys[i:i + QUERY_CHUNK_SIZE]):
+                ttl = self.ttl if entry.found else self.negative_ttl
+                if entry.fetched_at + ttl > now:
+                    answers[entry.name] = (entry.latitude, entry.longitude)
+        return answers
+
+    def _lookup(self, key):
+        self.rate_limiter.wait()
+        try:
+            return self.lookup(key, session=self.session)
+        except GeocodingError as e:
+            logger.warning(str(e))
+            return None
+
+    def _fetch(self, keys):
+        logger.info(f"Geocoding {len(keys)} names with {min(self.max_workers, len(keys))} worker(s)...")
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(keys))) as executor:
+            results = dict(zip(keys, executor.map(self._lookup, keys)))
+
+        # Writes stay in the calling thread, so the pool never touches the database
+        now = timezone.now()
+        entries = [
+            GeocodeCache(name=key, latitude=coords[0], longitude=coords[1],
+                         found=coords[0] is not None, fetched_at=now)
+            for key, coords in results.items() if coords is not None
+        ]
+        GeocodeCache.objects.bulk_create(
+            entries, batch_size=QUERY_CHUNK_SIZE, update_conflicts=True,
+            unique_fields=["name"], update_fields=["latitude", "longitude", "found", "fetched_at"],
+        )
+        return {key: coords for key, coords in results.items() if coords is not None}
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    """Returns the process-wide geocoder, so uploads share one connection pool and rate limit."""
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = Geocoder()
+        return _geocoder
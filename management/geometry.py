@@ -0,0 +1,172 @@
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from .matrix_fetcher import build_session
+
+logger = logging.getLogger(__name__)
+
+MAPBOX_DIRECTIONS_URL = "https://api.mapbox.com/directions/v5/mapbox/driving"
+POLYLINE_PRECISION = 5
+# Douglas-Peucker tolerances (meters) of the simplified variants served for lower zoom levels
+SIMPLIFY_LEVELS = {"low": 250, "medium": 60, "high": 15}
+
+
+def encode_polyline(coords, precision=POLYLINE_PRECISION):
+    """Encodes (lat, lon) pairs with Google's encoded polyline algorithm."""
+    if len(coords) == 0:
+        return ""
+    ints = np.round(np.asarray(coords, dtype=np.float64) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(ints, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    chunks = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def decode_polyline(encoded, precision=POLYLINE_PRECISION):
+    """Decodes an encoded polyline into an (n, 2) array of (lat, lon)."""
+    values = []
+    result = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        result |= (byte & 0x1F) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+            result = shift = 0
+    if not values:
+        return np.empty((0, 2))
+    return np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+
+
+def simplify(coords, tolerance):
+    """
+    Douglas-Peucker simplification of (lat, lon) pairs, `tolerance` in meters.
+    Distances are measured on a local equirectangular projection, which is
+    accurate enough at the scale of a delivery route.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if len(coords) < 3:
+        return coords
+
+    lat0 = math.radians(coords[:, 0].mean())
+    xy = np.column_stack((coords[:, 1] * 111320 * math.cos(lat0), coords[:, 0] * 110540))
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[[0, -1]] = True
+
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[end] - xy[start]
+        offsets = xy[start + 1:end] - xy[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return coords[keep]
+
+
+def encode_levels(coords):
+    """The full encoded geometry plus one simplified variant per SIMPLIFY_LEVELS entry."""
+    return encode_polyline(coords), {
+        level: encode_polyline(simplify(coords, tolerance))
+        for level, tolerance in SIMPLIFY_LEVELS.items()
+    }
+
+
+class MapboxDirectionsClient:
+    """
+    Road geometry of routes through the Mapbox Directions API.
+
+    Directions accepts at most 25 waypoints, so longer routes are fetched in
+    chunks that share their boundary waypoint and are joined afterwards.
+    """
+    MAX_WAYPOINTS = 25
+
+    def __init__(self, access_token=None, base_url=MAPBOX_DIRECTIONS_URL, max_workers=4, timeout=(5, 30)):
+        self.access_token = access_token or os.getenv("MAPBOX_API_KEY")
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = build_session(max_workers)
+
+    def chunks(self, points):
+        step = self.MAX_WAYPOINTS - 1
+        return [points[i:i + self.MAX_WAYPOINTS] for i in range(0, max(len(points) - 1, 1), step)]
+
+    def _fetch_chunk(self, points):
+        coords = ";".join(f"{lon},{lat}" for lat, lon in points)
+        params = {"geometries": "polyline6", "overview": "full", "access_token": self.access_token}
+        response = self.session.get(f"{self.base_url}/{coords}", params=params, timeout=self.timeout)
+        data = response.json()
+        if not data.get("routes"):
+            raise ValueError(f"Error fetching route geometry: {data}")
+        return decode_polyline(data["routes"][0]["geometry"], precision=6)
+
+    def geometry(self, points):
+        """Returns the road geometry through `points` ((lat, lon) pairs) as an (n, 2) array."""
+        if len(points) < 2:
+            return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        parts = [self._fetch_chunk(chunk) for chunk in self.chunks(points)]
+        # Consecutive chunks share a waypoint, so drop each later chunk's first vertex
+        return np.concatenate([parts[0]] + [part[1:] for part in parts[1:]])
+
+    def geometries(self, routes):
+        """
+        Geometry of several routes, fetched concurrently. Routes whose geometry
+        can't be fetched fall back to straight lines between their stops.
+        """
+        def fetch(points):
+            try:
+                return self.geometry(points)
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Falling back to straight route geometry: {e}")
+                return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(fetch, routes))
+
+
+class StraightLineGeometry:
+    """Offline geometry: straight lines between consecutive stops."""
+
+    def geometries(self, routes):
+        return [np.asarray(points, dtype=np.float64).reshape(-1, 2) for points in routes]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_geometry_client(source):
+    """Returns the geometry client for settings.ROUTE_GEOMETRY_SOURCE ("mapbox" or "straight")."""
+    global _client
+    if source == "straight":
+        return StraightLineGeometry()
+    if source != "mapbox":
+        raise ValueError(f"Unknown route geometry source: {source}")
+    with _client_lock:
+        if _client is None:
+            _client = MapboxDirectionsClient()
+        return _client
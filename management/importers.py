@@ -0,0 +1,318 @@
+import codecs
+import csv
+import logging
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .city_registry import get_city_registry, invalidate_city_registry
+from .db import QUERY_CHUNK_SIZE
+from .distance_store import forget_cities
+from .geocoding import get_geocoder
+from .models import City, DailyDistribution, Polygon
+from .summaries import schedule_refresh
+
+logger = logging.getLogger(__name__)
+
+
+class CityCSVImporter:
+    """
+    Imports polygons and their cities from an uploaded CSV where every column
+    header is a polygon title and every cell below it a city in that polygon.
+
+    The upload is parsed incrementally, existing rows are resolved with a few
+    `__in` queries, only cities without coordinates are geocoded (through the
+    cached batch Geocoder), and all
+    writes go through bulk_create / bulk_update in one transaction.
+    """
+
+    def __init__(self, geocoder=None):
+        self.geocoder = geocoder or get_geocoder()
+        self.report = {
+            "rows": 0,
+            "polygons_created": 0,
+            "cities_created": 0,
+            "cities_updated": 0,
+            "memberships": 0,
+            "geocoded": 0,
+            "geocode_failed": 0,
+            "geocode_gazetteer": 0,
+            "geocode_cached": 0,
+            "geocode_api_calls": 0,
+            "timings": {},
+        }
+
+    @contextmanager
+    def _phase(self, name):
+        start = time.perf_counter()
+        yield
+        self.report["timings"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def run(self, uploaded_file):
+        """Imports the file and returns the import report (counts and per-phase timings in ms)."""
+        with self._phase("parse"):
+            titles, city_polygon, memberships = self._parse(uploaded_file)
+
+        with self._phase("resolve"):
+            polygons = {p.title: p for p in Polygon.objects.filter(title__in=titles)}
+            existing = self._existing_cities(list(city_polygon))
+
+        with self._phase("geocode"):
+            missing = [name for name in city_polygon if name not in existing or existing[name].latitude is None]
+            coordinates = self._geocode(missing)
+
+        with self._phase("write"), transaction.atomic():
+            new_polygons = [Polygon(title=title) for title in titles if title not in polygons]
+            Polygon.objects.bulk_create(new_polygons)
+            polygons.update({p.title: p for p in new_polygons})
+            self.report["polygons_created"] = len(new_polygons)
+
+            cities = self._write_cities(city_polygon, existing, polygons, coordinates)
+            self._write_memberships(memberships, polygons, cities)
+            # bulk writes skip signals, so invalidate the city registry ourselves
+            invalidate_city_registry()
+
+        logger.info(f"CSV import finished: {self.report}")
+        return self.report
+
+    def _parse(self, uploaded_file):
+        reader = csv.reader(codecs.iterdecode(uploaded_file, "utf-8-sig"))
+        headers = [title.strip() for title in next(reader)]
+
+        city_polygon = {}   # city name -> title of the last polygon it appeared under
+        memberships = set()  # (polygon title, city name)
+        for row in reader:
+            self.report["rows"] += 1
+            for i, city_name in enumerate(row[:len(headers)]):
+                city_name = city_name.strip()
+                if not city_name:  # Skip empty values
+                    continue
+                city_polygon[city_name] = headers[i]
+                memberships.add((headers[i], city_name))
+
+        titles = list(dict.fromkeys(title for title, _ in memberships))
+        return titles, city_polygon, memberships
+
+    @staticmethod
+    def _existing_cities(names):
+        """Existing cities by CSV name, matched exactly or else case-insensitively ("HAIFA" is Haifa)."""
+        exact, folded = {}, {}
+        for i in range(0, len(names), QUERY_CHUNK_SIZE):
+            chunk = names[i:i + QUERY_CHUNK_SIZE]
+            matches = (
+                City.objects
+                .annotate(name_lower=Lower("name"))
+                .filter(Q(name__in=chunk) | Q(name_lower__in=[name.lower() for name in chunk]))
+            )
+            for city in matches:
+                exact[city.name] = city
+                folded.setdefault(city.name.lower(), city)
+        return {
+            name: exact.get(name) or folded[name.lower()]
+            for name in names if name in exact or name.lower() in folded
+        }
+
+    def _geocode(self, names):
+        stats = {}
+        coordinates = self.geocoder.geocode_many(names, stats=stats)
+        self.report["geocode_gazetteer"] = stats["gazetteer"]
+        self.report["geocode_cached"] = stats["cached"]
+        self.report["geocode_api_calls"] = stats["fetched"] + stats["failed"]
+        self.report["geocode_fuzzy"] = stats["fuzzy"]  # approximate matches worth a look
+        self.report["geocoded"] = len(coordinates)
+        self.report["geocode_failed"] = len(names) - len(coordinates)
+        return coordinates
+
+    def _write_cities(self, city_polygon, existing, polygons, coordinates):
+        new_cities, changed, moved = [], [], []
+        for name, title in city_polygon.items():
+            polygon = polygons[title]
+            latitude, longitude = coordinates.get(name, (None, None))
+            city = existing.get(name)
+
+            if city is None:
+                new_cities.append(City(name=name, latitude=latitude, longitude=longitude, polygon=polygon))
+                continue
+
+            updated = city.polygon_id != polygon.id
+            city.polygon = polygon
+            if name in coordinates:
+                if (city.latitude, city.longitude) != (latitude, longitude):
+                    moved.append(city.id)
+                city.latitude, city.longitude = latitude, longitude
+                updated = True
+            if updated:
+                changed.append(city)
+
+        City.objects.bulk_create(new_cities, batch_size=QUERY_CHUNK_SIZE)
+        City.objects.bulk_update(changed, ["polygon", "latitude", "longitude"], batch_size=QUERY_CHUNK_SIZE)
+        # bulk_update skips signals, so drop the moved cities' stored distances ourselves
+        transaction.on_commit(lambda: forget_cities(moved))
+        self.report["cities_created"] = len(new_cities)
+        self.report["cities_updated"] = len(changed)
+        return {**existing, **{city.name: city for city in new_cities}}
+
+    def _write_memberships(self, memberships, polygons, cities):
+        Membership = Polygon.cities.through
+        links = [
+            Membership(polygon_id=polygons[title].id, city_id=cities[name].id)
+            for title, name in memberships
+        ]
+        Membership.objects.bulk_create(links, batch_size=QUERY_CHUNK_SIZE, ignore_conflicts=True)
+        self.report["memberships"] = len(links)
+
+
+class DistributionImportError(ValueError):
+    """Raised when a distribution payload can't be loaded; `errors` lists every bad row."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid distribution row(s)")
+        self.errors = errors
+
+
+class DistributionImporter:
+    """
+    Loads a day's package distribution from rows keyed by city name or id.
+
+    Cities are resolved in memory through the CityRegistry (names exactly or
+    normalized), duplicate cities are summed, and the rows are written with one
+    bulk_create(update_conflicts=True) on the (session, city) constraint inside
+    a single transaction. Nothing is written if any row is invalid. With
+    `replace`, cities missing from the payload are removed from the day.
+    """
+    CSV_CITY_COLUMNS = ("city", "city_name", "עיר")
+    CSV_PACKAGE_COLUMNS = ("number_of_packages", "packages", "מספר חבילות")
+
+    def __init__(self, workforce, replace=False):
+        self.workforce = workforce
+        self.replace = replace
+        self.report = {
+            "rows": 0,
+            "cities": 0,
+            "removed": 0,
+            "timings": {},
+        }
+
+    @contextmanager
+    def _phase(self, name):
+        start = time.perf_counter()
+        yield
+        self.report["timings"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+    @classmethod
+    def rows_from_json(cls, payload):
+        """Accepts a list of rows or {"distributions": [...]}; each row has "city" or "city_id" and "packages"."""
+        if isinstance(payload, dict):
+            payload = payload.get("distributions")
+        if not isinstance(payload, list):
+            raise DistributionImportError(["Expected a list of distributions"])
+        return payload
+
+    @classmethod
+    def rows_from_csv(cls, uploaded_file):
+        """Reads rows from a CSV with a city (name) or city_id column and a packages column."""
+        reader = csv.DictReader(codecs.iterdecode(uploaded_file, "utf-8-sig"))
+        columns = {name.strip(): name for name in reader.fieldnames or []}
+        city_column = next((columns[c] for c in cls.CSV_CITY_COLUMNS if c in columns), None)
+        id_column = columns.get("city_id")
+        package_column = next((columns[c] for c in cls.CSV_PACKAGE_COLUMNS if c in columns), None)
+        if package_column is None or (city_column is None and id_column is None):
+            raise DistributionImportError(["CSV needs a city or city_id column and a packages column"])
+
+        for row in reader:
+            yield {
+                "city": (row.get(city_column) or "").strip() if city_column else "",
+                "city_id": (row.get(id_column) or "").strip() if id_column else "",
+                "packages": (row.get(package_column) or "").strip(),
+            }
+
+    def run(self, rows):
+        """Loads the rows and returns the import report; raises DistributionImportError on bad input."""
+        with self._phase("parse"):
+            entries, errors = self._parse(rows)
+
+        with self._phase("resolve"):
+            cities, unknown = self._resolve(entries)
+            errors.extend(f"Row {row}: unknown city {key!r}" for row, key in unknown)
+        if errors:
+            raise DistributionImportError(errors)
+
+        packages = {}
+        for (_, _, count), city_id in zip(entries, cities):
+            packages[city_id] = packages.get(city_id, 0) + count
+
+        with self._phase("write"), transaction.atomic():
+            distributions = [
+                DailyDistribution(session=self.workforce, city_id=city_id, number_of_packages=count)
+                for city_id, count in packages.items()
+            ]
+            DailyDistribution.objects.bulk_create(
+                distributions,
+                batch_size=QUERY_CHUNK_SIZE,
+                update_conflicts=True,
+                unique_fields=["session", "city"],
+                update_fields=["number_of_packages"],
+            )
+            if self.replace:
+                removed, _ = (
+                    DailyDistribution.objects
+                    .filter(session=self.workforce)
+                    .exclude(city_id__in=list(packages))
+                    .delete()
+                )
+                self.report["removed"] = removed
+            # bulk_create skips signals, so refresh the day's Summary ourselves
+            schedule_refresh(self.workforce.id)
+
+        self.report["cities"] = len(packages)
+        logger.info(f"Distribution import for {self.workforce.date} finished: {self.report}")
+        return self.report
+
+    def _parse(self, rows):
+        entries, errors = [], []  # entries: (row number, city name or id, packages)
+        for number, row in enumerate(rows, start=1):
+            self.report["rows"] += 1
+            if not isinstance(row, dict):
+                errors.append(f"Row {number}: expected an object")
+                continue
+
+            city_id = row.get("city_id")
+            name = row.get("city")
+            packages = row.get("packages", row.get("number_of_packages"))
+            try:
+                packages = int(packages)
+                if packages < 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors.append(f"Row {number}: invalid package count {packages!r}")
+                continue
+
+            if city_id not in (None, ""):
+                try:
+                    entries.append((number, int(city_id), packages))
+                except (TypeError, ValueError):
+                    errors.append(f"Row {number}: invalid city id {city_id!r}")
+            elif isinstance(name, str) and name.strip():
+                entries.append((number, name.strip(), packages))
+            else:
+                errors.append(f"Row {number}: missing city")
+        return entries, errors
+
+    @staticmethod
+    def _resolve(entries):
+        """Maps every entry to its City.id; returns (ids, [(row, key) of unknown cities])."""
+        registry = get_city_registry(check=True)
+
+        resolved, unknown = [], []
+        for row, key, _ in entries:
+            if isinstance(key, int):
+                city_id = key if key in registry else None
+            else:
+                city_id = registry.find(key)
+            if city_id is None:
+                unknown.append((row, key))
+            resolved.append(city_id)
+        return resolved, unknown
@@ -0,0 +1,136 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import RouteJob
+from .route_generation import generate_routes
+from .stopping import StoppingPolicy
+from .timing import timeline
+
+logger = logging.getLogger(__name__)
+
+# Inserts tried when the one-active-job constraint rejects a job whose rival just finished
+SUBMIT_ATTEMPTS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ROUTE_JOB_WORKERS,
+                thread_name_prefix="route-job",
+            )
+        return _executor
+
+
+def expire_stale_jobs(summary=None):
+    """
+    Marks queued or running jobs that outlived their solver time limit by
+    ROUTE_JOB_STALE_AFTER seconds as failed, so a job whose process died
+    doesn't block route generation forever. Returns how many were expired.
+    """
+    now = timezone.now()
+    default_runtime = StoppingPolicy.from_settings().params["max_runtime"]
+    jobs = RouteJob.objects.filter(status__in=RouteJob.ACTIVE_STATUSES)
+    if summary is not None:
+        jobs = jobs.filter(summary=summary)
+
+    stale = [
+        job_id
+        for job_id, created_at, started_at, max_runtime in
+        jobs.values_list("id", "created_at", "started_at", "max_runtime")
+        if (started_at or created_at) + timedelta(
+            seconds=(max_runtime or default_runtime) + settings.ROUTE_JOB_STALE_AFTER
+        ) < now
+    ]
+    if stale:
+        RouteJob.objects.filter(id__in=stale, status__in=RouteJob.ACTIVE_STATUSES).update(
+            status=RouteJob.FAILED, error="Timed out: the job stopped reporting", finished_at=now,
+        )
+        logger.warning(f"Marked stale route jobs {stale} as failed")
+    return len(stale)
+
+
+def submit_route_job(summary, max_runtime=None, max_iterations=None):
+    """
+    Queues route generation for a Summary and returns its RouteJob right away.
+    A Summary that already has a queued or running job gets that job back; the
+    unique_active_job_per_summary constraint settles concurrent submissions.
+    """
+    expire_stale_jobs(summary)
+    for attempt in range(SUBMIT_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                job = RouteJob.objects.create(
+                    summary=summary, max_runtime=max_runtime, max_iterations=max_iterations
+                )
+            break
+        except IntegrityError:
+            active = summary.jobs.filter(status__in=RouteJob.ACTIVE_STATUSES).first()
+            if active:
+                logger.info(f"Route job {active.id} already active for {summary}")
+                return active
+            # Either the active job finished in the meantime (try again) or the
+            # error is not the one-active-job constraint (e.g. the Summary is gone)
+            if attempt == SUBMIT_ATTEMPTS - 1:
+                raise
+
+    if settings.ROUTE_JOB_WORKERS:
+        _get_executor().submit(run_route_job, job.id)
+    else:
+        run_route_job(job.id)
+        job.refresh_from_db()
+    return job
+
+
+def run_route_job(job_id):
+    """Worker entry point: runs one RouteJob and records how it ended."""
+    try:
+        job = RouteJob.objects.select_related("summary__depot").get(id=job_id)
+        if not RouteJob.objects.filter(id=job_id, status=RouteJob.PENDING).update(
+            status=RouteJob.RUNNING, started_at=timezone.now()
+        ):
+            logger.warning(f"Route job {job_id} is no longer pending; not running it")
+            return
+
+        try:
+            with timeline(f"route-job-{job_id}") as run:
+                routes_count, stats = generate_routes(
+                    job.summary, max_runtime=job.max_runtime, max_iterations=job.max_iterations
+                )
+        except Exception as e:
+            logger.exception(f"Route job {job_id} failed")
+            RouteJob.objects.filter(id=job_id).update(
+                status=RouteJob.FAILED, error=str(e), finished_at=timezone.now(),
+                timings=run.as_dict(), duration_ms=run.total_ms,
+            )
+            return
+
+        RouteJob.objects.filter(id=job_id).update(
+            status=RouteJob.DONE,
+            routes_count=routes_count,
+            runtime_budget=stats.get("max_runtime"),
+            no_improvement_budget=stats.get("no_improvement"),
+            iterations=stats.get("iterations"),
+            best_iteration=stats.get("best_iteration"),
+            warm_start=bool(stats.get("warm_start")),
+            num_clients=stats.get("num_clients"),
+            objective=stats.get("objective"),
+            timings=run.as_dict(),
+            duration_ms=run.total_ms,
+            finished_at=timezone.now(),
+        )
+        logger.info(f"Route job {job_id} finished with {routes_count} routes")
+    finally:
+        # Worker threads own their connection; don't leak one per job.
+        if settings.ROUTE_JOB_WORKERS:
+            connection.close()
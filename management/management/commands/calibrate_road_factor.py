@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from management.distance_providers import HaversineDistanceProvider
+from management.distance_store import DistanceStore, get_distance_store
+from management.models import Polygon
+
+
+class Command(BaseCommand):
+    help = "Calibrates the offline road circuity factors per polygon from Mapbox distances in the distance store."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=settings.ROAD_FACTORS_FILE,
+                            help="JSON file to write the factors to (default: settings.ROAD_FACTORS_FILE)")
+
+    def handle(self, *args, **options):
+        store = get_distance_store()
+        samples = []
+
+        for polygon in Polygon.objects.prefetch_related("all_cities"):
+            cities = [c for c in polygon.all_cities.all() if c.latitude is not None and c.longitude is not None]
+            if len(cities) < 2:
+                continue
+            keys = [DistanceStore.city_key(c.id) for c in cities]
+            points = [(c.latitude, c.longitude) for c in cities]
+            samples.append((polygon.title, points, store.observed(keys)))
+
+        provider = HaversineDistanceProvider.calibrate(samples)
+        provider.save(options["output"])
+
+        for region, data in provider.regions.items():
+            self.stdout.write(f"{region}: {data['factor']} ({data['pairs']} pairs)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Default road factor {provider.road_factor} written to {options['output']}"
+        ))
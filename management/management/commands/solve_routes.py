@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from management.batch_solver import solve_summaries
+from management.models import Summary
+
+
+def _date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f"Invalid date: {value}")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Solves the routes of every Summary in a date range, one solve per CPU core."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", type=_date, required=True, help="First date (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="date_to", type=_date, help="Last date, inclusive (default: --from)")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="Solver processes (default: number of cores, 1 solves in-process)")
+        parser.add_argument("--max-runtime", type=float, help="Per-day runtime budget in seconds")
+        parser.add_argument("--max-iterations", type=int, help="Per-day iteration budget")
+        parser.add_argument("--no-warm-start", action="store_true", help="Ignore the days' current routes")
+        parser.add_argument("--skip-geometry", action="store_true", help="Don't fetch road geometry for the routes")
+
+    def handle(self, *args, **options):
+        date_to = options["date_to"] or options["date_from"]
+        if date_to < options["date_from"]:
+            raise CommandError("--to must not be before --from")
+
+        summaries = list(
+            Summary.objects
+            .filter(date__range=(options["date_from"], date_to), depot__isnull=False)
+            .select_related("depot")
+            .order_by("date")
+        )
+        if not summaries:
+            raise CommandError(f"No summaries between {options['date_from']} and {date_to}")
+
+        self.stdout.write(f"Solving {len(summaries)} day(s) with {options['workers']} worker(s)...")
+        start = time.perf_counter()
+        failed = 0
+        for summary, routes_count, error in solve_summaries(
+            summaries,
+            workers=options["workers"],
+            max_runtime=options["max_runtime"],
+            max_iterations=options["max_iterations"],
+            warm_start=not options["no_warm_start"],
+            geometry=not options["skip_geometry"],
+        ):
+            if error:
+                failed += 1
+                self.stderr.write(self.style.ERROR(f"{summary.date}: {error}"))
+            else:
+                self.stdout.write(f"{summary.date}: {routes_count} routes")
+
+        elapsed = time.perf_counter() - start
+        message = f"Solved {len(summaries) - failed}/{len(summaries)} day(s) in {elapsed:.1f}s"
+        self.stdout.write(self.style.SUCCESS(message) if not failed else self.style.WARNING(message))
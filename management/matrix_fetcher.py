@@ -0,0 +1,180 @@
+import itertools
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+MAPBOX_MATRIX_URL = "https://api.mapbox.com/directions-matrix/v1/mapbox/driving"
+
+
+def build_session(pool_size, retries=3, backoff_factor=0.5):
+    """A requests.Session with a connection pool and retries with exponential backoff."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class MapboxMatrixFetcher:
+    """
+    Fetches driving distance matrices of any size from the Mapbox matrix API.
+
+    Mapbox accepts at most 25 coordinates per request, so the requested
+    sources x destinations matrix is cut into tiles whose coordinates fit in
+    one request. Tiles are fetched concurrently over a pooled session with
+    retries and exponential backoff, then stitched into one array.
+
+    A coordinate that is both a source and a destination is sent once, so
+    when the two sets overlap (a square matrix above all) tiles are built over
+    blocks of points instead: any 25 points are a single request.
+    """
+    MAX_COORDINATES = 25
+
+    def __init__(self, access_token=None, base_url=MAPBOX_MATRIX_URL, max_workers=8,
+                 retries=3, backoff_factor=0.5, timeout=(5, 30)):
+        self.access_token = access_token or os.getenv("MAPBOX_API_KEY")
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        self.session = build_session(max_workers, retries, backoff_factor)
+
+    @classmethod
+    def tile_shape(cls, num_sources, num_destinations):
+        """
+        Picks the tile size (sources, destinations) that needs the fewest requests
+        while keeping every tile within MAX_COORDINATES.
+        """
+        best = None
+        for rows in range(1, min(num_sources, cls.MAX_COORDINATES - 1) + 1):
+            cols = min(num_destinations, cls.MAX_COORDINATES - rows)
+            requests_needed = math.ceil(num_sources / rows) * math.ceil(num_destinations / cols)
+            if best is None or requests_needed < best[0]:
+                best = (requests_needed, rows, cols)
+        return best[1], best[2]
+
+    @classmethod
+    def block_tiles(cls, sources, destinations):
+        """
+        Tiles for overlapping sources and destinations. The distinct points are
+        cut into blocks of half a request; every pair of blocks holding a
+        source and a destination is one request over both blocks, which also
+        covers each block with itself.
+        """
+        points = list(dict.fromkeys([*sources, *destinations]))
+        if len(points) <= cls.MAX_COORDINATES:
+            return [(sources, destinations)]
+
+        source_set, destination_set = set(sources), set(destinations)
+        size = cls.MAX_COORDINATES // 2
+        blocks = [points[i:i + size] for i in range(0, len(points), size)]
+        block_sources = [[p for p in block if p in source_set] for block in blocks]
+        block_destinations = [[p for p in block if p in destination_set] for block in blocks]
+
+        tiles, covered = [], set()
+        for i, j in itertools.combinations(range(len(blocks)), 2):
+            if (block_sources[i] and block_destinations[j]) or (block_sources[j] and block_destinations[i]):
+                tiles.append((block_sources[i] + block_sources[j], block_destinations[i] + block_destinations[j]))
+                covered.update((i, j))
+        for i in range(len(blocks)):
+            if i not in covered and block_sources[i] and block_destinations[i]:
+                tiles.append((block_sources[i], block_destinations[i]))
+        return tiles
+
+    def tiles(self, sources, destinations):
+        """Returns (source_chunk, destination_chunk) index lists covering the whole matrix in the fewest requests."""
+        rows, cols = self.tile_shape(len(sources), len(destinations))
+        tiles = [
+            (sources[i:i + rows], destinations[j:j + cols])
+            for i in range(0, len(sources), rows)
+            for j in range(0, len(destinations), cols)
+        ]
+        if set(sources) & set(destinations):
+            blocks = self.block_tiles(sources, destinations)
+            if len(blocks) < len(tiles):
+                return blocks
+        return tiles
+
+    def _fetch_tile(self, points, tile_sources, tile_destinations):
+        # Sources and destinations may overlap; send every coordinate only once.
+        tile_points = list(dict.fromkeys([*tile_sources, *tile_destinations]))
+        position = {point: idx for idx, point in enumerate(tile_points)}
+
+        coords = ";".join(f"{points[i][1]},{points[i][0]}" for i in tile_points)
+        params = {
+            "annotations": "distance",
+            "sources": ";".join(str(position[i]) for i in tile_sources),
+            "destinations": ";".join(str(position[i]) for i in tile_destinations),
+            "access_token": self.access_token,
+        }
+        response = self.session.get(f"{self.base_url}/{coords}", params=params, timeout=self.timeout)
+        data = response.json()
+
+        if "distances" not in data:
+            raise ValueError(f"Error fetching distance matrix tile: {data}")
+        return np.array(data["distances"], dtype=np.float64)
+
+    def fetch(self, points, sources=None, destinations=None):
+        """
+        Returns the driving distances in meters from `sources` to `destinations`
+        (indices into `points`, a list of (lat, lon); all points by default),
+        or None if any tile could not be fetched.
+        """
+        sources = list(range(len(points))) if sources is None else [int(i) for i in sources]
+        destinations = list(range(len(points))) if destinations is None else [int(i) for i in destinations]
+        matrix = np.empty((len(sources), len(destinations)), dtype=np.float64)
+        if not sources or not destinations:
+            return matrix
+
+        source_pos = {point: idx for idx, point in enumerate(sources)}
+        destination_pos = {point: idx for idx, point in enumerate(destinations)}
+        tiles = list(self.tiles(sources, destinations))
+        logger.info(f"Fetching {len(sources)}x{len(destinations)} distance matrix in {len(tiles)} tile(s).")
+
+        workers = min(self.max_workers, len(tiles))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (tile, executor.submit(self._fetch_tile, points, *tile))
+                for tile in tiles
+            ]
+            try:
+                for (tile_sources, tile_destinations), future in futures:
+                    rows = [source_pos[i] for i in tile_sources]
+                    cols = [destination_pos[i] for i in tile_destinations]
+                    matrix[np.ix_(rows, cols)] = future.result()
+            except (requests.RequestException, ValueError) as e:
+                logger.error(f"Distance matrix fetch failed: {e}")
+                for _, future in futures:
+                    future.cancel()
+                return None
+
+        return matrix
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_matrix_fetcher():
+    """Returns the process-wide fetcher, so solves share one connection pool."""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = MapboxMatrixFetcher()
+        return _fetcher
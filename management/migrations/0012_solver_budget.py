@@ -0,0 +1,53 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0011_routejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routejob',
+            name='best_iteration',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='routejob',
+            name='iterations',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='routejob',
+            name='max_iterations',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='routejob',
+            name='max_runtime',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='routejob',
+            name='no_improvement_budget',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='routejob',
+            name='runtime_budget',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='max_iterations',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='max_runtime',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
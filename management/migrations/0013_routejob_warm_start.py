@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0012_solver_budget'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routejob',
+            name='warm_start',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+ROUTE_SEPARATOR = " ← "
+PART_SUFFIX = " (part)"
+
+
+def route_strings_to_stops(apps, schema_editor):
+    """
+    Converts the " ← "-joined route strings into RouteStop rows. Quantities are
+    recovered by re-splitting the day's distribution the way LocationSplitter
+    does (full parts first, the remainder on the unmarked entry); leg distances
+    were never stored and stay empty.
+    """
+    RouteSolution = apps.get_model('management', 'RouteSolution')
+    RouteStop = apps.get_model('management', 'RouteStop')
+    City = apps.get_model('management', 'City')
+    Depot = apps.get_model('management', 'Depot')
+    DailyDistribution = apps.get_model('management', 'DailyDistribution')
+
+    cities = {city.name.lower(): city for city in City.objects.all()}
+    depots = {depot.name.lower(): depot for depot in Depot.objects.all()}
+    packages_by_date = {}
+    stops = []
+
+    for solution in RouteSolution.objects.select_related('summary'):
+        summary = solution.summary
+        if summary.date not in packages_by_date:
+            packages_by_date[summary.date] = {
+                dist.city_id: dist.number_of_packages
+                for dist in DailyDistribution.objects.filter(session__date=summary.date)
+            }
+        packages = packages_by_date[summary.date]
+        capacity = int(summary.std_dev_max) or 1
+
+        names = [name.strip() for name in solution.route.split(ROUTE_SEPARATOR) if name.strip()]
+        for sequence, name in enumerate(names, start=1):
+            base_name = name.replace(PART_SUFFIX, "")
+            city = cities.get(base_name.lower())
+            depot = None if city else depots.get(base_name.lower())
+            quantity = 0
+            if city:
+                total = packages.get(city.id, 0)
+                quantity = capacity if name.endswith(PART_SUFFIX) else (total % capacity or min(total, capacity))
+            stops.append(RouteStop(route=solution, sequence=sequence, city=city, depot=depot, quantity=quantity))
+
+    RouteStop.objects.bulk_create(stops, batch_size=500)
+
+
+def stops_to_route_strings(apps, schema_editor):
+    RouteSolution = apps.get_model('management', 'RouteSolution')
+    RouteStop = apps.get_model('management', 'RouteStop')
+
+    routes = {}
+    for stop in RouteStop.objects.select_related('city', 'depot').order_by('route_id', 'sequence'):
+        location = stop.city or stop.depot
+        routes.setdefault(stop.route_id, []).append(location.name if location else "")
+    for solution in RouteSolution.objects.all():
+        solution.route = ROUTE_SEPARATOR.join(routes.get(solution.id, []))
+        solution.save(update_fields=['route'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0013_routejob_warm_start'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('leg_distance', models.FloatField(blank=True, null=True)),
+                ('city', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='management.city')),
+                ('depot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='management.depot')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='management.routesolution')),
+            ],
+            options={
+                'ordering': ['route', 'sequence'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='routestop',
+            constraint=models.UniqueConstraint(fields=('route', 'sequence'), name='unique_route_stop_sequence'),
+        ),
+        migrations.RunPython(route_strings_to_stops, stops_to_route_strings),
+        # A default lets the column be re-added when migrating backwards
+        migrations.AlterField(
+            model_name='routesolution',
+            name='route',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='routesolution',
+            name='route',
+        ),
+    ]
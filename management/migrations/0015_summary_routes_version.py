@@ -0,0 +1,23 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0014_routestop'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='routes_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='routes_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
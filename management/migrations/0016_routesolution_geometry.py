@@ -0,0 +1,23 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0015_summary_routes_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routesolution',
+            name='geometry',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='routesolution',
+            name='geometry_levels',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0017_geocodecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routejob',
+            name='duration_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='routejob',
+            name='num_clients',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='routejob',
+            name='objective',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='routejob',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+def drop_duplicate_distributions(apps, schema_editor):
+    """Keeps the newest row of every (session, city) pair so the constraint can be added."""
+    DailyDistribution = apps.get_model('management', 'DailyDistribution')
+
+    seen = set()
+    duplicates = []
+    for dist_id, session_id, city_id in DailyDistribution.objects.order_by('-id').values_list('id', 'session_id', 'city_id'):
+        if session_id is None:
+            continue  # NULL sessions never conflict
+        if (session_id, city_id) in seen:
+            duplicates.append(dist_id)
+        seen.add((session_id, city_id))
+    for i in range(0, len(duplicates), 500):
+        DailyDistribution.objects.filter(id__in=duplicates[i:i + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0018_routejob_timings'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_distributions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailydistribution',
+            constraint=models.UniqueConstraint(fields=('session', 'city'), name='unique_session_city'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0019_dailydistribution_unique_session_city'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
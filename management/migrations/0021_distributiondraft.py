@@ -0,0 +1,30 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0020_entityversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistributionDraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number_of_packages', models.PositiveIntegerField()),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='management.city')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drafts', to='management.dailyworkforce')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='distributiondraft',
+            constraint=models.UniqueConstraint(fields=('session', 'city'), name='unique_draft_session_city'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0021_distributiondraft'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='city',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='city_name_lower'),
+        ),
+        migrations.AddIndex(
+            model_name='routesolution',
+            index=models.Index(fields=['summary', 'driver_id'], name='routesolution_summary_driver'),
+        ),
+    ]
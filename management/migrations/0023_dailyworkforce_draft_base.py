@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0022_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyworkforce',
+            name='draft_base',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+def fail_duplicate_active_jobs(apps, schema_editor):
+    """Keeps the newest queued/running job of every Summary and marks the rest failed."""
+    RouteJob = apps.get_model('management', 'RouteJob')
+
+    seen = set()
+    duplicates = []
+    for job_id, summary_id in (
+        RouteJob.objects.filter(status__in=['pending', 'running']).order_by('-id').values_list('id', 'summary_id')
+    ):
+        if summary_id in seen:
+            duplicates.append(job_id)
+        seen.add(summary_id)
+    for i in range(0, len(duplicates), 500):
+        RouteJob.objects.filter(id__in=duplicates[i:i + 500]).update(
+            status='failed', error='Superseded by a newer job'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0023_dailyworkforce_draft_base'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='routejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('summary',), name='unique_active_job_per_summary'),
+        ),
+    ]
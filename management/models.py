@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.urls import reverse
+from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,29 +26,132 @@ class Summary(models.Model):
     std_dev_max = models.FloatField()
     package_distribution = models.TextField()  # ✅ Store formatted package list as text
     depot = models.ForeignKey(Depot, on_delete=models.CASCADE, null=True)
+    # Optional solver budget overrides for this day (see StoppingPolicy)
+    max_runtime = models.FloatField(null=True, blank=True)
+    max_iterations = models.PositiveIntegerField(null=True, blank=True)
+    # Bumped whenever the routes are rewritten; keys the cached /route_data/ payload
+    routes_version = models.PositiveIntegerField(default=0)
+    routes_updated_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Summary for {self.date}"
 
+    @property
+    def routes_cache_key(self):
+        """Identifies the current state of the routes (row ids can be reused, so the timestamp is included)."""
+        stamp = int(self.routes_updated_at.timestamp() * 1_000_000) if self.routes_updated_at else 0
+        return f"{self.pk}-{self.routes_version}-{stamp}"
+
+    def bump_routes_version(self):
+        """Marks the routes as changed so cached route payloads and ETags go stale."""
+        now = timezone.now()
+        Summary.objects.filter(pk=self.pk).update(routes_version=F("routes_version") + 1, routes_updated_at=now)
+        self.refresh_from_db(fields=["routes_version", "routes_updated_at"])
+
 
 class RouteSolution(models.Model):
     summary = models.ForeignKey(Summary, on_delete=models.CASCADE, related_name="solutions")
     driver_id = models.IntegerField()
-    route = models.TextField()
+    # Road geometry as an encoded polyline, plus simplified variants keyed by level
+    geometry = models.TextField(blank=True, default="")
+    geometry_levels = models.JSONField(blank=True, default=dict)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["summary", "driver_id"], name="routesolution_summary_driver"),
+        ]
 
     def __str__(self):
         return f"Driver {self.driver_id} - {self.summary.date}"
 
 
+class RouteStop(models.Model):
+    route = models.ForeignKey(RouteSolution, on_delete=models.CASCADE, related_name="stops")
+    sequence = models.PositiveIntegerField()
+    city = models.ForeignKey('City', on_delete=models.CASCADE, null=True, blank=True)
+    depot = models.ForeignKey(Depot, on_delete=models.CASCADE, null=True, blank=True)
+    quantity = models.PositiveIntegerField(default=0)
+    leg_distance = models.FloatField(null=True, blank=True)  # km from the previous stop
+
+    class Meta:
+        ordering = ["route", "sequence"]
+        constraints = [
+            models.UniqueConstraint(fields=["route", "sequence"], name="unique_route_stop_sequence"),
+        ]
+
+    @property
+    def location(self):
+        return self.city or self.depot
+
+    def __str__(self):
+        return f"{self.route} #{self.sequence} - {self.location}"
+
+
+class RouteJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+    ACTIVE_STATUSES = (PENDING, RUNNING)
+
+    summary = models.ForeignKey(Summary, on_delete=models.CASCADE, related_name="jobs")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    routes_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Budget overrides requested for this run
+    max_runtime = models.FloatField(null=True, blank=True)
+    max_iterations = models.PositiveIntegerField(null=True, blank=True)
+    # Budget the stopping policy chose and how the search used it
+    runtime_budget = models.FloatField(null=True, blank=True)
+    no_improvement_budget = models.PositiveIntegerField(null=True, blank=True)
+    iterations = models.PositiveIntegerField(null=True, blank=True)
+    best_iteration = models.PositiveIntegerField(null=True, blank=True)
+    warm_start = models.BooleanField(default=False)
+    # Instance size, result and where the time went (stage -> ms, see management/timing.py)
+    num_clients = models.PositiveIntegerField(null=True, blank=True)
+    objective = models.FloatField(null=True, blank=True)
+    timings = models.JSONField(blank=True, default=dict)
+    duration_ms = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # At most one queued or running job per Summary (see jobs.submit_route_job)
+            models.UniqueConstraint(
+                fields=["summary"], condition=models.Q(status__in=["pending", "running"]),
+                name="unique_active_job_per_summary",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Route job {self.id} - {self.summary.date} ({self.status})"
+
+
 class DailyWorkForce(models.Model):
     date = models.DateField(unique=True)
     number_of_drivers = models.PositiveIntegerField()
     depot = models.ForeignKey('Depot', on_delete=models.CASCADE, null=True)
     summary = models.ForeignKey('Summary', on_delete=models.CASCADE, related_name='workforces', null=True, blank=True)
+    # Fingerprint of the saved distribution the open draft was copied from; empty when there is no draft
+    draft_base = models.CharField(max_length=64, blank=True, default="")
 
     def __str__(self):
         return f"{self.date} - {self.number_of_drivers} נהגים"
 
+    def discard_draft(self):
+        """Drops the day's draft, if any (see management/drafts.py)."""
+        self.drafts.all().delete()
+        DailyWorkForce.objects.filter(id=self.id).update(draft_base="")
+        self.draft_base = ""
+
 
 class DailyDistribution(models.Model):
     session = models.ForeignKey(
@@ -58,13 +164,34 @@ class DailyDistribution(models.Model):
     number_of_packages = models.PositiveIntegerField()
 
     class Meta:
-        # unique_together = ('session', 'city')  # ✅ Consider enforcing if applicable
-        pass
+        constraints = [
+            models.UniqueConstraint(fields=["session", "city"], name="unique_session_city"),
+        ]
 
     def __str__(self):
         return f"{self.session.date} - {self.city}"
 
 
+class DistributionDraft(models.Model):
+    """
+    The working copy of a day's distribution while dispatchers edit it. Every
+    change touches one row; sending the day promotes the draft to
+    DailyDistribution in bulk (see management/drafts.py).
+    """
+    session = models.ForeignKey(DailyWorkForce, on_delete=models.CASCADE, related_name="drafts")
+    city = models.ForeignKey('City', on_delete=models.CASCADE)
+    number_of_packages = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=["session", "city"], name="unique_draft_session_city"),
+        ]
+
+    def __str__(self):
+        return f"Draft {self.session.date} - {self.city}"
+
+
 class Polygon(models.Model):
     title = models.TextField(unique=True)
     cities = models.ManyToManyField("City", related_name='edit_city')
@@ -82,5 +209,57 @@ class City(models.Model):
     longitude = models.FloatField(null=True)
     polygon = models.ForeignKey(Polygon, null=True, on_delete=models.CASCADE, related_name="all_cities")
 
+    class Meta:
+        indexes = [
+            # Case-insensitive name lookups (Lower("name")); SQLite's lower() folds ASCII only
+            models.Index(Lower("name"), name="city_name_lower"),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        city = super().from_db(db, field_names, values)
+        # Lets the post_save handler tell whether the city moved (see signals.city_changed)
+        city.loaded_coordinates = (city.__dict__.get("latitude"), city.__dict__.get("longitude"))
+        return city
+
+class GeocodeCache(models.Model):
+    """
+    Geocoding answers keyed by normalized city name. Names the geocoder could
+    not find are cached too (found=False, no coordinates) so they are not
+    looked up again on every upload.
+    """
+    name = models.TextField(unique=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    found = models.BooleanField(default=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} ({self.latitude}, {self.longitude})" if self.found else f"{self.name} (not found)"
+
+
+class EntityVersion(models.Model):
+    """
+    A counter per kind of data (e.g. "cities") that is bumped whenever that data
+    changes, so every worker process can tell its in-memory copy is stale.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"{self.name} v{self.version}"
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, name, initial=1):
+        """Increments the counter, creating it at `initial` on first use."""
+        if not cls.objects.filter(name=name).update(version=F("version") + 1):
+            _, created = cls.objects.get_or_create(name=name, defaults={"version": initial})
+            if not created:  # Created concurrently, bump it now that it exists
+                cls.objects.filter(name=name).update(version=F("version") + 1)
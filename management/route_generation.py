@@ -0,0 +1,144 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from .distance_store import get_distance_store
+from .geometry import encode_levels, get_geometry_client
+from .models import DailyDistribution, RouteSolution, RouteStop
+from .timing import span
+from .utils import LocationSplitter
+from .vrp_solver import VRPSolver
+
+logger = logging.getLogger(__name__)
+
+
+class RouteGenerationError(Exception):
+    """Raised when no routes could be generated for a Summary."""
+
+
+def build_solver(summary, max_runtime=None, max_iterations=None, warm_start=True, **solver_options):
+    """
+    Loads a Summary's distributions, splits large cities and returns the VRPSolver
+    for the day. With `warm_start`, the Summary's current routes seed the search.
+    """
+    with span("load_distributions"):
+        distributions = list(DailyDistribution.objects.filter(session__date=summary.date).select_related("city"))
+    raw_locations = [
+        (dist.city.name, dist.city.latitude, dist.city.longitude, dist.number_of_packages)
+        for dist in distributions
+    ]
+    city_ids = {dist.city.name: dist.city.id for dist in distributions}
+    regions = {dist.city.name: dist.city.polygon_id for dist in distributions if dist.city.polygon_id}
+
+    previous_routes = []
+    if warm_start:
+        with span("load_previous_routes"):
+            previous_routes = [
+                [stop.location.name for stop in stops if stop.city_id]
+                for _, stops in load_routes(summary)
+            ]
+
+    with span("split"):
+        split_locations = LocationSplitter.split(raw_locations, int(summary.std_dev_max))
+    return VRPSolver(
+        summary, split_locations, city_ids=city_ids, distance_store=get_distance_store(),
+        max_runtime=max_runtime, max_iterations=max_iterations, warm_start_routes=previous_routes,
+        regions=regions, **solver_options,
+    )
+
+
+def generate_routes(summary, max_runtime=None, max_iterations=None, warm_start=True):
+    """
+    Runs the whole route pipeline for a Summary: builds its solver, solves the
+    VRP and replaces the Summary's RouteSolution rows.
+    Returns the number of routes saved and the solver's stats.
+    """
+    solver = build_solver(summary, max_runtime, max_iterations, warm_start)
+    with span("solve"):
+        optimized_routes = solver.solve_vrp()
+    logger.info(f"Optimized routes: {optimized_routes}")
+
+    if not optimized_routes:
+        raise RouteGenerationError(f"No routes found for {summary}")
+
+    with span("save_routes"):
+        save_routes(summary, solver)
+    with span("geometry"):
+        store_route_geometries(summary)
+    return len(optimized_routes), solver.solve_stats
+
+
+def save_routes(summary, solver):
+    """Replaces the Summary's routes and their stops with the solver's solution."""
+    depot_name = summary.depot.name
+    depot_normalized = depot_name.replace("מרלוג", "").strip(" ()")
+
+    solutions = [RouteSolution(summary=summary, driver_id=driver_id)
+                 for driver_id in range(1, len(solver.routes) + 1)]
+
+    with transaction.atomic():
+        RouteSolution.objects.filter(summary=summary).delete()
+        RouteSolution.objects.bulk_create(solutions)
+
+        stops = []
+        for solution, route in zip(solutions, solver.routes):
+            route = sorted(route, key=lambda idx: depot_normalized in solver.LOCATIONS[idx - 1][0], reverse=True)
+            previous = 0
+            for sequence, idx in enumerate(route, start=1):
+                name, _, _, packages = solver.LOCATIONS[idx - 1]
+                stops.append(RouteStop(
+                    route=solution,
+                    sequence=sequence,
+                    city_id=solver.city_ids.get(LocationSplitter.base_name(name)),
+                    quantity=packages,
+                    leg_distance=float(solver.distance_matrix[previous, idx]),
+                ))
+                previous = idx
+        RouteStop.objects.bulk_create(stops)
+        summary.bump_routes_version()
+    logger.info("Routes saved successfully.")
+
+
+def store_route_geometries(summary):
+    """
+    Computes the road geometry of every route of a Summary once, and stores it
+    encoded (full and simplified per zoom level) on the RouteSolution rows.
+    """
+    depot = summary.depot
+    routes = load_routes(summary)
+    point_lists = [
+        [(depot.latitude, depot.longitude)] + [
+            (stop.location.latitude, stop.location.longitude)
+            for stop in stops
+            if stop.location is not None and stop.location.latitude is not None
+        ]
+        for _, stops in routes
+    ]
+
+    geometries = get_geometry_client(settings.ROUTE_GEOMETRY_SOURCE).geometries(point_lists)
+    solutions = []
+    for (solution, _), coords in zip(routes, geometries):
+        solution.geometry, solution.geometry_levels = encode_levels(coords)
+        solutions.append(solution)
+
+    RouteSolution.objects.bulk_update(solutions, ["geometry", "geometry_levels"])
+    summary.bump_routes_version()
+    logger.info(f"Stored geometry for {len(solutions)} routes.")
+
+
+def load_routes(summary):
+    """
+    Returns [(RouteSolution, [RouteStop, ...]), ...] for a Summary, ordered by
+    driver and sequence, with cities and depots joined in a single query.
+    """
+    routes = {}
+    stops = (
+        RouteStop.objects
+        .filter(route__summary=summary)
+        .select_related("route", "city", "depot")
+        .order_by("route__driver_id", "sequence")
+    )
+    for stop in stops:
+        routes.setdefault(stop.route_id, (stop.route, []))[1].append(stop)
+    return list(routes.values())
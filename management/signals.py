@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_version_on_commit
+from .city_registry import invalidate_city_registry
+from .distance_store import forget_cities
+from .models import City, DailyDistribution, DailyWorkForce, Depot, Summary
+from .summaries import schedule_refresh
+
+
+@receiver([post_save, post_delete], sender=DailyDistribution)
+def distribution_changed(sender, instance, **kwargs):
+    schedule_refresh(instance.session_id)
+
+
+@receiver(post_save, sender=DailyWorkForce)
+def workforce_changed(sender, instance, **kwargs):
+    schedule_refresh(instance.id)
+
+
+@receiver([post_save, post_delete], sender=City)
+def city_changed(sender, instance, **kwargs):
+    invalidate_city_registry()
+
+
+@receiver(post_save, sender=City)
+def city_moved(sender, instance, created, **kwargs):
+    coordinates = (instance.latitude, instance.longitude)
+    if not created and getattr(instance, "loaded_coordinates", None) != coordinates:
+        # Its stored road distances were measured from the old place
+        transaction.on_commit(lambda: forget_cities([instance.id]))
+    instance.loaded_coordinates = coordinates
+
+
+@receiver([post_save, post_delete], sender=Summary)
+def summary_changed(sender, instance, **kwargs):
+    bump_version_on_commit("summaries")
+
+
+@receiver([post_save, post_delete], sender=Depot)
+def depot_changed(sender, instance, **kwargs):
+    bump_version_on_commit("depots")
@@ -0,0 +1,82 @@
+import logging
+import math
+
+from django.conf import settings
+from pyvrp.stop import MaxIterations, MaxRuntime, MultipleCriteria, NoImprovement
+
+logger = logging.getLogger(__name__)
+
+
+class StoppingPolicy:
+    """
+    Chooses how long PyVRP may search, based on the size of the instance.
+
+    The runtime limit and the number of iterations without improvement both
+    grow with the number of clients and vehicles, clamped to [min, max]. The
+    solve stops at whichever of MaxRuntime, NoImprovement and (optionally)
+    MaxIterations triggers first, so small days return well before their
+    runtime limit while large days get the time they need.
+    """
+    DEFAULTS = {
+        "base_runtime": 0.2,
+        "runtime_per_client": 0.05,
+        "runtime_per_vehicle": 0.1,
+        "min_runtime": 0.5,
+        "max_runtime": 120.0,
+        "base_no_improvement": 300,
+        "no_improvement_per_client": 20,
+        "max_no_improvement": 20000,
+        "max_iterations": None,
+        # Share of the budget a warm-started re-solve gets
+        "warm_start_factor": 0.15,
+    }
+
+    def __init__(self, **params):
+        unknown = set(params) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown stopping policy parameters: {sorted(unknown)}")
+        self.params = {**self.DEFAULTS, **params}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(**getattr(settings, "VRP_STOPPING_POLICY", {}))
+
+    def budget(self, num_clients, num_vehicles, max_runtime=None, max_iterations=None, warm_start=False):
+        """
+        Returns the budget dict for an instance. Explicit `max_runtime` /
+        `max_iterations` (per request or per Summary) replace the computed values.
+        A warm start already begins near a good solution, so it gets a fraction of the budget.
+        """
+        p = self.params
+        runtime = p["base_runtime"] + p["runtime_per_client"] * num_clients + p["runtime_per_vehicle"] * num_vehicles
+        no_improvement = p["base_no_improvement"] + p["no_improvement_per_client"] * num_clients
+        if warm_start:
+            runtime *= p["warm_start_factor"]
+            no_improvement *= p["warm_start_factor"]
+        runtime = min(max(runtime, p["min_runtime"]), p["max_runtime"])
+        no_improvement = min(no_improvement, p["max_no_improvement"])
+
+        return {
+            "max_runtime": round(float(max_runtime if max_runtime is not None else runtime), 3),
+            "no_improvement": int(no_improvement),
+            "max_iterations": max_iterations if max_iterations is not None else p["max_iterations"],
+            "warm_start": warm_start,
+        }
+
+    @staticmethod
+    def criterion(budget):
+        """Builds the PyVRP stopping criterion for a budget dict."""
+        criteria = [MaxRuntime(budget["max_runtime"]), NoImprovement(budget["no_improvement"])]
+        if budget.get("max_iterations"):
+            criteria.append(MaxIterations(int(budget["max_iterations"])))
+        return MultipleCriteria(criteria)
+
+
+def best_iteration(result):
+    """The first iteration at which the best feasible cost of the run was reached, if known."""
+    costs = [datum.best_cost for datum in result.stats.feas_stats]
+    best, best_idx = math.inf, None
+    for idx, cost in enumerate(costs):
+        if cost < best:  # NaN (no feasible solution yet) never compares smaller
+            best, best_idx = cost, idx
+    return None if best_idx is None else best_idx + 1
@@ -0,0 +1,93 @@
+import logging
+import threading
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+from .models import DailyDistribution, DailyWorkForce, Summary
+
+logger = logging.getLogger(__name__)
+
+# Standard deviation around the per-driver average that bounds a route's load
+STD_DEV = 3
+
+_pending = threading.local()
+
+
+def summary_values(workforce):
+    """The Summary fields of a day, with the package totals from one aggregate query."""
+    totals = DailyDistribution.objects.filter(session=workforce).aggregate(
+        total_packages=Coalesce(Sum("number_of_packages"), 0),
+        stops=Count("id"),
+    )
+    total_packages = totals["total_packages"]
+    number_of_drivers = workforce.number_of_drivers
+    avg_packages_per_driver = round(total_packages / number_of_drivers, 2) if number_of_drivers else 0
+
+    return {
+        "number_of_drivers": number_of_drivers,
+        "total_packages": total_packages,
+        "avg_packages_per_driver": avg_packages_per_driver,
+        "std_dev_min": round(max(0, avg_packages_per_driver - STD_DEV), 0),
+        "std_dev_max": round(avg_packages_per_driver + STD_DEV, 0),
+        "depot": workforce.depot,
+    }
+
+
+def package_distribution_text(workforce):
+    rows = (
+        DailyDistribution.objects
+        .filter(session=workforce)
+        .values_list("city__name", "city__latitude", "city__longitude", "number_of_packages")
+    )
+    return "\n".join(
+        f"{name} (Lat: {latitude}, Long: {longitude}, Packages: {packages})"
+        for name, latitude, longitude, packages in rows
+    )
+
+
+def refresh_summary(workforce, create=True):
+    """
+    Recomputes a day's Summary row from its workforce and distributions.
+    Returns the Summary, or None if it doesn't exist and `create` is False.
+    """
+    values = {**summary_values(workforce), "package_distribution": package_distribution_text(workforce)}
+    if create:
+        summary, _ = Summary.objects.update_or_create(date=workforce.date, defaults=values)
+        return summary
+
+    if not Summary.objects.filter(date=workforce.date).update(**values):
+        return None
+    return Summary.objects.get(date=workforce.date)
+
+
+def _pending_refreshes():
+    """Workforce ids waiting for a commit to refresh their Summary; per thread, like the DB connection."""
+    if not hasattr(_pending, "workforce_ids"):
+        _pending.workforce_ids = set()
+    return _pending.workforce_ids
+
+
+def schedule_refresh(workforce_id):
+    """
+    Refreshes the day's existing Summary once the current transaction commits.
+    Many changes to the same day in one transaction (bulk edits, cascading
+    deletes) cause a single refresh: the first callback to run takes the id
+    out of the pending set and the rest find nothing to do. A rollback drops
+    the callbacks with the changes.
+    """
+    if workforce_id is None:
+        return
+    _pending_refreshes().add(workforce_id)
+
+    def refresh():
+        pending = _pending_refreshes()
+        if workforce_id not in pending:
+            return
+        pending.discard(workforce_id)
+        workforce = DailyWorkForce.objects.select_related("depot").filter(id=workforce_id).first()
+        if workforce is not None and refresh_summary(workforce, create=False) is not None:
+            logger.info(f"Summary for {workforce.date} refreshed.")
+
+    transaction.on_commit(refresh)
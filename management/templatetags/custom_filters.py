@@ -1,12 +1,9 @@
 from django import template
-from management.models import City 
+from management.city_registry import get_city_registry
 
 register = template.Library()
 
 @register.filter
 def city_name(city_id):
     """Returns the city name for a given city ID."""
-    try:
-        return City.objects.get(id=city_id).name
-    except City.DoesNotExist:
-        return "Unknown City"
\ No newline at end of file
+    return get_city_registry().name(city_id, "Unknown City")
@@ -1,6 +1,12 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import  Depot,  DailyWorkForce
+from django.contrib.messages import get_messages
+from .models import  Polygon, Depot,  DailyWorkForce, City, DailyDistribution, Summary, RouteSolution, RouteJob, RouteStop, GeocodeCache, EntityVersion, DistributionDraft
+from django.test import override_settings
+from django.core.management import call_command
+from io import StringIO
 
 from django.core.files.uploadedfile import SimpleUploadedFile
 import os
@@ -9,13 +15,29 @@ from unittest.mock import patch, MagicMock
 from management.vrp_solver import VRPSolver
 from types import SimpleNamespace
 import pytest
+from pyvrp import solve as pyvrp_solve
+import numpy as np
+import json
 from unittest.mock import patch
-from management.utils import Coordinates, LocationSplitter
+from management.utils import Coordinates, GeocodingError, LocationSplitter
+from management.geocoding import Geocoder
+from management.gazetteer import Gazetteer, Locality, normalize
+from management.importers import CityCSVImporter, DistributionImporter
+from management.summaries import refresh_summary
+from django.core.cache import cache
+from management.caching import bump_version, cache_stats, get_or_set, get_versions, reset_cache_stats
+from management.city_registry import CityRegistry, get_city_registry, invalidate_city_registry
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project_routes.settings")  # replace with your actual project name
 django.setup()
 
 
+@pytest.fixture(autouse=True)
+def isolated_distance_store(settings, tmp_path):
+    # Moving a test city must never drop distances from the real store
+    settings.DISTANCE_STORE_DIR = tmp_path / "distance_store"
+
+
 class HomePageViewTest(TestCase):
     def test_homepage_view(self):
         client = Client()
@@ -53,6 +75,35 @@ class CSVUploadTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "CSV data uploaded successfully")
 
+    def test_csv_import_geocodes_only_new_cities(self):
+        lookup = MagicMock(return_value=(32.8, 35.0))
+        Polygon.objects.create(title="North")
+        City.objects.create(name="Haifa", latitude=32.79, longitude=34.99)
+        csv_file = SimpleUploadedFile(
+            "cities.csv",
+            "North,South\nHaifa,Beer Sheva\nAcre,\n".encode("utf-8-sig"),
+            content_type="text/csv"
+        )
+
+        with self.assertNumQueries(11):  # the last one bumps the city registry version
+            report = CityCSVImporter(Geocoder(lookup=lookup, rate_limit=0, gazetteer=Gazetteer([]))).run(csv_file)
+
+        self.assertEqual(lookup.call_count, 2)
+        self.assertEqual(report["polygons_created"], 1)
+        self.assertEqual(report["cities_created"], 2)
+        self.assertEqual(report["cities_updated"], 1)
+        self.assertEqual(set(report["timings"]), {"parse", "resolve", "geocode", "write"})
+
+        haifa = City.objects.get(name="Haifa")
+        self.assertEqual((haifa.latitude, haifa.longitude), (32.79, 34.99))
+        self.assertEqual(haifa.polygon.title, "North")
+        self.assertEqual(Polygon.objects.get(title="North").cities.count(), 2)
+
+    def test_csv_upload_rejects_non_utf8(self):
+        test_file = SimpleUploadedFile("cities.csv", b"\xff\xfe\x00bad", content_type="text/csv")
+        response = self.client.post(reverse('upload_csv'), {'file': test_file})
+        self.assertContains(response, "Invalid file format")
+
 @pytest.fixture
 def sample_summary():
     return SimpleNamespace(
@@ -68,11 +119,11 @@ def sample_locations():
         ("CityB", 32.2, 34.7, 4),
         ("CityC", 32.0, 34.9, 2),
     ]
-@patch("management.vrp_solver.requests.get")
-@patch("management.vrp_solver.Model")
+@patch("management.matrix_fetcher.requests.Session.get")
+@patch("management.vrp_solver.solve")
 
 
-def test_solve_vrp_returns_routes(mock_model, mock_get, sample_summary, sample_locations):
+def test_solve_vrp_returns_routes(mock_solve, mock_get, sample_summary, sample_locations):
     # Mock Mapbox response
     mock_get.return_value.json.return_value = {
         "distances": [
@@ -90,9 +141,7 @@ def test_solve_vrp_returns_routes(mock_model, mock_get, sample_summary, sample_l
         [3]
     ]
 
-    mock_model_instance = MagicMock()
-    mock_model_instance.solve.return_value = mock_solution
-    mock_model.return_value = mock_model_instance
+    mock_solve.return_value = mock_solution
 
     solver = VRPSolver(sample_summary, sample_locations)
     routes = solver.solve_vrp()
@@ -102,13 +151,16 @@ def test_solve_vrp_returns_routes(mock_model, mock_get, sample_summary, sample_l
     assert "CityC" in routes[1]
 
 
+@patch("management.utils.OPENWEATHERMAP_API_KEY", "test-key")
 @patch("management.utils.requests.get")
-def test_get_city_coordinates_success(mock_get):
+def test_get_city_coordinates_success(mock_get, settings):
+    settings.GAZETTEER_FILE = ""  # the bundled gazetteer knows Tel Aviv; exercise the API
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = [{"lat": 32.0853, "lon": 34.7818}]
 
     lat, lon = Coordinates.get_city_coordinates("Tel Aviv")
 
+    mock_get.assert_called_once()
     assert lat == 32.0853
     assert lon == 34.7818
 
@@ -130,6 +182,213 @@ def test_get_city_coordinates_api_error(mock_get):
     assert lat is None and lon is None
 
 
+# -------------------------------
+# ✅ Test Geocoder (cache + batch lookups)
+# -------------------------------
+
+@pytest.mark.django_db
+def test_geocoder_caches_found_and_missing_names():
+    answers = {"tel aviv": (32.0853, 34.7818), "nowhere": (None, None)}
+    lookup = MagicMock(side_effect=lambda name, session=None: answers[name])
+    geocoder = Geocoder(lookup=lookup, rate_limit=0, gazetteer=Gazetteer([]))
+
+    stats = {}
+    result = geocoder.geocode_many(["Tel Aviv", " tel  aviv", "Nowhere"], stats=stats)
+    assert result == {"Tel Aviv": (32.0853, 34.7818), " tel  aviv": (32.0853, 34.7818)}
+    assert stats == {"gazetteer": 0, "cached": 0, "fetched": 2, "failed": 0, "fuzzy": []}
+    assert lookup.call_count == 2
+
+    # Both the hit and the miss are served from the cache the second time
+    stats = {}
+    geocoder.geocode_many(["TEL AVIV", "Nowhere"], stats=stats)
+    assert stats == {"gazetteer": 0, "cached": 2, "fetched": 0, "failed": 0, "fuzzy": []}
+    assert lookup.call_count == 2
+    assert GeocodeCache.objects.get(name="nowhere").found is False
+
+
+@pytest.mark.django_db
+def test_geocoder_does_not_cache_api_failures():
+    lookup = MagicMock(side_effect=GeocodingError("API key is missing"))
+    geocoder = Geocoder(lookup=lookup, rate_limit=0, gazetteer=Gazetteer([]))
+
+    stats = {}
+    assert geocoder.geocode_many(["Haifa"], stats=stats) == {}
+    assert stats["failed"] == 1
+    assert not GeocodeCache.objects.exists()
+
+
+def test_build_problem_data_matches_model_edges(sample_summary, sample_locations):
+    from pyvrp import Model
+    from management.vrp_solver import build_problem_data
+
+    distances = np.array([[0, 10, 20, 30], [11, 0, 15, 25], [21, 16, 0, 12], [31, 26, 13, 0]])
+    m = Model()
+    depot = m.add_depot(x=int(34.7818 * 100000), y=int(32.0853 * 100000))
+    m.add_vehicle_type(2, capacity=10, start_depot=depot)
+    clients = [m.add_client(x=int(lon * 100000), y=int(lat * 100000), delivery=p) for _, lat, lon, p in sample_locations]
+    locations = [depot] + clients
+    for i, frm in enumerate(locations):
+        for j, to in enumerate(locations):
+            if i != j:
+                m.add_edge(frm, to, distance=int(distances[i, j]))
+
+    expected = m.data()
+    data = build_problem_data(
+        (32.0853, 34.7818), [(lat, lon) for _, lat, lon, _ in sample_locations],
+        [p for *_, p in sample_locations], 10, 2, distances,
+    )
+
+    assert np.array_equal(data.distance_matrix(0), expected.distance_matrix(0))
+    assert [c.delivery for c in data.clients()] == [c.delivery for c in expected.clients()]
+    assert [(c.x, c.y) for c in data.clients()] == [(c.x, c.y) for c in expected.clients()]
+    assert (data.depots()[0].x, data.depots()[0].y) == (expected.depots()[0].x, expected.depots()[0].y)
+    assert data.vehicle_type(0).num_available == 2
+    assert data.vehicle_type(0).capacity == [10]
+
+
+def test_solver_fetches_split_parts_once(sample_summary):
+    from management.distance_providers import HaversineDistanceProvider
+
+    provider = HaversineDistanceProvider()
+    provider.matrix = MagicMock(side_effect=HaversineDistanceProvider().matrix)
+    locations = LocationSplitter.split([("CityA", 32.1, 34.8, 25), ("CityB", 32.2, 34.7, 4)], max_capacity=10)
+    solver = VRPSolver(sample_summary, locations, distance_provider=provider, fallback_provider=None)
+
+    matrix = solver._get_distance_matrix()
+
+    (points,), _ = provider.matrix.call_args
+    assert len(points) == 3  # depot, CityA, CityB
+    assert matrix.shape == (5, 5)  # depot + three parts of CityA + CityB
+    assert matrix[1, 2] == matrix[2, 3] == 0
+    assert matrix[0, 1] == matrix[0, 3] and matrix[4, 2] == matrix[4, 1]
+
+
+@patch("management.vrp_solver.solve", wraps=pyvrp_solve)
+def test_full_truckloads_become_direct_routes(mock_solve, sample_summary):
+    from management.distance_providers import HaversineDistanceProvider
+
+    locations = LocationSplitter.split([("CityA", 32.1, 34.8, 25), ("CityB", 32.2, 34.7, 4)], max_capacity=10)
+    summary = SimpleNamespace(**{**vars(sample_summary), "number_of_drivers": 4})
+    solver = VRPSolver(summary, locations, distance_provider=HaversineDistanceProvider(), fallback_provider=None,
+                       max_iterations=50, display=False)
+
+    routes = solver.solve_vrp()
+
+    data = mock_solve.call_args.args[0]
+    assert data.num_clients == 2 and data.num_vehicles == 2  # CityA's remainder and CityB
+    assert solver.solve_stats["full_loads"] == 2
+    assert routes.count(["CityA (part)"]) == 2
+    assert sorted(c for route in routes for c in route) == sorted(name for name, *_ in locations)
+
+
+def test_benchmark_instances_are_reproducible_and_compare_flags_regressions():
+    from benchmarks import instances
+    from benchmarks.bench_solver import compare
+
+    heavy = instances.synthetic(50, "heavy", seed=3)
+    assert heavy == instances.synthetic(50, "heavy", seed=3)
+    assert max(packages for *_, packages in heavy["cities"]) > heavy["capacity"]
+
+    result = {"instance": "day", "matrix_s": 0.1, "build_s": 0.01, "solve_s": 2.0,
+              "objective": 1000, "routes": 5, "peak_rss_mb": 80}
+    baseline = {"results": [result]}
+    assert compare(baseline, {"results": [{**result, "solve_s": 2.04, "objective": 1010}]}) == []
+    assert len(compare(baseline, {"results": [{**result, "solve_s": 3.0, "routes": 6}]})) == 2
+
+
+# -------------------------------
+# ✅ Test polygon decomposition
+# -------------------------------
+
+def test_allocate_vehicles_by_volume():
+    from management.decomposition import allocate_vehicles
+
+    assert allocate_vehicles([60, 30, 10], capacity=20, num_vehicles=10) == [6, 3, 1]
+    assert allocate_vehicles([60, 30, 10], capacity=20, num_vehicles=7) == [4, 2, 1]
+    assert allocate_vehicles([5, 5], capacity=20, num_vehicles=3) in ([2, 1], [1, 2])
+    assert allocate_vehicles([50, 50], capacity=20, num_vehicles=5) is None  # needs 3 + 3
+
+
+def test_decomposed_solve_covers_every_client_within_driver_count():
+    from management.distance_providers import HaversineDistanceProvider
+
+    rng = np.random.default_rng(0)
+    north = [(f"N{i}", 32.8 + rng.uniform(-0.05, 0.05), 35.0 + rng.uniform(-0.05, 0.05), 3) for i in range(12)]
+    south = [(f"S{i}", 31.25 + rng.uniform(-0.05, 0.05), 34.8 + rng.uniform(-0.05, 0.05), 3) for i in range(8)]
+    summary = SimpleNamespace(depot=SimpleNamespace(latitude=32.0853, longitude=34.7818, name="מרלוג"),
+                              number_of_drivers=8, std_dev_max=10)
+    regions = {name: ("north" if name.startswith("N") else "south") for name, *_ in north + south}
+
+    solver = VRPSolver(summary, north + south, distance_provider=HaversineDistanceProvider(), fallback_provider=None,
+                       regions=regions, decompose=True, decompose_workers=1, max_iterations=200, display=False)
+    routes = solver.solve_vrp()
+
+    assert solver.solve_stats["decomposed"] and solver.solve_stats["regions"] == 2
+    assert sorted(c for route in routes for c in route) == sorted(name for name, *_ in north + south)
+    assert len(routes) <= 8
+
+
+# -------------------------------
+# ✅ Test Gazetteer
+# -------------------------------
+
+@pytest.fixture
+def gazetteer():
+    return Gazetteer([
+        (Locality("באר שבע", "Beersheba", 31.2518, 34.7913), ["באר שבע", "Beersheba", "Beer Sheva"]),
+        (Locality("קריית אתא", "Kiryat Ata", 32.8114, 35.1133), ["קריית אתא", "Kiryat Ata", "קרית אתא"]),
+        (Locality("קריית ים", "Kiryat Yam", 32.8496, 35.0689), ["קריית ים", "Kiryat Yam", "קרית ים"]),
+    ])
+
+
+def test_gazetteer_normalizes_hebrew_and_english_names():
+    assert normalize("באר-שבע") == normalize("באר שבע")
+    assert normalize("ם") == normalize("מ")
+    assert normalize("  Be'er  Sheva ") == "be er sheva"
+
+
+def test_gazetteer_exact_and_fuzzy_matches(gazetteer):
+    assert gazetteer.match("BEER-SHEVA").name_en == "Beersheba"
+    assert gazetteer.match("קרית-אתא").name_en == "Kiryat Ata"
+    assert gazetteer.match("Kiryat Atta").name_en == "Kiryat Ata"   # misspelled
+    assert gazetteer.match("קריית אתה").name_en == "Kiryat Ata"     # misspelled
+    assert gazetteer.match("Kiryat Atta", fuzzy=False) is None
+    assert gazetteer.coordinates("Kiryat Atta") == (None, None)     # exact only unless asked
+    assert gazetteer.coordinates("Paris") == (None, None)
+
+
+def test_gazetteer_fuzzy_match_needs_a_clear_winner(gazetteer):
+    assert gazetteer.fuzzy("Kiryat Atta")[0].name_en == "Kiryat Ata"
+    assert Gazetteer(gazetteer.localities, margin=0.5).fuzzy("Kiryat Atta") is None  # Kiryat Yam is too close
+
+
+@pytest.mark.django_db
+def test_geocoder_resolves_exact_gazetteer_names_without_api(gazetteer):
+    lookup = MagicMock(return_value=(None, None))
+    stats = {}
+    result = Geocoder(lookup=lookup, rate_limit=0, gazetteer=gazetteer).geocode_many(["Beer-Sheva", "Nowhere"], stats=stats)
+
+    assert result == {"Beer-Sheva": (31.2518, 34.7913)}
+    assert stats["gazetteer"] == 1
+    lookup.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_geocoder_prefers_the_api_over_fuzzy_matches(gazetteer):
+    answers = {"kiryat yearim": (31.8047, 35.1031), "beer shevaa": (None, None)}
+    lookup = MagicMock(side_effect=lambda name, session=None: answers[name])
+    stats = {}
+    result = Geocoder(lookup=lookup, rate_limit=0, gazetteer=gazetteer).geocode_many(
+        ["Kiryat Yearim", "Beer Shevaa"], stats=stats
+    )
+
+    assert result["Kiryat Yearim"] == (31.8047, 35.1031)  # not Kiryat Yam
+    assert result["Beer Shevaa"] == (31.2518, 34.7913)    # the API didn't know it, the fuzzy match did
+    assert lookup.call_count == 2
+    assert stats["gazetteer"] == 0
+    assert stats["fuzzy"] == [{"name": "Beer Shevaa", "match": "באר שבע", "score": 0.95}]
+
+
 # -------------------------------
 # ✅ Test LocationSplitter class
 # -------------------------------
@@ -144,4 +403,903 @@ def test_location_splitter_basic_split():
     assert len(result) == 3
     assert result[0] == ("CityA (part)", 32.1, 34.8, 4)
     assert result[1] == ("CityA", 32.1, 34.8, 3)
-    assert result[2] == ("CityB", 32.2, 34.7, 3)
\ No newline at end of file
+    assert result[2] == ("CityB", 32.2, 34.7, 3)
+
+# -------------------------------
+# ✅ Test DistanceStore
+# -------------------------------
+
+def test_distance_store_fetches_only_missing_pairs(tmp_path):
+    from management.distance_store import DistanceStore
+
+    points = [(32.0, 34.8), (32.1, 34.9), (32.2, 35.0)]
+    calls = []
+
+    def fake_fetch(pts, sources, destinations):
+        calls.append((list(sources), list(destinations)))
+        return np.array([[1000.0 * (s + 1) + d for d in destinations] for s in sources])
+
+    store = DistanceStore(tmp_path, initial_capacity=2)
+    keys = ["depot:1", "city:1", "city:2"]
+    first = store.submatrix(keys, points, fake_fetch)
+    assert first.shape == (3, 3)
+    assert first[1, 2] == 2002
+    assert len(calls) == 1
+
+    # Reopened from disk: nothing is fetched again, duplicates are expanded by index
+    reopened = DistanceStore(tmp_path)
+    again = reopened.submatrix(["depot:1", "city:2", "city:2"], [points[0], points[2], points[2]], fake_fetch)
+    assert len(calls) == 1
+    assert again[0, 1] == first[0, 2]
+    assert again[1, 2] == 0
+
+    # A new city only fetches its own row and column
+    calls.clear()
+    reopened.submatrix(keys + ["city:3"], points + [(32.3, 35.1)], fake_fetch)
+    assert calls == [([3], [0, 1, 2, 3]), ([0, 1, 2], [3])]
+
+
+def test_distance_store_picks_up_keys_and_growth_of_another_process(tmp_path):
+    from management.distance_store import DistanceStore
+
+    def fetch(pts, sources, destinations):
+        return np.array([[1000.0 + 10 * s + d for d in destinations] for s in sources])
+
+    points = [(32.0 + i / 100, 34.8) for i in range(4)]
+    first, second = DistanceStore(tmp_path, initial_capacity=2), DistanceStore(tmp_path)
+    first.submatrix(["city:1", "city:2"], points[:2], fetch)
+    # The other handle registers new keys (growing the file) after re-reading the index under the lock
+    second.submatrix(["city:3", "city:4", "city:1"], points[1:], fetch)
+
+    assert second._index["city:1"] == 0 and second._index["city:3"] == 2
+    assert first.observed(["city:3", "city:4"])[0, 1] == second.observed(["city:3", "city:4"])[0, 1]
+    assert len(first) == 4
+
+
+@pytest.mark.django_db
+def test_moving_a_city_drops_its_stored_distances(django_capture_on_commit_callbacks):
+    from management.distance_store import DistanceStore, get_distance_store
+
+    haifa = City.objects.create(name="Haifa", latitude=32.79, longitude=34.99)
+    acre = City.objects.create(name="Acre", latitude=32.92, longitude=35.07)
+    keys = [DistanceStore.city_key(haifa.id), DistanceStore.city_key(acre.id)]
+    get_distance_store().submatrix(keys, [(32.79, 34.99), (32.92, 35.07)],
+                                   lambda pts, s, d: np.full((len(s), len(d)), 5000.0))
+
+    acre = City.objects.get(id=acre.id)
+    acre.name = "Akko"
+    with django_capture_on_commit_callbacks(execute=True):
+        acre.save()  # renamed, not moved
+    assert get_distance_store().observed(keys)[0, 1] == 5000
+
+    acre.latitude = 32.93
+    with django_capture_on_commit_callbacks(execute=True):
+        acre.save()
+    assert np.isnan(get_distance_store().observed(keys)[0, 1])
+
+
+# -------------------------------
+# ✅ Test MapboxMatrixFetcher
+# -------------------------------
+
+def fake_matrix_get(url, params, timeout):
+    from management.matrix_fetcher import MapboxMatrixFetcher
+
+    coords = url.rsplit("/", 1)[-1].split(";")
+    assert len(coords) <= MapboxMatrixFetcher.MAX_COORDINATES
+    lats = [float(c.split(",")[1]) for c in coords]
+    sources = [lats[int(i)] for i in params["sources"].split(";")]
+    destinations = [lats[int(i)] for i in params["destinations"].split(";")]
+    response = MagicMock()
+    response.json.return_value = {"distances": [[abs(s - d) * 1e5 for d in destinations] for s in sources]}
+    return response
+
+
+def test_matrix_fetcher_tiles_large_instances():
+    from management.matrix_fetcher import MapboxMatrixFetcher
+
+    points = [(32.0 + i / 100, 34.8) for i in range(40)]
+    fetcher = MapboxMatrixFetcher(access_token="test")
+    with patch.object(fetcher.session, "get", side_effect=fake_matrix_get) as mock_get:
+        matrix = fetcher.fetch(points)
+
+    assert mock_get.call_count == 6  # every pair of the 4 blocks of 12 points
+    assert matrix.shape == (40, 40)
+    assert matrix[3, 17] == pytest.approx(14000)
+    assert matrix[39, 0] == pytest.approx(39000)
+
+    # A new point's row and column: the two sets overlap only in it
+    with patch.object(fetcher.session, "get", side_effect=fake_matrix_get):
+        row = fetcher.fetch(points, sources=[39], destinations=range(40))
+    assert row[0, 3] == pytest.approx(36000)
+
+
+@pytest.mark.parametrize("size", [13, 25])
+def test_matrix_fetcher_square_matrix_up_to_25_points_is_one_request(size):
+    from management.matrix_fetcher import MapboxMatrixFetcher
+
+    points = [(32.0 + i / 100, 34.8) for i in range(size)]
+    fetcher = MapboxMatrixFetcher(access_token="test")
+    with patch.object(fetcher.session, "get", side_effect=fake_matrix_get) as mock_get:
+        matrix = fetcher.fetch(points)
+
+    mock_get.assert_called_once()
+    assert matrix[0, size - 1] == pytest.approx((size - 1) * 1000)
+
+
+def test_matrix_fetcher_returns_none_on_error_tile():
+    from management.matrix_fetcher import MapboxMatrixFetcher
+
+    fetcher = MapboxMatrixFetcher(access_token="test")
+    with patch.object(fetcher.session, "get") as mock_get:
+        mock_get.return_value.json.return_value = {"message": "Not Authorized - Invalid Token"}
+        assert fetcher.fetch([(32.0, 34.8), (32.1, 34.9)]) is None
+
+
+# -------------------------------
+# ✅ Test distance providers
+# -------------------------------
+
+def test_haversine_provider_matches_known_distance():
+    from management.distance_providers import HaversineDistanceProvider
+
+    tel_aviv, jerusalem = (32.0853, 34.7818), (31.7683, 35.2137)
+    matrix = HaversineDistanceProvider(road_factor=1.0).matrix([tel_aviv, jerusalem])
+
+    assert matrix.shape == (2, 2)
+    assert matrix[0, 0] == 0
+    assert matrix[0, 1] == pytest.approx(54000, rel=0.02)
+    assert matrix[0, 1] == pytest.approx(matrix[1, 0])
+
+
+def test_haversine_provider_calibration_recovers_region_factors():
+    from management.distance_providers import HaversineDistanceProvider, haversine_matrix
+
+    north = [(32.8, 35.0), (32.9, 35.1), (33.0, 35.3)]
+    south = [(31.2, 34.8), (31.0, 34.9), (30.8, 34.7)]
+    observed_north = haversine_matrix(north, north) * 1.2
+    observed_south = haversine_matrix(south, south) * 1.5
+    observed_south[0, 1] = np.nan  # never fetched
+
+    provider = HaversineDistanceProvider.calibrate([("north", north, observed_north), ("south", south, observed_south)])
+
+    assert provider.regions["north"]["factor"] == pytest.approx(1.2)
+    assert provider.regions["south"]["factor"] == pytest.approx(1.5)
+    straight = haversine_matrix(south, south)
+    assert provider.matrix(south)[1, 2] == pytest.approx(straight[1, 2] * 1.5)
+
+
+def test_solver_falls_back_to_offline_provider(sample_summary, sample_locations):
+    from management.distance_providers import DistanceProvider, HaversineDistanceProvider
+
+    class DownProvider(DistanceProvider):
+        name = "down"
+
+        def matrix(self, points, sources=None, destinations=None):
+            return None
+
+    solver = VRPSolver(sample_summary, sample_locations,
+                       distance_provider=DownProvider(), fallback_provider=HaversineDistanceProvider())
+    matrix = solver._get_distance_matrix()
+
+    assert matrix.shape == (4, 4)
+    assert matrix[0, 1] > 0
+
+
+# -------------------------------
+# ✅ Test background route jobs
+# -------------------------------
+
+@override_settings(ROUTE_JOB_WORKERS=0, DISTANCE_PROVIDER="haversine", ROUTE_GEOMETRY_SOURCE="straight")
+class RouteJobTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.depot = Depot.objects.create(name="מרלוג ראשי", latitude=32.0853, longitude=34.7818)
+        workforce = DailyWorkForce.objects.create(date="2025-04-20", number_of_drivers=2, depot=self.depot)
+        city = City.objects.create(name="Haifa", latitude=32.794, longitude=34.9896)
+        DailyDistribution.objects.create(session=workforce, city=city, number_of_packages=5)
+        self.summary = Summary.objects.create(
+            date="2025-04-20", number_of_drivers=2, total_packages=5, avg_packages_per_driver=2.5,
+            std_dev_min=0, std_dev_max=6, package_distribution="", depot=self.depot,
+        )
+
+    def test_post_returns_job_and_status_reports_routes(self):
+        response = self.client.post(reverse('generate_routes'), {'summary_date': '2025-04-20'},
+                                    HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+
+        status = self.client.get(reverse('route_job_status', args=[job_id])).json()
+        self.assertEqual(status["status"], RouteJob.DONE)
+        self.assertEqual(status["routes_count"], 1)
+        for stage in ("load_distributions", "split", "solve.distance_matrix", "solve.build_model",
+                      "solve.pyvrp_solve", "save_routes", "geometry"):
+            self.assertIn(stage, status["timings"])
+        job = RouteJob.objects.get(id=job_id)
+        self.assertEqual(job.num_clients, 1)
+        self.assertGreater(job.objective, 0)
+        stop = RouteStop.objects.get(route__summary=self.summary)
+        self.assertEqual((stop.sequence, stop.city.name, stop.quantity), (1, "Haifa", 5))
+        self.assertGreater(stop.leg_distance, 0)
+
+        with self.assertNumQueries(3):  # summary, cache versions and the stops
+            data = self.client.get(reverse('route_data'), {'date': '2025-04-20'}).json()
+        self.assertEqual([p["name"] for p in data["routes"][0]["points"]], ["מרלוג ראשי", "Haifa"])
+        self.assertTrue(data["routes"][0]["geometry"])
+
+    def test_admin_shows_stage_percentiles(self):
+        from django.contrib.auth.models import User
+
+        for ms in (100, 200, 300):
+            RouteJob.objects.create(summary=self.summary, status=RouteJob.DONE, duration_ms=ms,
+                                    timings={"solve.pyvrp_solve": ms / 2})
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+
+        response = self.client.get(reverse("admin:management_routejob_changelist"))
+        rows = {row["stage"]: row for row in response.context["stage_percentiles"]}
+        self.assertEqual((rows["total"]["p50"], rows["total"]["max"]), (200, 300))
+        self.assertEqual(rows["solve.pyvrp_solve"]["p90"], 140)
+
+    def test_active_job_is_returned_and_stale_job_is_expired(self):
+        from django.utils import timezone
+        from datetime import timedelta
+        from management.jobs import submit_route_job
+
+        active = RouteJob.objects.create(summary=self.summary, status=RouteJob.RUNNING, started_at=timezone.now())
+        self.assertEqual(submit_route_job(self.summary), active)
+
+        # Its process died long ago: the job is failed and a new one runs
+        RouteJob.objects.filter(id=active.id).update(started_at=timezone.now() - timedelta(hours=2))
+        job = submit_route_job(self.summary)
+
+        self.assertNotEqual(job, active)
+        self.assertEqual(job.status, RouteJob.DONE)
+        active.refresh_from_db()
+        self.assertEqual(active.status, RouteJob.FAILED)
+
+    def test_submit_gives_up_on_other_integrity_errors(self):
+        from django.db import IntegrityError
+        from management.jobs import SUBMIT_ATTEMPTS, submit_route_job
+
+        # e.g. "FOREIGN KEY constraint failed" once the Summary was deleted: there is no active job to return
+        with patch.object(RouteJob.objects, "create", side_effect=IntegrityError("FOREIGN KEY constraint failed")) as create:
+            with self.assertRaises(IntegrityError):
+                submit_route_job(self.summary)
+        self.assertEqual(create.call_count, SUBMIT_ATTEMPTS)
+
+    def test_only_one_active_job_per_summary(self):
+        from django.db import IntegrityError
+
+        RouteJob.objects.create(summary=self.summary, status=RouteJob.PENDING)
+        RouteJob.objects.create(summary=self.summary, status=RouteJob.DONE)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RouteJob.objects.create(summary=self.summary, status=RouteJob.RUNNING)
+
+    @patch("management.route_generation.VRPSolver.solve_vrp", return_value=[])
+    def test_failed_job_keeps_previous_routes(self, mock_solve):
+        RouteSolution.objects.create(summary=self.summary, driver_id=1)
+        response = self.client.post(reverse('generate_routes'), {'summary_date': '2025-04-20'})
+        self.assertEqual(response.status_code, 302)
+
+        job = RouteJob.objects.get(summary=self.summary)
+        self.assertEqual(job.status, RouteJob.FAILED)
+        self.assertTrue(RouteSolution.objects.filter(summary=self.summary).exists())
+
+
+@override_settings(DISTANCE_PROVIDER="haversine", ROUTE_GEOMETRY_SOURCE="straight")
+class SolveRoutesCommandTest(TestCase):
+    def setUp(self):
+        depot = Depot.objects.create(name="מרלוג ראשי", latitude=32.0853, longitude=34.7818)
+        haifa = City.objects.create(name="Haifa", latitude=32.794, longitude=34.9896)
+        netanya = City.objects.create(name="Netanya", latitude=32.3215, longitude=34.8532)
+        for date in ("2025-04-20", "2025-04-21"):
+            workforce = DailyWorkForce.objects.create(date=date, number_of_drivers=2, depot=depot)
+            DailyDistribution.objects.create(session=workforce, city=haifa, number_of_packages=5)
+            DailyDistribution.objects.create(session=workforce, city=netanya, number_of_packages=4)
+            Summary.objects.create(
+                date=date, number_of_drivers=2, total_packages=9, avg_packages_per_driver=4.5,
+                std_dev_min=0, std_dev_max=6, package_distribution="", depot=depot,
+            )
+
+    def test_solves_every_day_in_range(self):
+        out = StringIO()
+        call_command("solve_routes", "--from", "2025-04-20", "--to", "2025-04-21", "--workers", "1",
+                     "--max-iterations", "50", stdout=out)
+
+        self.assertIn("Solved 2/2", out.getvalue())
+        for summary in Summary.objects.all():
+            stops = RouteStop.objects.filter(route__summary=summary)
+            self.assertEqual(sorted(s.city.name for s in stops), ["Haifa", "Netanya"])
+            self.assertEqual(summary.routes_version, 2)  # routes, then geometry
+
+
+# -------------------------------
+# ✅ Test Summary maintenance
+# -------------------------------
+
+class SummaryMaintenanceTest(TransactionTestCase):
+    # Real commits, so the on_commit refreshes run like they do in production
+    def setUp(self):
+        self.depot = Depot.objects.create(name="Main Depot", latitude=32.0853, longitude=34.7818)
+        self.workforce = DailyWorkForce.objects.create(date="2025-04-20", number_of_drivers=2, depot=self.depot)
+        self.cities = [
+            City.objects.create(name=f"City {i}", latitude=32.0 + i / 100, longitude=34.8) for i in range(20)
+        ]
+        for city in self.cities:
+            DailyDistribution.objects.create(session=self.workforce, city=city, number_of_packages=5)
+
+    def test_process_summary_query_count_is_independent_of_stops(self):
+        url = reverse('process_summary', args=['2025-04-20'])
+        with CaptureQueriesContext(connection) as small_day:
+            response = self.client.get(url)
+
+        self.assertRedirects(response, reverse('summary'), fetch_redirect_response=False)
+        summary = Summary.objects.get(date="2025-04-20")
+        self.assertEqual(summary.total_packages, 100)
+        self.assertEqual(summary.avg_packages_per_driver, 50)
+        self.assertEqual(summary.std_dev_max, 53)
+        self.assertEqual(len(self.client.session["summary_data"]["package_display"]), 20)
+
+        for i in range(20, 60):
+            city = City.objects.create(name=f"City {i}", latitude=32.0 + i / 100, longitude=34.8)
+            DailyDistribution.objects.create(session=self.workforce, city=city, number_of_packages=5)
+        with CaptureQueriesContext(connection) as large_day:
+            self.client.get(url)
+
+        self.assertLessEqual(len(large_day), len(small_day))  # 3x the stops, no extra queries
+        self.assertEqual(Summary.objects.get(date="2025-04-20").total_packages, 300)
+
+    def test_distribution_changes_refresh_existing_summary(self):
+        self.client.get(reverse('process_summary', args=['2025-04-20']))
+
+        with patch("management.summaries.refresh_summary", wraps=refresh_summary) as refresh, transaction.atomic():
+            DailyDistribution.objects.filter(city=self.cities[0]).first().delete()
+            distribution = DailyDistribution.objects.get(city=self.cities[1])
+            distribution.number_of_packages = 25
+            distribution.save()
+            refresh.assert_not_called()
+
+        refresh.assert_called_once()  # one refresh per day and transaction
+        summary = Summary.objects.get(date="2025-04-20")
+        self.assertEqual(summary.total_packages, 115)
+        self.assertNotIn("City 0 ", summary.package_distribution)
+
+    def test_rolled_back_changes_do_not_block_later_refreshes(self):
+        self.client.get(reverse('process_summary', args=['2025-04-20']))
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            DailyDistribution.objects.filter(city=self.cities[0]).delete()
+            raise RuntimeError
+        with transaction.atomic():
+            DailyDistribution.objects.filter(city=self.cities[1]).delete()
+
+        self.assertEqual(Summary.objects.get(date="2025-04-20").total_packages, 95)
+
+    def test_changes_do_not_create_summaries(self):
+        DailyDistribution.objects.filter(city=self.cities[0]).first().delete()
+        self.workforce.save()
+
+        self.assertFalse(Summary.objects.exists())
+
+
+# -------------------------------
+# ✅ Test distribution import API
+# -------------------------------
+
+@override_settings(DISTRIBUTION_API_TOKEN="secret")
+class DistributionImportTest(TestCase):
+    def setUp(self):
+        depot = Depot.objects.create(name="Main Depot", latitude=32.0853, longitude=34.7818)
+        self.workforce = DailyWorkForce.objects.create(date="2025-04-20", number_of_drivers=4, depot=depot)
+        City.objects.bulk_create([City(name=f"City {i}", latitude=32.0, longitude=34.8) for i in range(1000)])
+        invalidate_city_registry()  # bulk_create skips the signals
+        get_city_registry()
+        self.url = reverse('distribution_import', args=['2025-04-20'])
+        self.client.defaults["HTTP_AUTHORIZATION"] = "Bearer secret"
+
+    def post_json(self, payload, url=None):
+        return self.client.post(url or self.url, json.dumps(payload), content_type="application/json")
+
+    def test_json_day_loads_in_constant_queries(self):
+        rows = [{"city": f"City {i}", "packages": i % 7} for i in range(1000)]
+        # workforce, registry version check, savepoint pair and 4 upsert batches (SQLite caps a batch at 333 rows)
+        with self.assertNumQueries(8):
+            response = self.post_json({"distributions": rows})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cities"], 1000)
+        self.assertEqual(DailyDistribution.objects.filter(session=self.workforce).count(), 1000)
+
+    def test_upsert_updates_existing_rows_and_sums_duplicates(self):
+        city = City.objects.get(name="City 1")
+        DailyDistribution.objects.create(session=self.workforce, city=city, number_of_packages=3)
+
+        response = self.post_json([{"city": "City 1", "packages": 10}, {"city_id": city.id, "packages": 2}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DailyDistribution.objects.get(session=self.workforce, city=city).number_of_packages, 12)
+
+    def test_replace_and_csv_upload(self):
+        DailyDistribution.objects.create(session=self.workforce, city=City.objects.get(name="City 5"),
+                                         number_of_packages=3)
+        csv_content = "city,packages\nCity 1,4\nCity 2,6\n".encode("utf-8")
+
+        response = self.client.post(f"{self.url}?replace=1",
+                                    {"file": SimpleUploadedFile("day.csv", csv_content, content_type="text/csv")})
+
+        self.assertEqual(response.json()["removed"], 1)
+        self.assertEqual(
+            dict(DailyDistribution.objects.filter(session=self.workforce).values_list("city__name", "number_of_packages")),
+            {"City 1": 4, "City 2": 6},
+        )
+
+    def test_invalid_rows_write_nothing(self):
+        response = self.post_json([{"city": "City 1", "packages": 4}, {"city": "Atlantis", "packages": 1},
+                                   {"city": "City 2", "packages": -1}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()["errors"]), 2)
+        self.assertFalse(DailyDistribution.objects.exists())
+
+    def test_token_is_required(self):
+        self.assertEqual(self.post_json([]).status_code, 200)
+        for header in ("", "Bearer wrong"):
+            response = self.client.post(self.url, "[]", content_type="application/json", HTTP_AUTHORIZATION=header)
+            self.assertEqual(response.status_code, 401)
+
+        with override_settings(DISTRIBUTION_API_TOKEN=""):
+            self.assertEqual(self.post_json([]).status_code, 503)  # fails closed
+
+
+# -------------------------------
+# ✅ Test distribution drafts
+# -------------------------------
+
+class DistributionDraftTest(TestCase):
+    def setUp(self):
+        depot = Depot.objects.create(name="Main Depot", latitude=32.0853, longitude=34.7818)
+        self.workforce = DailyWorkForce.objects.create(date="2025-04-20", number_of_drivers=4, depot=depot)
+        self.cities = [City.objects.create(name=f"City {i}", latitude=32.0, longitude=34.8) for i in range(300)]
+        DailyDistribution.objects.bulk_create([
+            DailyDistribution(session=self.workforce, city=city, number_of_packages=5) for city in self.cities
+        ])
+        self.url = reverse('add_distribution')
+        self.client.get(f"{self.url}?session_id={self.workforce.id}")
+
+    def test_the_first_edit_seeds_the_draft(self):
+        response = self.client.get(f"{self.url}?session_id={self.workforce.id}")
+        self.assertEqual(len(response.context["cities"]), 300)  # the saved distribution
+        self.assertFalse(DistributionDraft.objects.exists())  # opening a day doesn't start a draft
+
+        self.client.post(reverse('edit_distribution', args=[self.cities[0].id]), {'new_amount': 9})
+        self.assertEqual(DistributionDraft.objects.filter(session=self.workforce).count(), 300)
+        self.assertNotIn("distribution_data", self.client.session)
+
+        response = self.client.get(f"{self.url}?session_id={self.workforce.id}")
+        self.assertEqual(len(response.context["cities"]), 300)
+        self.assertEqual(response.context["cities"][0]["number_of_packages"], 9)  # edits are kept
+
+    def test_edits_cost_the_same_on_a_large_day(self):
+        self.client.post(reverse('edit_distribution', args=[self.cities[9].id]), {'new_amount': 1})  # seeds the draft
+        city = self.cities[10]
+        # session load, workforce and a one-row statement, whatever the size of the day
+        with self.assertNumQueries(3):
+            self.client.post(reverse('edit_distribution', args=[city.id]), {'new_amount': 12})
+        with self.assertNumQueries(3):
+            self.client.post(self.url, {'delete': self.cities[11].id})
+        with self.assertNumQueries(4):  # the posted rows, then one bulk update of the changed ones
+            self.client.post(self.url, {'save_edits': '1', f'packages_{self.cities[12].id}': 7,
+                                        f'packages_{self.cities[13].id}': 5})
+
+        self.assertEqual(DistributionDraft.objects.get(city=city).number_of_packages, 12)
+        self.assertEqual(DistributionDraft.objects.get(city=self.cities[12]).number_of_packages, 7)
+        self.assertFalse(DistributionDraft.objects.filter(city=self.cities[11]).exists())
+
+    def test_negative_package_counts_are_rejected(self):
+        edit = self.client.post(reverse('edit_distribution', args=[self.cities[0].id]), {'new_amount': -3})
+        save = self.client.post(self.url, {'save_edits': '1', f'packages_{self.cities[1].id}': 7,
+                                           f'packages_{self.cities[2].id}': -1})
+
+        for response in (edit, save):
+            self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertFalse(DistributionDraft.objects.exists())  # nothing was written, not even the valid row
+        messages = [str(m) for m in get_messages(save.wsgi_request)]
+        self.assertIn("❌ מספר חבילות לא תקין.", messages)
+
+    def test_stale_draft_does_not_overwrite_an_import(self):
+        self.client.post(reverse('edit_distribution', args=[self.cities[0].id]), {'new_amount': 12})
+        # Someone edits the saved day behind the draft's back
+        DailyDistribution.objects.filter(session=self.workforce, city=self.cities[1]).update(number_of_packages=40)
+
+        response = self.client.post(self.url, {'send': '1'})
+
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        saved = dict(DailyDistribution.objects.filter(session=self.workforce).values_list("city_id", "number_of_packages"))
+        self.assertEqual((saved[self.cities[0].id], saved[self.cities[1].id]), (5, 40))
+        self.assertFalse(DistributionDraft.objects.exists())
+
+    def test_send_promotes_the_draft(self):
+        self.client.post(reverse('edit_distribution', args=[self.cities[0].id]), {'new_amount': 12})
+        self.client.post(self.url, {'delete': self.cities[1].id})
+        self.client.post(self.url, {'save': '1', 'city': self.cities[0].id, 'number_of_packages': 3})  # duplicate
+
+        response = self.client.post(self.url, {'send': '1'})
+
+        self.assertRedirects(response, reverse('process_summary', args=['2025-04-20']), fetch_redirect_response=False)
+        saved = dict(DailyDistribution.objects.filter(session=self.workforce).values_list("city_id", "number_of_packages"))
+        self.assertEqual(len(saved), 299)
+        self.assertEqual(saved[self.cities[0].id], 12)
+        self.assertFalse(DistributionDraft.objects.exists())
+
+    def test_send_after_an_import_keeps_the_imported_day(self):
+        self.client.post(reverse('edit_distribution', args=[self.cities[0].id]), {'new_amount': 12})
+        DistributionImporter(self.workforce, replace=True).run([{"city_id": self.cities[1].id, "packages": 40}])
+
+        response = self.client.post(self.url, {'send': '1'})
+
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertIn("עודכנה ממקור אחר", [str(m) for m in get_messages(response.wsgi_request)][0])
+        saved = dict(DailyDistribution.objects.filter(session=self.workforce).values_list("city_id", "number_of_packages"))
+        self.assertEqual(saved, {self.cities[1].id: 40})
+        self.assertFalse(DistributionDraft.objects.exists())
+
+
+# -------------------------------
+# ✅ Test CityRegistry
+# -------------------------------
+
+def test_city_registry_lookups():
+    registry = CityRegistry([(1, "תל אביב-יפו", 32.08, 34.78), (2, "Haifa", None, None)])
+
+    assert registry.name(1) == "תל אביב-יפו" and registry.name("2") == "Haifa"
+    assert registry.name(3, "Unknown City") == "Unknown City"
+    assert registry.find("Haifa") == 2 and registry.find("haifa") == 2
+    assert registry.find("תל אביב יפו") == 1
+    assert registry.coordinates(1) == (32.08, 34.78) and registry.coordinates(2) is None
+    assert 2 in registry and "x" not in registry
+
+
+class CityRegistryTest(TestCase):
+    def test_registry_is_reloaded_after_city_changes(self):
+        city = City.objects.create(name="Haifa", latitude=32.79, longitude=34.99)
+        self.assertEqual(get_city_registry().name(city.id), "Haifa")
+        with self.assertNumQueries(0):
+            get_city_registry().name(city.id)
+
+        city.name = "Hefa"
+        city.save()
+        self.assertEqual(get_city_registry().name(city.id), "Hefa")
+
+        city.delete()
+        self.assertNotIn(city.id, get_city_registry())
+
+    def test_other_process_changes_are_picked_up_through_the_version(self):
+        city = City.objects.create(name="Haifa", latitude=32.79, longitude=34.99)
+        registry = get_city_registry(check=True)
+        City.objects.filter(id=city.id).update(name="Hefa")  # no signal, like a write in another process
+        EntityVersion.bump("cities")
+
+        self.assertIs(get_city_registry(), registry)  # checked less than a second ago
+        self.assertEqual(get_city_registry(check=True).name(city.id), "Hefa")
+
+
+# -------------------------------
+# ✅ Test query plans
+# -------------------------------
+
+class QueryPlanTest(TestCase):
+    """The hot view queries must search an index, never scan the table."""
+
+    def setUp(self):
+        depot = Depot.objects.create(name="Main Depot", latitude=32.0853, longitude=34.7818)
+        self.workforce = DailyWorkForce.objects.create(date="2025-04-20", number_of_drivers=2, depot=depot)
+        self.city = City.objects.create(name="Haifa", latitude=32.79, longitude=34.99)
+        DailyDistribution.objects.create(session=self.workforce, city=self.city, number_of_packages=5)
+        self.summary = Summary.objects.create(date="2025-04-20", number_of_drivers=2, total_packages=0,
+                                              avg_packages_per_driver=0, std_dev_min=0, std_dev_max=3, depot=depot)
+
+    @staticmethod
+    def captured(queries, statement, table):
+        """The first captured `statement` ("SELECT", "UPDATE"...) that touches `table`."""
+        return next(q["sql"] for q in queries if q["sql"].startswith(statement) and f'"{table}"' in q["sql"])
+
+    def assertSearches(self, sql, table, using):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = "\n".join(row[-1] for row in cursor.fetchall())
+        self.assertIn(f"SEARCH {table} USING {using}", plan)
+        self.assertNotIn(f"SCAN {table}", plan)
+
+    def test_distribution_page_uses_session_city_indexes(self):
+        url = reverse('add_distribution')
+        with CaptureQueriesContext(connection) as page:
+            self.client.get(f"{url}?session_id={self.workforce.id}")
+        with CaptureQueriesContext(connection) as edit:
+            self.client.post(reverse('edit_distribution', args=[self.city.id]), {'new_amount': 7})
+
+        self.assertSearches(
+            self.captured(page, "SELECT", "management_dailydistribution"), "management_dailydistribution",
+            "INDEX sqlite_autoindex_management_dailydistribution_1 (session_id=?)",
+        )
+        self.assertSearches(
+            self.captured(edit, "UPDATE", "management_distributiondraft"), "management_distributiondraft",
+            "INDEX sqlite_autoindex_management_distributiondraft_1 (session_id=? AND city_id=?)",
+        )
+
+    def test_route_data_uses_summary_driver_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('route_data'), {'date': '2025-04-20'})
+        self.assertSearches(
+            self.captured(queries, "SELECT", "management_routesolution"), "management_routesolution",
+            "INDEX routesolution_summary_driver (summary_id=?)",
+        )
+
+    def test_csv_import_matches_names_through_lower_index(self):
+        csv_file = SimpleUploadedFile("cities.csv", "North\nHAIFA\n".encode("utf-8"), content_type="text/csv")
+        with CaptureQueriesContext(connection) as queries:
+            report = CityCSVImporter(Geocoder(lookup=MagicMock(), rate_limit=0, gazetteer=Gazetteer([]))).run(csv_file)
+
+        self.assertEqual((report["cities_created"], report["cities_updated"]), (0, 1))  # HAIFA is Haifa
+        self.assertSearches(
+            self.captured(queries, "SELECT", "management_city"), "management_city",
+            "INDEX city_name_lower (<expr>=?)",
+        )
+
+
+# -------------------------------
+# ✅ Test StoppingPolicy
+# -------------------------------
+
+def test_stopping_policy_scales_with_instance_size():
+    from management.stopping import StoppingPolicy
+
+    policy = StoppingPolicy()
+    small = policy.budget(num_clients=5, num_vehicles=2)
+    large = policy.budget(num_clients=300, num_vehicles=20)
+
+    assert small["max_runtime"] < 1
+    assert large["max_runtime"] > 10 * small["max_runtime"]
+    assert large["no_improvement"] > small["no_improvement"]
+    assert policy.budget(300, 20, max_runtime=3, max_iterations=100)["max_runtime"] == 3
+    assert policy.budget(300, 20, max_iterations=100)["max_iterations"] == 100
+
+
+def test_small_day_solves_quickly_and_records_stats(sample_summary, sample_locations):
+    from management.distance_providers import HaversineDistanceProvider
+
+    solver = VRPSolver(sample_summary, sample_locations, distance_provider=HaversineDistanceProvider())
+    routes = solver.solve_vrp()
+
+    assert sorted(city for route in routes for city in route) == ["CityA", "CityB", "CityC"]
+    assert solver.solve_stats["runtime"] < 1
+    assert solver.solve_stats["iterations"] >= solver.solve_stats["best_iteration"] >= 1
+
+
+def test_solver_passes_its_seed_to_pyvrp(sample_summary, sample_locations):
+    from management.distance_providers import HaversineDistanceProvider
+
+    solver = VRPSolver(sample_summary, sample_locations, distance_provider=HaversineDistanceProvider(), seed=7)
+    with patch("management.vrp_solver.solve", wraps=pyvrp_solve) as mock_solve:
+        solver.solve_vrp()
+    assert mock_solve.call_args.kwargs["seed"] == 7
+
+
+# -------------------------------
+# ✅ Test warm start
+# -------------------------------
+
+def test_build_initial_routes_drops_removed_and_inserts_new_cities():
+    from management.warm_start import build_initial_routes
+
+    names = ["CityA", "CityB", "CityC", "CityD"]
+    deliveries = [3, 4, 2, 1]
+    distances = np.array([
+        [0, 10, 20, 30, 12],
+        [10, 0, 15, 25, 3],
+        [20, 15, 0, 12, 14],
+        [30, 25, 12, 0, 28],
+        [12, 3, 14, 28, 0],
+    ])
+    previous = [["CityA", "Removed", "CityB"], ["CityC"]]
+
+    routes = build_initial_routes(previous, names, deliveries, capacity=8, num_vehicles=2,
+                                  distance_matrix=distances)
+
+    assert routes == [[1, 4, 2], [3]]
+
+
+def test_warm_start_solve_uses_previous_routes(sample_summary, sample_locations):
+    from management.distance_providers import HaversineDistanceProvider
+
+    solver = VRPSolver(sample_summary, sample_locations, distance_provider=HaversineDistanceProvider(),
+                       warm_start_routes=[["CityA", "CityB"], ["Gone"]])
+    routes = solver.solve_vrp()
+
+    assert solver.solve_stats["warm_start"] is True
+    assert sorted(city for route in routes for city in route) == ["CityA", "CityB", "CityC"]
+
+
+# -------------------------------
+# ✅ Test /route_data/ caching
+# -------------------------------
+
+class RouteDataCacheTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        depot = Depot.objects.create(name="מרלוג ראשי", latitude=32.0853, longitude=34.7818)
+        self.summary = Summary.objects.create(
+            date="2025-04-20", number_of_drivers=1, total_packages=60, avg_packages_per_driver=60,
+            std_dev_min=0, std_dev_max=63, package_distribution="", depot=depot,
+        )
+        route = RouteSolution.objects.create(summary=self.summary, driver_id=1)
+        RouteStop.objects.bulk_create([
+            RouteStop(route=route, sequence=i, quantity=1,
+                      city=City.objects.create(name=f"City {i}", latitude=32 + i / 100, longitude=34.8))
+            for i in range(1, 61)
+        ])
+        self.summary.bump_routes_version()
+
+    def test_conditional_requests_and_version_bump(self):
+        url = reverse('route_data')
+        first = self.client.get(url, {'date': '2025-04-20'})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.json()["routes"][0]["points"]), 61)
+        self.assertIn("Last-Modified", first)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, {'date': '2025-04-20'}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        self.summary.bump_routes_version()
+        fresh = self.client.get(url, {'date': '2025-04-20'}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh["ETag"], first["ETag"])
+
+    def test_large_payload_is_gzipped(self):
+        response = self.client.get(reverse('route_data'), {'date': '2025-04-20'}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(response["ETag"].startswith('W/"'))
+        identity = self.client.get(reverse('route_data'), {'date': '2025-04-20'},
+                                   HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(identity.status_code, 304)
+        import gzip
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))["routes"]), 1)
+
+
+# -------------------------------
+# ✅ Test cache layer
+# -------------------------------
+
+class CacheLayerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.depot = Depot.objects.create(name="Main Depot", latitude=32.0853, longitude=34.7818)
+
+    def test_versioned_values_and_stats(self):
+        compute = MagicMock(return_value=[1, 2])
+
+        self.assertEqual(get_or_set("cities", ["things"], compute), [1, 2])
+        self.assertEqual(get_or_set("cities", ["things"], compute), [1, 2])
+        bump_version("cities")
+        get_or_set("cities", ["things"], compute)
+
+        self.assertEqual(compute.call_count, 2)
+        self.assertEqual(cache_stats()["things"], {"hits": 1, "misses": 2, "hit_rate": 0.333})
+
+    @override_settings(CACHE_VERSION_CHECK_SECONDS=60)
+    def test_versions_are_shared_through_the_database(self):
+        with override_settings(CACHE_VERSION_CHECK_SECONDS=0):
+            version = get_versions("cities")[0]
+        EntityVersion.objects.filter(name="cities").update(version=version + 1)  # bumped by another process
+
+        self.assertEqual(get_versions("cities"), [version])  # checked less than a minute ago
+        with override_settings(CACHE_VERSION_CHECK_SECONDS=0):
+            self.assertEqual(get_versions("cities"), [version + 1])
+
+        EntityVersion.objects.filter(name="cities").delete()
+        with override_settings(CACHE_VERSION_CHECK_SECONDS=0):
+            self.assertGreater(get_versions("cities")[0], version)  # a recreated counter never goes back
+
+    def test_routes_page_caches_summary_dates(self):
+        Summary.objects.create(date="2025-04-20", number_of_drivers=1, total_packages=0,
+                               avg_packages_per_driver=0, std_dev_min=0, std_dev_max=3, depot=self.depot)
+        self.client.get(reverse('routes'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('routes'))
+        self.assertEqual([s["date"].isoformat() for s in response.context["summaries"]], ["2025-04-20"])
+
+        Summary.objects.create(date="2025-04-21", number_of_drivers=1, total_packages=0,
+                               avg_packages_per_driver=0, std_dev_min=0, std_dev_max=3, depot=self.depot)
+        response = self.client.get(reverse('routes'))
+        self.assertEqual(len(response.context["summaries"]), 2)
+
+    def test_route_data_goes_stale_when_a_city_is_renamed(self):
+        summary = Summary.objects.create(date="2025-04-20", number_of_drivers=1, total_packages=1,
+                                         avg_packages_per_driver=1, std_dev_min=0, std_dev_max=3, depot=self.depot)
+        city = City.objects.create(name="Haifa", latitude=32.79, longitude=34.99)
+        RouteStop.objects.create(route=RouteSolution.objects.create(summary=summary, driver_id=1),
+                                 sequence=1, city=city, quantity=1)
+        url = reverse('route_data')
+
+        first = self.client.get(url, {'date': '2025-04-20'})
+        city.name = "Hefa"
+        city.save()
+        second = self.client.get(url, {'date': '2025-04-20'}, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["routes"][0]["points"][1]["name"], "Hefa")
+        self.assertEqual(cache_stats()["route_data"]["misses"], 2)
+
+    def test_route_data_follows_the_summary_depot(self):
+        summary = Summary.objects.create(date="2025-04-20", number_of_drivers=1, total_packages=0,
+                                         avg_packages_per_driver=0, std_dev_min=0, std_dev_max=3, depot=self.depot)
+        north = Depot.objects.create(name="North Depot", latitude=32.79, longitude=34.99)
+        url = reverse('route_data')
+        first = self.client.get(url, {'date': '2025-04-20'})
+
+        Summary.objects.filter(id=summary.id).update(depot=north)  # no depot or summary signal fires
+        second = self.client.get(url, {'date': '2025-04-20'}, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["depot"]["name"], "North Depot")
+
+    def test_distribution_page_city_choices_follow_city_changes(self):
+        workforce = DailyWorkForce.objects.create(date="2025-04-20", number_of_drivers=1, depot=self.depot)
+        City.objects.create(name="Haifa", latitude=32.79, longitude=34.99)
+        url = f"{reverse('add_distribution')}?session_id={workforce.id}"
+
+        self.assertContains(self.client.get(url), ">Haifa</option>")
+        City.objects.create(name="Acre", latitude=32.92, longitude=35.07)
+        self.assertContains(self.client.get(url), ">Acre</option>")
+        self.assertEqual(cache_stats()["city_choices"]["misses"], 2)
+
+    def test_stats_view(self):
+        self.client.get(reverse('routes'))
+        self.client.get(reverse('routes'))
+        stats = self.client.get(reverse('cache_stats')).json()
+        self.assertEqual(stats["stats"]["summary_dates"], {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+
+# -------------------------------
+# ✅ Test route geometry
+# -------------------------------
+
+def test_polyline_round_trip():
+    from management.geometry import decode_polyline, encode_polyline
+
+    coords = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    encoded = encode_polyline(coords)
+
+    assert encoded == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert np.allclose(decode_polyline(encoded), coords)
+
+
+def test_simplify_drops_points_within_tolerance():
+    from management.geometry import simplify
+
+    line = [(32.0, 34.8 + i / 1000) for i in range(50)] + [(32.05, 34.9)]
+    simplified = simplify(line, tolerance=10)
+
+    assert len(simplified) == 3
+    assert tuple(simplified[0]) == line[0] and tuple(simplified[-1]) == line[-1]
+
+
+def test_directions_client_chunks_long_routes():
+    from management.geometry import MapboxDirectionsClient, encode_polyline
+
+    points = [(32.0 + i / 100, 34.8) for i in range(30)]
+
+    def fake_get(url, params, timeout):
+        waypoints = [tuple(map(float, c.split(",")))[::-1] for c in url.rsplit("/", 1)[-1].split(";")]
+        assert len(waypoints) <= MapboxDirectionsClient.MAX_WAYPOINTS
+        response = MagicMock()
+        response.json.return_value = {"routes": [{"geometry": encode_polyline(waypoints, precision=6)}]}
+        return response
+
+    client = MapboxDirectionsClient(access_token="test")
+    with patch.object(client.session, "get", side_effect=fake_get) as mock_get:
+        geometry = client.geometry(points)
+
+    assert mock_get.call_count == 2
+    assert np.allclose(geometry, points)
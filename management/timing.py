@@ -0,0 +1,80 @@
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("route_timeline", default=None)
+
+
+class Timeline:
+    """
+    Wall-clock spans of one pipeline run, in milliseconds.
+
+    Spans nest: a span opened inside another is recorded as "outer.inner", and
+    the same name opened twice accumulates. Code deep in the pipeline records
+    into whichever timeline is active through the module-level `span()`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = {}
+        self._stack = []
+        self._start = time.perf_counter()
+        self.total_ms = None
+
+    @contextmanager
+    def span(self, name):
+        path = ".".join([*self._stack, name])
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self._stack.pop()
+            self.spans[path] = round(self.spans.get(path, 0.0) + elapsed, 1)
+
+    def finish(self):
+        self.total_ms = round((time.perf_counter() - self._start) * 1000, 1)
+        logger.info(f"Timeline {self.name}: total={self.total_ms}ms "
+                    + " ".join(f"{path}={ms}ms" for path, ms in self.spans.items()))
+        return self
+
+    def as_dict(self):
+        return dict(self.spans)
+
+
+@contextmanager
+def timeline(name):
+    """Makes a new Timeline the active one for the enclosed code (per thread / context)."""
+    current = Timeline(name)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+        current.finish()
+
+
+@contextmanager
+def span(name):
+    """Times the enclosed code into the active timeline; a no-op when there is none."""
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    with current.span(name):
+        yield
+
+
+def percentile(values, q):
+    """The q-th percentile (0-100) of `values` by linear interpolation, or None if empty."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return round(values[low] + (values[high] - values[low]) * (rank - low), 1)
@@ -1,6 +1,6 @@
 from django.urls import path
 from .views import HomePageView
-from .views import CSVUploadView,DistributionView,WorkforceEntryView,SummaryView,EditDistributionView,RouteGenerationView,RouteDataView
+from .views import CSVUploadView,DistributionView,WorkforceEntryView,SummaryView,EditDistributionView,RouteGenerationView,RouteDataView,RouteJobStatusView,DistributionImportView,CacheStatsView
 
 urlpatterns = [
 
@@ -14,4 +14,7 @@ urlpatterns = [
     path('edit_distribution/<int:city_id>/', EditDistributionView.as_view(), name='edit_distribution'),
     path("generate_routes/", RouteGenerationView.as_view(), name="generate_routes"),
     path("route_data/", RouteDataView.as_view(), name="route_data"),
+    path("route_jobs/<int:job_id>/", RouteJobStatusView.as_view(), name="route_job_status"),
+    path("cache_stats/", CacheStatsView.as_view(), name="cache_stats"),
+    path("api/distributions/<str:selected_date>/", DistributionImportView.as_view(), name="distribution_import"),
 ]
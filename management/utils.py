@@ -2,38 +2,81 @@ import os
 import requests
 import logging
 
+from .gazetteer import get_gazetteer
+
 logger = logging.getLogger(__name__)
 OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
 
+class GeocodingError(Exception):
+    """The geocoder could not answer (as opposed to answering that the name is unknown)."""
+
+
 class Coordinates:
 
     @staticmethod
-    def get_city_coordinates(city_name):
-        """Fetch latitude and longitude of a city using OpenWeatherMap Geocoding API."""
+    def lookup_city(city_name, session=None):
+        """
+        Looks a city up with the OpenWeatherMap Geocoding API. Returns (lat, lon),
+        (None, None) if the city is unknown, and raises GeocodingError when the
+        API can't be asked or fails.
+        """
         if not OPENWEATHERMAP_API_KEY:
-            logger.error("API key is missing. Please insert it in .env")
-            return None, None
+            raise GeocodingError("API key is missing. Please insert it in .env")
 
         url = f"http://api.openweathermap.org/geo/1.0/direct?q={city_name}&limit=1&appid={OPENWEATHERMAP_API_KEY}"
-        response = requests.get(url, timeout=5)
+        try:
+            response = (session or requests).get(url, timeout=5)
+        except requests.RequestException as e:
+            raise GeocodingError(f"Geocoding request failed for {city_name}: {e}") from e
 
-        if response.status_code == 200:
-            data = response.json()
-            if data:
-                return data[0]["lat"], data[0]["lon"]
+        if response.status_code != 200:
+            raise GeocodingError(f"Geocoding API returned {response.status_code} for {city_name}")
 
-        logger.warning(f"No data returned for city: {city_name}")
+        data = response.json()
+        if data:
+            return data[0]["lat"], data[0]["lon"]
         return None, None
 
+    @staticmethod
+    def get_city_coordinates(city_name):
+        """Fetch latitude and longitude of a city, from the local gazetteer or the OpenWeatherMap Geocoding API."""
+        gazetteer = get_gazetteer()
+        if gazetteer is not None:
+            latitude, longitude = gazetteer.coordinates(city_name)
+            if latitude is not None:
+                return latitude, longitude
+
+        try:
+            latitude, longitude = Coordinates.lookup_city(city_name)
+        except GeocodingError as e:
+            logger.error(str(e))
+            latitude, longitude = None, None
+
+        if latitude is None and gazetteer is not None:
+            # Last resort: an approximate gazetteer match
+            latitude, longitude = gazetteer.coordinates(city_name, fuzzy=True)
+            if latitude is not None:
+                logger.warning(f"{city_name} located by fuzzy gazetteer match")
+        if latitude is None:
+            logger.warning(f"No data returned for city: {city_name}")
+        return latitude, longitude
+
 
 class LocationSplitter:
+    PART_SUFFIX = " (part)"
+
+    @staticmethod
+    def base_name(city):
+        """Strips the split marker, returning the original city name."""
+        return city.replace(LocationSplitter.PART_SUFFIX, "")
+
     @staticmethod
     def split(locations, max_capacity):
         logger.debug(f"Splitting locations with max capacity: {max_capacity}")
         split = []
         for city, lat, lon, packages in locations:
             while packages > max_capacity:
-                split.append((f"{city} (part)", lat, lon, max_capacity))
+                split.append((f"{city}{LocationSplitter.PART_SUFFIX}", lat, lon, max_capacity))
                 packages -= max_capacity
             if packages > 0:
                 split.append((city, lat, lon, packages))
@@ -1,28 +1,41 @@
 import logging
 import os
 import csv
+import io
+import json
 from datetime import datetime
 from django.views.generic import TemplateView, FormView, View
 from django.shortcuts import render, redirect
 from django.utils.dateparse import parse_date
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.text import compress_string
+from django.conf import settings
 from django.contrib import messages
 from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 
 from .forms import CSVUploadForm, DistributionForm, WorkforceForm
 from .models import (
-    Polygon, Depot, DailyWorkForce, City,
-    DailyDistribution, Summary, RouteSolution
+    DailyWorkForce, City, DistributionDraft, Summary, RouteJob
 )
-from .utils import Coordinates, LocationSplitter
-from .vrp_solver import VRPSolver
+from .caching import cache_stats, get_or_set, version_tag
+from .drafts import (
+    DraftConflict, add_to_draft, draft_entries, promote_draft, remove_from_draft, set_draft_packages, start_draft,
+)
+from .importers import CityCSVImporter, DistributionImporter, DistributionImportError
+from .jobs import submit_route_job
+from .route_generation import load_routes
+from .summaries import refresh_summary
+from .timing import span, timeline
 
 logger = logging.getLogger(__name__)
 MAPBOX_API_KEY = os.getenv("MAPBOX_API_KEY")
 
-#Standard deviation
-std_dev = 3
-
 
 class RouteGenerationView(View):
     template_name = "routes.html"
@@ -30,7 +43,8 @@ class RouteGenerationView(View):
     def get(self, request):
         selected_date = request.GET.get("selected_date")
         error = request.GET.get("error")
-        summaries = Summary.objects.order_by("-date")
+        # Only the dates are shown; the list is rebuilt when a Summary is saved or deleted
+        summaries = get_or_set("summaries", ["summary_dates"], lambda: list(Summary.objects.order_by("-date").values("date")))
         context = {
             "summaries": summaries,
             "selected_date": selected_date,
@@ -41,54 +55,78 @@ class RouteGenerationView(View):
         return render(request, self.template_name, context)
 
     def post(self, request):
+        with timeline("route-generation-request"):
+            return self._post(request)
+
+    def _post(self, request):
         selected_date = request.POST.get("summary_date")
         logger.info(f"Received date for route generation: {selected_date}")
+        wants_json = "application/json" in request.headers.get("Accept", "")
 
         try:
             parsed_date = parse_date(selected_date) or datetime.strptime(selected_date, "%B %d, %Y").date()
-            summary = Summary.objects.get(date=parsed_date)
+            with span("load_summary"):
+                summary = Summary.objects.select_related("depot").get(date=parsed_date)
             logger.info(f"Summary found: {summary}")
-
-            RouteSolution.objects.filter(summary=summary).delete()
-
-            raw_locations = [
-                (dist.city.name, dist.city.latitude, dist.city.longitude, dist.number_of_packages)
-                for dist in DailyDistribution.objects.filter(session__date=summary.date)
-            ]
-
-            split_locations = LocationSplitter.split(raw_locations, int(summary.std_dev_max))
-            solver = VRPSolver(summary, split_locations)
-            optimized_routes = solver.solve_vrp()
-            logger.info(f"Optimized routes: {optimized_routes}")
-
-            if not optimized_routes:
-                return redirect(f"{reverse('routes')}?error=1")
-
-            depot_name = summary.depot.name
-            depot_normalized = depot_name.replace("מרלוג", "").strip(" ()")
-
-            for driver_id, route_cities in enumerate(optimized_routes, start=1):
-                route_cities = sorted(route_cities, key=lambda x: depot_normalized in x, reverse=True)
-                route_string = " ← ".join(route_cities)
-                logger.debug(f"Saving route: Driver {driver_id}, Route: {route_string}")
-                try:
-                    RouteSolution.objects.create(
-                        summary=summary,
-                        driver_id=driver_id,
-                        route=route_string,
-                    )
-                except Exception as e:
-                    logger.error(f"❌ Failed to save RouteSolution for driver {driver_id}: {e}")
-
-            logger.info("Routes saved successfully.")
-            return redirect(f"{reverse('routes')}?selected_date={parsed_date.strftime('%Y-%m-%d')}")
-
-        except Exception as e:
+        except (Summary.DoesNotExist, TypeError, ValueError):
             logger.exception("Route generation failed")
+            if wants_json:
+                return JsonResponse({"error": "No data for selected date"}, status=404)
             return redirect(f"{reverse('routes')}?error=1")
 
+        try:
+            max_runtime = float(request.POST["max_runtime"]) if request.POST.get("max_runtime") else None
+            max_iterations = int(request.POST["max_iterations"]) if request.POST.get("max_iterations") else None
+        except ValueError:
+            return JsonResponse({"error": "Invalid solver budget"}, status=400)
+
+        with span("submit_job"):
+            job = submit_route_job(summary, max_runtime=max_runtime, max_iterations=max_iterations)
+        if wants_json:
+            return JsonResponse({
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": reverse("route_job_status", args=[job.id]),
+            }, status=202)
+        return redirect(f"{reverse('routes')}?selected_date={parsed_date.strftime('%Y-%m-%d')}&job_id={job.id}")
+
+
+class RouteJobStatusView(View):
+    def get(self, request, job_id):
+        try:
+            job = RouteJob.objects.select_related("summary").get(id=job_id)
+        except RouteJob.DoesNotExist:
+            return JsonResponse({"error": "Unknown job"}, status=404)
+
+        return JsonResponse({
+            "job_id": job.id,
+            "date": job.summary.date.strftime("%Y-%m-%d"),
+            "status": job.status,
+            "routes_count": job.routes_count,
+            "runtime_budget": job.runtime_budget,
+            "duration_ms": job.duration_ms,
+            "timings": job.timings,
+            "error": job.error,
+        })
+
+
+class CacheStatsView(View):
+    def get(self, request):
+        """Cache hits and misses per kind of cached value, as counted by this worker process."""
+        return JsonResponse({
+            "backend": settings.CACHE_BACKEND,
+            "pid": os.getpid(),
+            "stats": cache_stats(),
+        })
+
 
 class RouteDataView(View):
+    # Payloads at least this large are also kept gzipped, for clients that accept it
+    gzip_min_length = 1024
+    cache_timeout = 60 * 60 * 24
+    # Payloads are keyed by the day's routes version and depot, and by these entity versions
+    depends_on = ("cities", "depots")
+
     def get(self, request):
         selected_date = request.GET.get("date")
         if not selected_date:
@@ -96,34 +134,71 @@ class RouteDataView(View):
 
         try:
             parsed_date = parse_date(selected_date) or datetime.strptime(selected_date, "%B %d, %Y").date()
-            summary = Summary.objects.get(date=parsed_date)
+            summary = Summary.objects.select_related("depot").get(date=parsed_date)
         except (Summary.DoesNotExist, ValueError):
             return JsonResponse({"routes": [], "error": "No data for selected date"}, status=404)
 
+        # The payload starts from the depot, which can change without touching the routes
+        routes_key = f"{summary.routes_cache_key}-{summary.depot_id}"
+        versions = version_tag(self.depends_on)
+        response = HttpResponse(content_type="application/json")
+        # Weak: the same tag covers the identity and the gzipped body
+        response["ETag"] = f'W/"routes-{routes_key}-{versions}"'
+        last_modified = None
+        if summary.routes_updated_at:
+            last_modified = int(summary.routes_updated_at.timestamp())
+            response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        conditional = get_conditional_response(
+            request, etag=response["ETag"], last_modified=last_modified, response=response
+        )
+        if conditional is not response:
+            return conditional
+
+        payload, gzipped = get_or_set(
+            self.depends_on, ["route_data", routes_key],
+            lambda: self.encode(summary), timeout=self.cache_timeout,
+        )
+        if gzipped is not None and "gzip" in request.headers.get("Accept-Encoding", ""):
+            response.content = gzipped
+            response["Content-Encoding"] = "gzip"
+        else:
+            response.content = payload
+        return response
+
+    def encode(self, summary):
+        payload = json.dumps(self.build_payload(summary), cls=DjangoJSONEncoder).encode()
+        gzipped = compress_string(payload) if len(payload) >= self.gzip_min_length else None
+        return payload, gzipped
+
+    @staticmethod
+    def build_payload(summary):
         depot = summary.depot
-        routes = RouteSolution.objects.filter(summary=summary)
         route_data = []
 
-        for route in routes:
-            cities = route.route.split(" ← ")
+        for route, stops in load_routes(summary):
             points = [{"lat": depot.latitude, "lon": depot.longitude, "name": depot.name}]
+            for stop in stops:
+                location = stop.location
+                if location is None:
+                    logger.warning(f"Route stop without a location: {stop.id}")
+                    continue
+                points.append({
+                    "lat": location.latitude,
+                    "lon": location.longitude,
+                    "name": location.name,
+                    "quantity": stop.quantity,
+                })
 
-            for city_name in cities:
-                clean_name = city_name.strip().replace(" (part)", "")
-                city = City.objects.filter(name__iexact=clean_name).first() or Depot.objects.filter(name__iexact=clean_name).first()
-
-                if city:
-                    points.append({"lat": city.latitude, "lon": city.longitude, "name": city.name})
-                else:
-                    logger.warning(f"City not found: {city_name}")
-
-            route_data.append({"driver": f"נהג {route.driver_id}", "points": points})
-
-        return JsonResponse({"depot": {"lat": depot.latitude, "lon": depot.longitude, "name": depot.name}, "routes": route_data})
-
-
-
+            route_data.append({
+                "driver": f"נהג {route.driver_id}",
+                "points": points,
+                "geometry": route.geometry,
+                "geometry_levels": route.geometry_levels,
+            })
 
+        return {"depot": {"lat": depot.latitude, "lon": depot.longitude, "name": depot.name}, "routes": route_data}
 
 
 class SummaryView(View):
@@ -141,74 +216,48 @@ class SummaryView(View):
     def process_summary_data(cls, request, selected_date):
         try:
             selected_date = parse_date(selected_date)  # Ensure correct date format
-            workforce = DailyWorkForce.objects.get(date=selected_date)
-            number_of_drivers = workforce.number_of_drivers
-            depot = workforce.depot  # <- ✅ get the depot from the workforce
-
-            # Retrieve all distributions for that date
-            distributions = DailyDistribution.objects.filter(session=workforce)
-
-            cities_data = []
-            package_counts = []
-
-            for distribution in distributions:
-                city = distribution.city
-                package_count = distribution.number_of_packages
-                cities_data.append(
-                    f"{city.name} (Lat: {city.latitude}, Long: {city.longitude}, Packages: {package_count})")
-                package_counts.append(package_count)
-
-            total_packages = sum(package_counts)
-            avg_packages_per_driver = round(total_packages / number_of_drivers, 2) if number_of_drivers else 0
-            std_dev_min = round(max(0, avg_packages_per_driver - std_dev), 0)
-            std_dev_max = round(avg_packages_per_driver + std_dev, 0)
-
-            package_distribution_text = "\n".join(cities_data)
-            package_display_list = [f"{distribution.city.name} - {distribution.number_of_packages} חבילות" for
-                                    distribution in distributions]
-
-            # ✅ Save to Summary
-            summary, created = Summary.objects.update_or_create(
-                date=selected_date,
-                defaults={
-                    "number_of_drivers": number_of_drivers,
-                    "total_packages": total_packages,
-                    "avg_packages_per_driver": avg_packages_per_driver,
-                    "std_dev_min": std_dev_min,
-                    "std_dev_max": std_dev_max,
-                    "package_distribution": package_distribution_text,
-                    "depot": depot,  # ✅ Save depot in Summary model
-                }
-            )
-
-            # ✅ Save to session
-            request.session["summary_data"] = {
-                "date": str(selected_date),
-                "number_of_drivers": number_of_drivers,
-                "depot": depot.name,  # ✅ Or include full location info if needed
-                "package_distribution": package_distribution_text,
-                "package_display": package_display_list,
-                "total_packages": total_packages,
-                "avg_packages_per_driver": avg_packages_per_driver,
-                "std_dev_min": std_dev_min,
-                "std_dev_max": std_dev_max,
-            }
-
-            return redirect("summary")
-
+            workforce = DailyWorkForce.objects.select_related("depot").get(date=selected_date)
         except DailyWorkForce.DoesNotExist:
             return redirect("workforce_entry")  # Redirect if no data found
 
+        # ✅ Save to Summary (totals from one aggregate query)
+        summary = refresh_summary(workforce)
+        package_display_list = [
+            f"{name} - {packages} חבילות"
+            for name, packages in workforce.distributions.values_list("city__name", "number_of_packages")
+        ]
+
+        # ✅ Save to session
+        request.session["summary_data"] = {
+            "date": str(selected_date),
+            "number_of_drivers": summary.number_of_drivers,
+            "depot": workforce.depot.name,  # ✅ Or include full location info if needed
+            "package_distribution": summary.package_distribution,
+            "package_display": package_display_list,
+            "total_packages": summary.total_packages,
+            "avg_packages_per_driver": summary.avg_packages_per_driver,
+            "std_dev_min": summary.std_dev_min,
+            "std_dev_max": summary.std_dev_max,
+        }
+
+        return redirect("summary")
+
 
 class EditDistributionView(View):
     def post(self, request, city_id):
-        if 'distribution_data' in request.session:
-            new_amount = request.POST.get('new_amount')
-            for entry in request.session['distribution_data']:
-                if entry['city_id'] == int(city_id):
-                    entry['number_of_packages'] = int(new_amount)
-                    break
-            request.session.modified = True
+        if 'workforce_data' in request.session:
+            try:
+                new_amount = int(request.POST.get('new_amount'))
+                if new_amount < 0:
+                    raise ValueError(new_amount)
+            except (TypeError, ValueError):
+                messages.error(request, "❌ מספר חבילות לא תקין.")
+                return redirect('add_distribution')
+            workforce_entry = DailyWorkForce.objects.get(id=request.session['workforce_data']['workforce_id'])
+            start_draft(workforce_entry)
+            DistributionDraft.objects.filter(session=workforce_entry, city_id=city_id).update(
+                number_of_packages=new_amount
+            )
         return redirect('add_distribution')
 
 
@@ -232,10 +281,6 @@ class WorkforceEntryView(FormView):
 
             }
         )
-        if created:
-            # 🚨 New session – wipe any old city entries
-            request.session.pop('distribution_data', None)
-
         # ❗ If it already existed, update its fields manually
         if not created:
             workforce.number_of_drivers = number_of_drivers
@@ -265,7 +310,7 @@ class DistributionView(View):
 
         if session_id:
             try:
-                workforce_entry = DailyWorkForce.objects.get(id=session_id)
+                workforce_entry = DailyWorkForce.objects.select_related("depot").get(id=session_id)
                 request.session['workforce_data'] = {
                     'date': str(workforce_entry.date),
                     'number_of_drivers': workforce_entry.number_of_drivers,
@@ -275,18 +320,6 @@ class DistributionView(View):
                     'depot_lat': workforce_entry.depot.latitude,
                     'depot_lon': workforce_entry.depot.longitude,
                 }
-
-                # Load cities from DB for this session
-                distribution_data = []
-                for entry in DailyDistribution.objects.filter(session=workforce_entry):
-                    distribution_data.append({
-                        'session_id': workforce_entry.id,
-                        'city_id': entry.city.id,
-                        'city_name': entry.city.name,
-                        'number_of_packages': entry.number_of_packages
-                    })
-
-                request.session['distribution_data'] = distribution_data
                 request.session.modified = True
 
             except DailyWorkForce.DoesNotExist:
@@ -300,112 +333,128 @@ class DistributionView(View):
         workforce_entry = DailyWorkForce.objects.get(id=session_data['workforce_id'])
 
         form = DistributionForm(initial={'session': workforce_entry})
-        form.fields['city'].queryset = City.objects.order_by("name")
-        cities = request.session.get('distribution_data', [])
+        city_field = form.fields['city']
+        city_field.queryset = City.objects.order_by("name")
+        city_field.choices = [("", city_field.empty_label)] + get_or_set(
+            "cities", ["city_choices"], lambda: list(city_field.queryset.values_list("id", "name"))
+        )
 
         return render(request, self.template_name, {
             'session_data': session_data,
             'form': form,
-            'cities': cities,
+            'cities': draft_entries(workforce_entry),
             'all_sessions': DailyWorkForce.objects.all().order_by('-date')
         })
 
     def post(self, request):
         """Handles form submission: Save cities or redirect to summary."""
+        if 'workforce_data' not in request.session:
+            return redirect('workforce_entry')
+
+        session_data = request.session['workforce_data']
+        workforce_entry = DailyWorkForce.objects.get(id=session_data['workforce_id'])
+
         if 'save_edits' in request.POST:
-            for i, entry in enumerate(request.session.get('distribution_data', [])):
-                package_key = f'packages_{i}'
-                if package_key in request.POST:
+            packages_by_city = {}
+            for key, value in request.POST.items():
+                if key.startswith('packages_'):
                     try:
-                        new_value = int(request.POST[package_key])
-                        request.session['distribution_data'][i]['number_of_packages'] = new_value
+                        packages_by_city[int(key[len('packages_'):])] = int(value)
                     except ValueError:
                         pass  # Optionally flash a message
-            request.session.modified = True
+            if any(packages < 0 for packages in packages_by_city.values()):
+                messages.error(request, "❌ מספר חבילות לא תקין.")
+                return redirect('add_distribution')
+            start_draft(workforce_entry)
+            set_draft_packages(workforce_entry, packages_by_city)
             messages.success(request, "✅ הנתונים נשמרו בהצלחה!")
             return redirect('add_distribution')
 
-        if 'workforce_data' not in request.session:
-            return redirect('workforce_entry')
-
-        session_data = request.session['workforce_data']
-        workforce_entry = DailyWorkForce.objects.get(id=session_data['workforce_id'])
         if 'delete' in request.POST:
-            delete_index = int(request.POST.get('delete'))
-            if 'distribution_data' in request.session:
-                try:
-                    del request.session['distribution_data'][delete_index]
-                    request.session.modified = True
-                    messages.success(request, "✅ העיר הוסרה מהרשימה.")
-                except IndexError:
-                    messages.error(request, "❌ לא ניתן למחוק את העיר.")
+            start_draft(workforce_entry)
+            try:
+                removed = remove_from_draft(workforce_entry, int(request.POST.get('delete')))
+            except ValueError:
+                removed = False
+            if removed:
+                messages.success(request, "✅ העיר הוסרה מהרשימה.")
+            else:
+                messages.error(request, "❌ לא ניתן למחוק את העיר.")
             return redirect('add_distribution')
 
         # 🛑 If "send" was clicked, SKIP form validation and save directly to DB
         if 'send' in request.POST:
-            total_packages = 0
-            city_data = []
-
-            for entry in request.session.get('distribution_data', []):
-                city_obj = City.objects.get(id=entry['city_id'])
-
-                DailyDistribution.objects.update_or_create(
-                    session=workforce_entry,
-                    city=city_obj,
-                    defaults={'number_of_packages': entry['number_of_packages']}
-                )
-
-                city_data.append(f"{city_obj.name} - {entry['number_of_packages']}")
-                total_packages += entry['number_of_packages']
-
-            avg_packages = total_packages / workforce_entry.number_of_drivers if workforce_entry.number_of_drivers > 0 else 0
-
-            request.session['summary_data'] = {
-                'date': str(workforce_entry.date),
-                'number_of_drivers': workforce_entry.number_of_drivers,
-                'city_data': city_data,
-                'total_packages': total_packages,
-                'avg_packages_per_driver': round(avg_packages, 2),
-            }
-
+            try:
+                promote_draft(workforce_entry)
+            except DraftConflict:
+                messages.error(request, "⚠️ ההפצה של היום עודכנה ממקור אחר בזמן העריכה. השינויים לא נשמרו – בדוק את הנתונים המעודכנים ושלח שוב.")
+                return redirect('add_distribution')
             del request.session['workforce_data']
-            del request.session['distribution_data']
 
             return redirect('process_summary', selected_date=str(workforce_entry.date))
 
         # ✅ Only validate form for "save" button
         form = DistributionForm(request.POST)
         if form.is_valid():
-            if 'distribution_data' not in request.session:
-                request.session['distribution_data'] = []
-
-            existing_entries = request.session['distribution_data']
-            new_city_id = form.cleaned_data['city'].id
-
-            if any(entry['city_id'] == new_city_id for entry in existing_entries):
-                messages.warning(request, f"העיר {form.cleaned_data['city'].name} כבר נוספה לרשימה.")
+            city = form.cleaned_data['city']
+            start_draft(workforce_entry)
+            if add_to_draft(workforce_entry, city, form.cleaned_data['number_of_packages']):
+                messages.success(request, f"העיר {city.name} נוספה בהצלחה.")
             else:
-                existing_entries.append({
-                    'session_id': workforce_entry.id,
-                    'city_id': new_city_id,
-                    'city_name': form.cleaned_data['city'].name,
-                    'number_of_packages': form.cleaned_data['number_of_packages']
-                })
-                request.session.modified = True
-                messages.success(request, f"העיר {form.cleaned_data['city'].name} נוספה בהצלחה.")
+                messages.warning(request, f"העיר {city.name} כבר נוספה לרשימה.")
 
             return redirect('add_distribution')
 
         return self.get(request)  # Reload page on errors
 
 
-
 class HomePageView(TemplateView):
     template_name = "home.html"
 
 
 
 
+@method_decorator(csrf_exempt, name="dispatch")
+class DistributionImportView(View):
+    """
+    Bulk-loads a day's distribution for other systems: a JSON list of
+    {"city" or "city_id", "packages"}, or a CSV (request body or a "file"
+    upload). ?replace=1 drops the day's cities missing from the payload.
+    The API is off until DISTRIBUTION_API_TOKEN is set.
+    """
+
+    def post(self, request, selected_date):
+        token = settings.DISTRIBUTION_API_TOKEN
+        if not token:
+            return JsonResponse({"error": "Distribution import API is disabled"}, status=503)
+        if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return JsonResponse({"error": "Unauthorized"}, status=401)
+
+        try:
+            workforce = DailyWorkForce.objects.filter(date=parse_date(selected_date)).first()
+        except (TypeError, ValueError):
+            workforce = None
+        if workforce is None:
+            return JsonResponse({"error": "No workforce for selected date"}, status=404)
+
+        importer = DistributionImporter(workforce, replace=request.GET.get("replace") in ("1", "true"))
+        try:
+            if "file" in request.FILES:
+                rows = DistributionImporter.rows_from_csv(request.FILES["file"])
+            elif request.content_type == "text/csv":
+                rows = DistributionImporter.rows_from_csv(io.BytesIO(request.body))
+            else:
+                rows = DistributionImporter.rows_from_json(json.loads(request.body))
+            report = importer.run(rows)
+        except DistributionImportError as e:
+            return JsonResponse({"error": str(e), "errors": e.errors[:100]}, status=400)
+        except (ValueError, csv.Error) as e:  # bad JSON / encoding
+            logger.warning(f"Distribution import rejected: {e}")
+            return JsonResponse({"error": "Invalid payload"}, status=400)
+
+        return JsonResponse({"date": str(workforce.date), **report})
+
+
 class CSVUploadView(View):
     template_name = "upload_csv.html"
 
@@ -416,73 +465,16 @@ class CSVUploadView(View):
     def post(self, request):
         form = CSVUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            csv_file = request.FILES["file"]
-
-            # Read CSV file
-            decoded_file = csv_file.read().decode("utf-8").splitlines()
-            reader = csv.reader(decoded_file)
-
-            headers = next(reader)  # Extract headers (First row)
-
-            polygons = {}  # Store polygons to avoid duplicate queries
-
-            for row in reader:
-                for i, city_name in enumerate(row):
-                    city_name = city_name.strip()
-                    if not city_name:  # Skip empty values
-                        continue
-
-                    polygon_title = headers[i]  # Column header is the polygon title
-
-                    if polygon_title not in polygons:
-                        polygon, _ = Polygon.objects.get_or_create(title=polygon_title)
-                        polygons[polygon_title] = polygon
-                    else:
-                        polygon = polygons[polygon_title]
-
-                    # Check if city exists
-                    existing_city = City.objects.filter(name=city_name).first()
-
-                    if existing_city:
-                        # Update existing city with new polygon and coordinates if needed
-                        if existing_city.polygon != polygon:
-                            print(f"Updating city '{city_name}' to new polygon '{polygon_title}'")
-                            existing_city.polygon = polygon
-
-                        # Get new coordinates
-                        latitude, longitude = Coordinates.get_city_coordinates(city_name)
-
-                        # Update only if new coordinates are valid
-                        if latitude and longitude:
-                            existing_city.latitude = latitude
-                            existing_city.longitude = longitude
-
-                        existing_city.save()  # Save updates
-
-                        # CHANGE: Update the many-to-many field by adding the existing city to the polygon.
-                        polygon.cities.add(existing_city)
-                    else:
-                        # New city, get coordinates and insert it
-                        latitude, longitude = Coordinates.get_city_coordinates(city_name)
-                        new_city = City.objects.create(
-                            name=city_name,
-                            latitude=latitude,
-                            longitude=longitude,
-                            polygon=polygon
-                        )
-                        # CHANGE: Add the newly created city to the polygon's many-to-many field.
-                        polygon.cities.add(new_city)
+            try:
+                report = CityCSVImporter().run(request.FILES["file"])
+            except (UnicodeDecodeError, csv.Error, StopIteration) as e:
+                logger.warning(f"CSV upload rejected: {e}")
+                return render(request, self.template_name, {"form": form, "error": "Invalid file format"})
 
             return render(request, self.template_name, {
                 "form": form,
-                "success": "CSV data uploaded successfully and updated existing records!"
+                "success": "CSV data uploaded successfully and updated existing records!",
+                "report": report,
             })
 
         return render(request, self.template_name, {"form": form, "error": "Invalid file format"})
-
-
-
-
-
-
-
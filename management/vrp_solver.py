@@ -1,111 +1,312 @@
-import os
-import requests
 import numpy as np
 import logging
+from django.conf import settings
 from dotenv import load_dotenv
-from pyvrp import Model
-from pyvrp.stop import MaxRuntime
+from pyvrp import Client, Depot, ProblemData, VehicleType, solve
+
+from .decomposition import PolygonDecomposition
+from .distance_store import DistanceStore
+from .stopping import StoppingPolicy, best_iteration
+from .timing import span
+from .distance_providers import get_distance_provider, get_fallback_provider
+from .utils import LocationSplitter
+from .warm_start import build_initial_routes, solve_from
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-MAPBOX_API_KEY = os.getenv("MAPBOX_API_KEY")
+
+def build_problem_data(depot, locations, deliveries, capacity, num_vehicles, distance_matrix):
+    """
+    Builds the PyVRP ProblemData straight from arrays: `depot` is its (lat, lon),
+    `locations` an (n, 2) array of client (lat, lon), `deliveries` their demand
+    and `distance_matrix` the (n + 1) x (n + 1) depot-first distances.
+
+    Passing the matrices whole replaces one `Model.add_edge` call per ordered
+    pair of locations; only the clients themselves are created one by one.
+    """
+    coords = (np.asarray(locations, dtype=np.float64).reshape(-1, 2) * 100000).astype(np.int64)
+    deliveries = np.asarray(deliveries, dtype=np.int64)
+    distances = np.ascontiguousarray(distance_matrix, dtype=np.int64)
+    np.fill_diagonal(distances, 0)
+
+    clients = [
+        Client(x=int(x), y=int(y), delivery=[int(packages)])
+        for (y, x), packages in zip(coords.tolist(), deliveries.tolist())
+    ]
+    depots = [Depot(x=int(depot[1] * 100000), y=int(depot[0] * 100000))]
+    vehicle_types = [VehicleType(num_vehicles, capacity=[capacity], start_depot=0, end_depot=0)]
+
+    return ProblemData(clients, depots, vehicle_types, [distances], [np.zeros_like(distances)])
 
 
 class VRPSolver:
     """
     Class to handle the VRP (Vehicle Routing Problem) processing using PyVRP.
     """
-    def __init__(self, summary, locations):
+    def __init__(self, summary, locations, city_ids=None, distance_store=None,
+                 distance_provider=None, fallback_provider=None, stopping_policy=None,
+                 max_runtime=None, max_iterations=None, warm_start_routes=None,
+                 distance_matrix=None, display=True, regions=None, decompose=None, decompose_workers=None,
+                 seed=0):
         self.summary = summary
         self.LOCATIONS = locations
         self.START_LOCATION = (summary.depot.latitude, summary.depot.longitude)
         self.number_of_drivers = summary.number_of_drivers
         self.max_capacity = int(summary.std_dev_max)
+        self.city_ids = city_ids or {}
+        self.distance_store = distance_store
+        self.distance_provider = distance_provider or get_distance_provider()
+        self.fallback_provider = fallback_provider if fallback_provider is not None else get_fallback_provider()
+        self.stopping_policy = stopping_policy or StoppingPolicy.from_settings()
+        # Per-request overrides win over the Summary's, which win over the policy
+        self.max_runtime = max_runtime if max_runtime is not None else getattr(summary, "max_runtime", None)
+        self.max_iterations = max_iterations if max_iterations is not None else getattr(summary, "max_iterations", None)
+        # Routes (lists of city names, split parts unmarked) of a previous solve to start the search from
+        self.warm_start_routes = warm_start_routes or []
+        self.display = display
+        # PyVRP's random seed, so the same instance and budget give the same routes
+        self.seed = seed
+        # City name -> region (Polygon id) for decomposed solves; None decides by instance size
+        self.regions = regions or {}
+        self.decompose = decompose
+        self.decompose_workers = decompose_workers or getattr(settings, "VRP_DECOMPOSE_WORKERS", 1)
+        self.solve_stats = {}
+        # The distance matrix (km; computed on solve unless given) and, after solving,
+        # every route as location indices (depot = 0)
+        self.distance_matrix = distance_matrix
+        self.routes = []
 
-    def _get_distance_matrix(self):
+    def _all_points(self):
+        return [self.START_LOCATION] + [(lat, lon) for _, lat, lon, _ in self.LOCATIONS]
+
+    def _location_keys(self):
         """
-        Fetches the driving distance matrix from Mapbox API.
+        Returns the distance store key of the depot and every location, or None
+        if any of them has no known id (the store can't be used then).
         """
-        logger.info("Fetching distance matrix from Mapbox API...")
-        all_points = [self.START_LOCATION] + [(lat, lon) for _, lat, lon, _ in self.LOCATIONS]
-        coords = ";".join([f"{lon},{lat}" for lat, lon in all_points])
-        url = (
-            f"https://api.mapbox.com/directions-matrix/v1/mapbox/driving/"
-            f"{coords}?annotations=distance&access_token={MAPBOX_API_KEY}"
-        )
+        depot_id = getattr(self.summary.depot, "id", None)
+        if depot_id is None:
+            return None
 
-        response = requests.get(url)
-        data = response.json()
+        keys = [DistanceStore.depot_key(depot_id)]
+        for city, _, _, _ in self.LOCATIONS:
+            city_id = self.city_ids.get(LocationSplitter.base_name(city))
+            if city_id is None:
+                return None
+            keys.append(DistanceStore.city_key(city_id))
+        return keys
 
-        if "distances" not in data:
-            logger.error(f"Error fetching distance matrix: {data}")
-            return None
+    @staticmethod
+    def unique_points(points):
+        """
+        Returns the indices of the distinct points (in first-seen order) and, for
+        every point, the position of its distinct copy among them.
+        """
+        coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        _, first, inverse = np.unique(coords, axis=0, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+        return first[order], position[inverse.reshape(-1)]
 
-        matrix = np.array(data["distances"], dtype=np.float64) / 1000
-        logger.info("Distance matrix fetched and converted to kilometers.")
-        return matrix.astype(np.int64)
+    def _provider_distances(self, points, keys=None):
+        """
+        Distances in meters from the primary provider, going through the distance
+        store when the provider returns real road distances and ids are known.
+        """
+        provider = self.distance_provider
+        if self.distance_store is None or not provider.cacheable:
+            keys = None
 
-    def solve_vrp(self):
+        try:
+            if keys is not None:
+                logger.info(f"Reading distance matrix from the distance store ({provider.name})...")
+                return self.distance_store.submatrix(keys, points, provider.matrix)
+            logger.info(f"Fetching distance matrix from {provider.name}...")
+            return provider.matrix(points)
+        except Exception:
+            logger.exception(f"Distance provider {provider.name} failed")
+            return None
+
+    def _get_distance_matrix(self):
         """
-        Solves the VRP problem using PyVRP and returns city lists for each route.
+        Returns the driving distance matrix in kilometers, falling back to the
+        offline provider when the primary one can't answer.
+
+        Split parts of a city share its coordinates, so distances are fetched
+        once per distinct point and expanded to every location by index.
         """
-        logger.info("Running VRP Solver...")
-        distance_matrix = self._get_distance_matrix()
+        all_points = self._all_points()
+        distinct, position = self.unique_points(all_points)
+        points = [all_points[i] for i in distinct]
+        keys = self._location_keys() if self.distance_store is not None else None
+        if keys is not None:
+            keys = [keys[i] for i in distinct]
+        if len(points) < len(all_points):
+            logger.info(f"Fetching distances for {len(points)} distinct points instead of {len(all_points)}.")
 
-        if distance_matrix is None:
-            logger.warning("Distance matrix is None. Aborting VRP solution.")
-            return []
+        meters = self._provider_distances(points, keys)
 
-        logger.info(f"Using vehicle capacity: {self.max_capacity}")
+        if meters is None and self.fallback_provider is not None:
+            logger.warning(f"Falling back to {self.fallback_provider.name} distances.")
+            meters = self.fallback_provider.matrix(points)
 
-        m = Model()
-        depot = m.add_depot(
-            x=int(self.START_LOCATION[1] * 100000),
-            y=int(self.START_LOCATION[0] * 100000)
-        )
+        if meters is None:
+            return None
+
+        matrix = (np.asarray(meters, dtype=np.float64) / 1000).astype(np.int64)
+        logger.info("Distance matrix ready and converted to kilometers.")
+        return matrix[np.ix_(position, position)]
+
+    def _should_decompose(self, num_clients):
+        if self.decompose is not None:
+            return self.decompose
+        min_clients = getattr(settings, "VRP_DECOMPOSE_MIN_CLIENTS", 0)
+        return bool(min_clients) and num_clients >= min_clients and bool(self.regions)
+
+    def _solve_decomposed(self, data, locations, distance_matrix, num_vehicles):
+        """Solves the day polygon by polygon (see PolygonDecomposition); None if it can't be split."""
+        points = np.array([(lat, lon) for _, lat, lon, _ in locations], dtype=np.float64).reshape(-1, 2)
+        deliveries = np.array([packages for _, _, _, packages in locations], dtype=np.int64)
+
+        def build_data(clients, vehicles):
+            clients = np.asarray(clients)
+            rows = np.concatenate([[0], clients])
+            return build_problem_data(
+                self.START_LOCATION, points[clients - 1], deliveries[clients - 1],
+                self.max_capacity, vehicles, distance_matrix[np.ix_(rows, rows)],
+            )
 
-        m.add_vehicle_type(
-            self.number_of_drivers,
-            capacity=self.max_capacity,
-            start_depot=depot,
-            end_depot=None
+        decomposition = PolygonDecomposition(
+            self.stopping_policy, workers=self.decompose_workers,
+            max_runtime=self.max_runtime, max_iterations=self.max_iterations, seed=self.seed,
         )
+        client_regions = [self.regions.get(LocationSplitter.base_name(city)) for city, _, _, _ in locations]
+        result = decomposition.solve(data, build_data, client_regions, self.max_capacity, num_vehicles)
+        return result, decomposition.stats
 
-        clients = []
-        city_map = {}
+    def _full_loads(self):
+        """
+        Splits the location indices into full truckloads (a location that fills a
+        vehicle by itself, so its only possible route is depot -> location) and
+        the clients left for PyVRP. Nothing is extracted when the drivers could
+        not cover the rest anyway, so such days are solved whole as before.
+        """
+        full = [idx for idx, (_, _, _, packages) in enumerate(self.LOCATIONS, start=1) if packages >= self.max_capacity]
+        full_set = set(full)
+        rest = [idx for idx in range(1, len(self.LOCATIONS) + 1) if idx not in full_set]
+        remaining_volume = sum(self.LOCATIONS[idx - 1][3] for idx in rest)
+        if full and self.number_of_drivers - len(full) < -(-remaining_volume // self.max_capacity):
+            return [], list(range(1, len(self.LOCATIONS) + 1))
+        return full, rest
 
-        for idx, (city, lat, lon, packages) in enumerate(self.LOCATIONS):
-            client = m.add_client(
-                x=int(lon * 100000),
-                y=int(lat * 100000),
-                delivery=packages
+    def _solve_clients(self, clients, distance_matrix, num_vehicles):
+        """
+        Solves the sub-instance of the given location indices with `num_vehicles`
+        and returns (PyVRP result, budget/stats dict), or (None, {}) if nothing was found.
+        """
+        locations = [self.LOCATIONS[idx - 1] for idx in clients]
+        with span("build_model"):
+            rows = [0, *clients]
+            matrix = distance_matrix[np.ix_(rows, rows)]
+            data = build_problem_data(
+                self.START_LOCATION,
+                [(lat, lon) for _, lat, lon, _ in locations],
+                [packages for _, _, _, packages in locations],
+                self.max_capacity,
+                num_vehicles,
+                matrix,
             )
-            clients.append(client)
-            city_map[idx + 1] = city
 
-        locations = [depot] + clients
-        for frm_idx, frm in enumerate(locations):
-            for to_idx, to in enumerate(locations):
-                if frm_idx != to_idx:
-                    distance = distance_matrix[frm_idx, to_idx]
-                    m.add_edge(frm, to, distance=int(distance))
+        if self._should_decompose(data.num_clients):
+            with span("decomposed_solve"):
+                solution, decomposition_stats = self._solve_decomposed(data, locations, matrix, num_vehicles)
+            if solution is not None:
+                return solution, {"decomposed": True, **decomposition_stats}
+
+        initial_routes = None
+        if self.warm_start_routes:
+            with span("warm_start"):
+                initial_routes = build_initial_routes(
+                    self.warm_start_routes,
+                    names=[LocationSplitter.base_name(city) for city, _, _, _ in locations],
+                    deliveries=[packages for _, _, _, packages in locations],
+                    capacity=self.max_capacity,
+                    num_vehicles=num_vehicles,
+                    distance_matrix=matrix,
+                )
+
+        budget = self.stopping_policy.budget(
+            data.num_clients, num_vehicles,
+            max_runtime=self.max_runtime, max_iterations=self.max_iterations,
+            warm_start=bool(initial_routes),
+        )
+        logger.info(f"Solving VRP with budget {budget}...")
+        with span("pyvrp_solve"):
+            if initial_routes:
+                solution = solve_from(data, StoppingPolicy.criterion(budget), initial_routes,
+                                      seed=self.seed, display=self.display)
+            else:
+                solution = solve(data, stop=StoppingPolicy.criterion(budget), seed=self.seed, display=self.display)
+        return solution, budget
 
-        logger.info("Solving VRP with MaxRuntime(30)...")
-        solution = m.solve(stop=MaxRuntime(30), display=True)
+    def total_distance(self):
+        """Length in km of the current routes, each driven depot -> stops -> depot."""
+        return int(sum(
+            self.distance_matrix[0, route[0]]
+            + sum(self.distance_matrix[a, b] for a, b in zip(route, route[1:]))
+            + self.distance_matrix[route[-1], 0]
+            for route in self.routes if route
+        ))
 
-        if solution is None or not solution.best:
-            logger.warning("No feasible solution found.")
+    def solve_vrp(self):
+        """
+        Solves the VRP problem using PyVRP and returns city lists for each route.
+        """
+        logger.info("Running VRP Solver...")
+        distance_matrix = self.distance_matrix
+        if distance_matrix is None:
+            with span("distance_matrix"):
+                distance_matrix = self._get_distance_matrix()
+
+        if distance_matrix is None:
+            logger.warning("Distance matrix is None. Aborting VRP solution.")
             return []
+        self.distance_matrix = distance_matrix
+
+        logger.info(f"Using vehicle capacity: {self.max_capacity}")
+
+        # Full truckloads go straight to their own vehicles; PyVRP only sees the rest of the day
+        full_loads, clients = self._full_loads()
+        if full_loads:
+            logger.info(f"{len(full_loads)} full truckloads routed directly, solving {len(clients)} clients.")
 
-        route_cities_list = []
+        routes, stats = [], {"iterations": 0, "best_iteration": None, "runtime": 0.0}
+        if clients:
+            solution, budget = self._solve_clients(clients, distance_matrix, self.number_of_drivers - len(full_loads))
+            if solution is None or not solution.best:
+                logger.warning("No feasible solution found.")
+                return []
+            routes = [[clients[int(node) - 1] for node in route] for route in solution.best.routes()]
+            stats = {
+                **budget,
+                "iterations": int(solution.num_iterations),
+                "best_iteration": best_iteration(solution),
+                "runtime": float(solution.runtime),
+            }
 
-        for route in solution.best.routes():
-            route_nodes = [node for node in route]
-            route_cities = [city_map.get(int(node), f"Unknown({node})") for node in route_nodes]
-            route_cities_list.append(route_cities)
+        self.routes = routes + [[idx] for idx in full_loads]
+        self.solve_stats = {
+            **stats,
+            "full_loads": len(full_loads),
+            "num_clients": len(self.LOCATIONS),
+            "objective": self.total_distance(),
+        }
+        logger.info(f"Solve stats: {self.solve_stats}")
 
+        route_cities_list = [[self.LOCATIONS[idx - 1][0] for idx in route] for route in self.routes]
         logger.info(f"VRP solved. {len(route_cities_list)} routes generated.")
-        return route_cities_list
\ No newline at end of file
+        return route_cities_list
@@ -0,0 +1,97 @@
+import logging
+from collections import defaultdict
+
+from pyvrp import GeneticAlgorithm, PenaltyManager, Population, RandomNumberGenerator, Solution, SolveParams
+from pyvrp.crossover import ordered_crossover as ox
+from pyvrp.crossover import selective_route_exchange as srex
+from pyvrp.diversity import broken_pairs_distance as bpd
+from pyvrp.search import LocalSearch, compute_neighbours
+
+logger = logging.getLogger(__name__)
+
+
+def build_initial_routes(previous_routes, names, deliveries, capacity, num_vehicles, distance_matrix):
+    """
+    Rebuilds PyVRP routes (lists of client indices, depot = 0) from previously
+    stored routes given as lists of location names.
+
+    Names that no longer exist are dropped, routes that now exceed the capacity
+    shed their last stops, and every client that is left over (new cities,
+    extra split parts) is inserted greedily where it adds the least distance.
+    """
+    available = defaultdict(list)
+    for idx, name in enumerate(names, start=1):
+        available[name].append(idx)
+
+    routes = []
+    for previous in previous_routes:
+        route = [available[name].pop(0) for name in previous if available.get(name)]
+        load = sum(deliveries[c - 1] for c in route)
+        while route and load > capacity:
+            load -= deliveries[route.pop() - 1]
+        if route:
+            routes.append(route)
+
+    # Fewer drivers than last time: the smallest routes are re-inserted client by client
+    routes.sort(key=len, reverse=True)
+    routes = routes[:num_vehicles]
+
+    assigned = {c for route in routes for c in route}
+    unassigned = [c for c in range(1, len(names) + 1) if c not in assigned]
+    unassigned.sort(key=lambda c: deliveries[c - 1], reverse=True)
+    loads = [sum(deliveries[c - 1] for c in route) for route in routes]
+    logger.info(f"Warm start: kept {len(assigned)} clients in {len(routes)} routes, inserting {len(unassigned)}.")
+
+    for client in unassigned:
+        demand = deliveries[client - 1]
+        best = None
+        for ignore_capacity in (False, True):
+            for r, route in enumerate(routes):
+                if not ignore_capacity and loads[r] + demand > capacity:
+                    continue
+                stops = [0, *route, 0]
+                for pos in range(1, len(stops)):
+                    prev, nxt = stops[pos - 1], stops[pos]
+                    delta = (distance_matrix[prev, client] + distance_matrix[client, nxt]
+                             - distance_matrix[prev, nxt])
+                    if best is None or delta < best[0]:
+                        best = (delta, r, pos - 1)
+            if best is not None or (not ignore_capacity and len(routes) < num_vehicles):
+                break
+
+        if best is None:
+            routes.append([client])
+            loads.append(demand)
+        else:
+            _, r, pos = best
+            routes[r].insert(pos, client)
+            loads[r] += demand
+
+    return routes
+
+
+def solve_from(data, stop, initial_routes, seed=0, display=False, params=SolveParams()):
+    """
+    Same as pyvrp.solve, except that the initial population is seeded with the
+    given routes instead of being entirely random.
+    """
+    rng = RandomNumberGenerator(seed=seed)
+    neighbours = compute_neighbours(data, params.neighbourhood)
+    ls = LocalSearch(data, rng, neighbours)
+
+    for node_op in params.node_ops:
+        ls.add_node_operator(node_op(data))
+
+    for route_op in params.route_ops:
+        ls.add_route_operator(route_op(data))
+
+    pm = PenaltyManager.init_from(data, params.penalty)
+    pop = Population(bpd, params.population)
+    init = [Solution(data, initial_routes)] + [
+        Solution.make_random(data, rng)
+        for _ in range(params.population.min_pop_size - 1)
+    ]
+
+    crossover = srex if data.num_vehicles > 1 else ox
+    algo = GeneticAlgorithm(data, pm, rng, pop, ls, crossover, init, params.genetic)
+    return algo.run(stop, collect_stats=True, display=display)
@@ -85,6 +85,47 @@ DATABASES = {
     }
 }
 
+# "production" lets readers run while a solve writes its routes: WAL journal, a busy
+# timeout instead of "database is locked", and persistent connections.
+# "development" (the default, also used by the tests) keeps SQLite's defaults.
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "development")
+# PRAGMAs run on every new SQLite connection (see management/db.py)
+SQLITE_PRAGMAS = {}
+if DATABASE_PROFILE == "production":
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': float(os.getenv("SQLITE_BUSY_TIMEOUT", 20))},  # seconds
+    })
+    SQLITE_PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL"}
+
+
+# Cache for summaries, route payloads and city data (see management/caching.py):
+# "locmem" keeps a separate copy in every process (meant for a single process), "file" shares
+# one between gunicorn workers through CACHE_DIR. Versions live in the database either way.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+CACHE_TIMEOUT = int(os.getenv("CACHE_TIMEOUT", 60 * 60))  # seconds
+# How often a process re-reads the cache versions, i.e. how long it may serve data another process changed
+CACHE_VERSION_CHECK_SECONDS = float(os.getenv("CACHE_VERSION_CHECK_SECONDS", 1))
+if CACHE_BACKEND == "file":
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv("CACHE_DIR", str(BASE_DIR / "cache")),
+            'TIMEOUT': CACHE_TIMEOUT,
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'route-project',
+            'TIMEOUT': CACHE_TIMEOUT,
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -123,6 +164,38 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# On-disk all-pairs road distance store used by the VRP solver
+DISTANCE_STORE_DIR = Path(os.getenv("DISTANCE_STORE_DIR", BASE_DIR / "distance_store"))
+# Where road distances come from ("mapbox" or the offline "haversine"), and what to use when that fails
+DISTANCE_PROVIDER = os.getenv("DISTANCE_PROVIDER", "mapbox")
+DISTANCE_FALLBACK_PROVIDER = os.getenv("DISTANCE_FALLBACK_PROVIDER", "haversine")
+# Where route road geometry comes from: "mapbox" (Directions API) or "straight" lines between stops
+ROUTE_GEOMETRY_SOURCE = os.getenv("ROUTE_GEOMETRY_SOURCE", "mapbox")
+# Threads that run route generation in the background (0 runs it inside the request)
+ROUTE_JOB_WORKERS = int(os.getenv("ROUTE_JOB_WORKERS", 2))
+# Seconds past its solver time limit after which a queued or running job is presumed dead (e.g. its process exited)
+ROUTE_JOB_STALE_AFTER = int(os.getenv("ROUTE_JOB_STALE_AFTER", 900))
+# Overrides for the solver's StoppingPolicy parameters (see management/stopping.py)
+VRP_STOPPING_POLICY = {}
+# Days with at least this many stops are solved polygon by polygon (0 never decomposes)
+VRP_DECOMPOSE_MIN_CLIENTS = int(os.getenv("VRP_DECOMPOSE_MIN_CLIENTS", 300))
+# Processes that solve the polygons of a decomposed day in parallel
+VRP_DECOMPOSE_WORKERS = int(os.getenv("VRP_DECOMPOSE_WORKERS", os.cpu_count() or 1))
+# Road circuity factors for the haversine provider, written by `manage.py calibrate_road_factor`
+ROAD_FACTORS_FILE = Path(os.getenv("ROAD_FACTORS_FILE", BASE_DIR / "road_factors.json"))
+# Bundled localities list consulted before the geocoding API (empty to always use the API)
+GAZETTEER_FILE = os.getenv("GAZETTEER_FILE", str(BASE_DIR / "management" / "data" / "gazetteer.csv"))
+# Geocoding: cache lifetime of found / not-found answers, and how hard to hit the API
+GEOCODE_CACHE_TTL_DAYS = int(os.getenv("GEOCODE_CACHE_TTL_DAYS", 180))
+GEOCODE_NEGATIVE_TTL_DAYS = int(os.getenv("GEOCODE_NEGATIVE_TTL_DAYS", 7))
+GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", 8))
+GEOCODE_RATE_LIMIT = float(os.getenv("GEOCODE_RATE_LIMIT", 10))  # requests per second, 0 = unlimited
+# How often (seconds) a worker checks whether another process changed the cities it keeps in memory
+CITY_REGISTRY_CHECK_SECONDS = float(os.getenv("CITY_REGISTRY_CHECK_SECONDS", 1))
+# Bearer token the warehouse system sends to the distribution import API (empty = API disabled)
+DISTRIBUTION_API_TOKEN = os.getenv("DISTRIBUTION_API_TOKEN", "")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -26,6 +26,46 @@ document.addEventListener("DOMContentLoaded", () => {
         });
     }
 
+    // Decodes an encoded polyline (precision 5) into [lon, lat] pairs
+    function decodePolyline(encoded) {
+        const coords = [];
+        let index = 0, lat = 0, lon = 0;
+        while (index < encoded.length) {
+            for (const axis of [0, 1]) {
+                let result = 0, shift = 0, byte;
+                do {
+                    byte = encoded.charCodeAt(index++) - 63;
+                    result |= (byte & 0x1f) << shift;
+                    shift += 5;
+                } while (byte >= 0x20);
+                const delta = (result & 1) ? ~(result >> 1) : (result >> 1);
+                if (axis === 0) lat += delta; else lon += delta;
+            }
+            coords.push([lon / 1e5, lat / 1e5]);
+        }
+        return coords;
+    }
+
+    // Picks the stored geometry variant that fits the zoom level
+    function routeGeometry(route, zoom) {
+        const levels = route.geometry_levels || {};
+        let encoded = route.geometry;
+        if (zoom < 9 && levels.low) encoded = levels.low;
+        else if (zoom < 12 && levels.medium) encoded = levels.medium;
+        else if (zoom < 14 && levels.high) encoded = levels.high;
+
+        const coordinates = encoded ? decodePolyline(encoded) : route.points.map(p => [p.lon, p.lat]);
+        return { type: "LineString", coordinates };
+    }
+
+    let renderedRoutes = [];
+    map.on("zoomend", () => {
+        renderedRoutes.forEach(({ id, route }) => {
+            const source = map.getSource(id);
+            if (source) source.setData({ type: "Feature", geometry: routeGeometry(route, map.getZoom()) });
+        });
+    });
+
     function loadRoutesForDate(date) {
         fetch(`/route_data/?date=${date}`)
             .then(response => response.json())
@@ -37,6 +77,7 @@ document.addEventListener("DOMContentLoaded", () => {
                 routeList.innerHTML = "";
                 clearMarkers();
                 clearRoutes();
+                renderedRoutes = [];
 
                 if (!routes || routes.length === 0) {
                     noRoutesMsg.style.display = "block";
@@ -55,36 +96,29 @@ document.addEventListener("DOMContentLoaded", () => {
                     routeList.appendChild(li);
 
                     const routeId = `route-${route.driver.replace(/\s+/g, '-').toLowerCase()}`;
-                    const directionsUrl = `https://api.mapbox.com/directions/v5/mapbox/driving/${coords.map(c => c.join(',')).join(';')}?geometries=geojson&access_token=${window.mapbox_token}`;
-
-                    fetch(directionsUrl)
-                        .then(res => res.json())
-                        .then(data => {
-                            const geometry = data.routes[0].geometry;
-
-                            map.addSource(routeId, {
-                                type: "geojson",
-                                data: {
-                                    type: "Feature",
-                                    geometry: geometry
-                                }
-                            });
-
-                            map.addLayer({
-                                id: routeId,
-                                type: "line",
-                                source: routeId,
-                                layout: {
-                                    "line-join": "round",
-                                    "line-cap": "round"
-                                },
-                                paint: {
-                                    "line-color": color,
-                                    "line-width": 4
-                                }
-                            });
-                        })
-                        .catch(err => console.error("❌ Directions API error:", err));
+                    renderedRoutes.push({ id: routeId, route });
+
+                    map.addSource(routeId, {
+                        type: "geojson",
+                        data: {
+                            type: "Feature",
+                            geometry: routeGeometry(route, map.getZoom())
+                        }
+                    });
+
+                    map.addLayer({
+                        id: routeId,
+                        type: "line",
+                        source: routeId,
+                        layout: {
+                            "line-join": "round",
+                            "line-cap": "round"
+                        },
+                        paint: {
+                            "line-color": color,
+                            "line-width": 4
+                        }
+                    });
 
                     const depotMarker = new mapboxgl.Marker({ color: "green" })
                         .setLngLat([depot.lon, depot.lat])
@@ -118,35 +152,88 @@ document.addEventListener("DOMContentLoaded", () => {
         loadRoutesForDate(date);
     });
 
-    // Show loader on form submit
-    const form = document.getElementById("route-form");
-    form.addEventListener("submit", (e) => {
-        console.log("🟢 Submit pressed – loading overlay starting");
+    const overlay = document.getElementById("loading-overlay");
 
-        const overlay = document.getElementById("loading-overlay");
+    function showOverlay() {
+        if (!overlay) return;
+        overlay.style.display = "flex";
+        overlay.style.opacity = "1";
 
-        if (overlay) {
-            overlay.style.display = "flex";
-            overlay.style.opacity = "1";
+        const video = overlay.querySelector("video");
+        if (video) {
+            video.currentTime = 0;
+            video.play().catch(err => {
+                console.warn("🔇 Video autoplay failed:", err);
+            });
+        }
+    }
 
-            const video = overlay.querySelector("video");
-            if (video) {
-                video.currentTime = 0;
-                video.play().catch(err => {
-                    console.warn("🔇 Video autoplay failed:", err);
-                });
-            }
+    function hideOverlay() {
+        if (!overlay) return;
+        overlay.style.transition = "opacity 0.5s ease";
+        overlay.style.opacity = "0";
+        setTimeout(() => { overlay.style.display = "none"; }, 500);
+    }
 
-            // Hide after 30 seconds
-            setTimeout(() => {
-                overlay.style.transition = "opacity 0.5s ease";
-                overlay.style.opacity = "0";
+    function showError(message) {
+        const noRoutesMsg = document.getElementById("no-routes-msg");
+        noRoutesMsg.textContent = `❌ ${message}`;
+        noRoutesMsg.style.display = "block";
+    }
 
-                setTimeout(() => {
-                    overlay.style.display = "flex";
-                    overlay.style.opacity = "1";
-                }, 500);
-            }, 30000);
-        }
+    // Poll the background route job until its RouteSolution rows are ready
+    function pollJob(statusUrl, date) {
+        showOverlay();
+        fetch(statusUrl)
+            .then(res => res.json())
+            .then(job => {
+                if (job.status === "done") {
+                    hideOverlay();
+                    history.replaceState(null, "", `?selected_date=${job.date}`);
+                    if (dropdown) dropdown.value = job.date;
+                    loadRoutesForDate(job.date);
+                } else if (job.status === "failed") {
+                    hideOverlay();
+                    showError("לא ניתן היה ליצור מסלולים. נסה שוב.");
+                } else {
+                    setTimeout(() => pollJob(statusUrl, date), 2000);
+                }
+            })
+            .catch(err => {
+                console.error("❌ Job status error:", err);
+                setTimeout(() => pollJob(statusUrl, date), 5000);
+            });
+    }
+
+    const jobFromURL = urlParams.get("job_id");
+    if (jobFromURL) {
+        pollJob(`/route_jobs/${jobFromURL}/`, selectedFromURL);
+    }
+
+    // Start a background route job on form submit
+    const form = document.getElementById("route-form");
+    form.addEventListener("submit", (e) => {
+        e.preventDefault();
+        console.log("🟢 Submit pressed – starting route job");
+        showOverlay();
+
+        fetch(form.action, {
+            method: "POST",
+            body: new FormData(form),
+            headers: { "Accept": "application/json" },
+        })
+            .then(res => res.json())
+            .then(data => {
+                if (data.status_url) {
+                    pollJob(data.status_url, dropdown.value);
+                } else {
+                    hideOverlay();
+                    showError(data.error || "לא ניתן היה ליצור מסלולים. נסה שוב.");
+                }
+            })
+            .catch(err => {
+                console.error("❌ Route job error:", err);
+                hideOverlay();
+            });
     });
 });